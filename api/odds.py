@@ -7,66 +7,131 @@ Vercel Serverless Function: オッズ情報取得API
 制限事項:
     - Vercel Serverless Functionsの実行時間制限に注意（無料プラン: 10秒、Pro: 60秒）
     - Playwrightの実行には時間がかかるため、タイムアウトに注意
+    - イベントループとBrowserPoolはモジュールに保持し、同じインスタンスへの続くリクエスト
+      （ウォームスタート）では起動済みのChromiumを使い回す。常駐サーバーとして動かす場合や
+      負荷試験には同じAPIを提供するodds_server.py（ASGI）を使用する
 """
 
 import json
 import asyncio
 import sys
+import threading
 from pathlib import Path
+from typing import Optional
 
 # 親ディレクトリをパスに追加（extract_odds.pyをインポートするため）
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from extract_odds import RealtimeOdds
+from browser_pool import BrowserPool
+from extract_odds import RealtimeOdds, skip_bet_types_for
+from fetchers import HttpFetcher
+from odds_cache import default_odds_cache
+from odds_poller import snapshot_odds
+from odds_query import DEFAULT_ODDS_NAMES, pages_for, parse_odds_request, select_odds
 
 
-async def fetch_odds(race_id: str) -> dict:
+# オッズ表示に使用する馬券種（キャッシュのキーにも使用する）
+ODDS_BET_TYPES = ["tanpuku", "umaren"]
+
+# BrowserPoolは作成したイベントループに紐づくため、リクエストごとのasyncio.runではなく
+# モジュールに保持したイベントループ（別スレッド）で取得する
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_browser_pool: Optional[BrowserPool] = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> tuple[asyncio.AbstractEventLoop, BrowserPool]:
     """
-    指定されたrace_idのオッズ情報を取得する。
-    
+    取得に使うイベントループとBrowserPoolを返す（プロセスで最初の呼び出しのみ作成する）。
+    """
+    global _loop, _browser_pool
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="odds-api-loop", daemon=True).start()
+            # ブラウザは最初にHTTPでの取得に失敗したときに起動する
+            _browser_pool = BrowserPool(max_size=1, profile="lean")
+        return _loop, _browser_pool
+
+
+async def scrape_odds(
+    race_id: str,
+    bet_types: list[str] = ODDS_BET_TYPES,
+    browser_pool: Optional[BrowserPool] = None,
+) -> dict:
+    """
+    JRA公式サイトから指定されたrace_idのオッズ情報を取得する（キャッシュを使わない）。
+
     Parameters
     ----------
     race_id : str
         JRA形式のrace_id
-    
+    bet_types : list[str], optional
+        取得するオッズページの馬券種。デフォルトはODDS_BET_TYPES
+    browser_pool : BrowserPool, optional
+        HTTPでの取得に失敗した場合に使うブラウザプール。
+        指定しない場合は取得のたびにChromiumを起動する
+
     Returns
     -------
     dict
-        オッズ情報を含む辞書。キーは 'tansho', 'fukusho', 'umaren', 'error'
+        オッズ情報を含む辞書。キーは 'tansho', 'fukusho', 'umaren' など（取得した馬券種による）
     """
-    try:
-        # RealtimeOddsインスタンスを作成
-        odds_extractor = RealtimeOdds(race_id)
+    # RealtimeOddsインスタンスを作成（HTTPでの取得を先に試し、失敗時はブラウザで取得）
+    async with HttpFetcher() as fetcher:
+        odds_extractor = RealtimeOdds(
+            race_id, browser_pool=browser_pool, fetcher=fetcher, profile="lean", extraction="dom"
+        )
         
-        # HTMLを取得（単勝・複勝、馬連を含む）
+        # HTMLを取得（必要な馬券種のページだけを開く）
         await odds_extractor.scrape_html(
-            skip_bet_types=["wakuren", "wide", "umatan", "sanrenpuku", "sanrentan"],
+            skip_bet_types=skip_bet_types_for(bet_types),
             headless=True,
-            delay_time=500,  # Vercelのタイムアウトを考慮して短縮
         )
-        
-        # 単勝オッズを抽出
-        odds_extractor.extract_tansho()
-        
-        # 複勝オッズを抽出
-        odds_extractor.extract_fukusho()
-        
-        # 馬連オッズを抽出
-        odds_extractor.extract_umaren()
-        
-        return {
-            "tansho": getattr(odds_extractor, "tansho", {}),
-            "fukusho": getattr(odds_extractor, "fukusho", {}),
-            "umaren": getattr(odds_extractor, "umaren", {}),
-            "error": None,
-        }
+    
+    # 取得したページのオッズを抽出
+    odds_extractor.extract_all()
+    
+    return snapshot_odds(odds_extractor)
+
+
+async def fetch_odds(
+    race_id: str,
+    names: list[str] = DEFAULT_ODDS_NAMES,
+    horses: Optional[frozenset[int]] = None,
+    browser_pool: Optional[BrowserPool] = None,
+) -> dict:
+    """
+    指定されたrace_idのオッズ情報を取得する。
+
+    TTL内に同じレースを取得済みの場合はキャッシュを返し、
+    同じレースへの同時リクエストは1回の取得にまとめる。
+
+    Parameters
+    ----------
+    race_id : str
+        JRA形式のrace_id
+    names : list[str], optional
+        返すオッズ（'tansho', 'umaren'などの属性名）。デフォルトは単勝・複勝・馬連
+    horses : frozenset[int], optional
+        指定した場合、これらの馬番のいずれかを含む組み合わせだけを返す
+    browser_pool : BrowserPool, optional
+        HTTPでの取得に失敗した場合に使うブラウザプール
+
+    Returns
+    -------
+    dict
+        オッズ情報を含む辞書。キーはnamesの各属性名と 'error'
+    """
+    bet_types = pages_for(names)
+    try:
+        odds = await default_odds_cache.get_or_fetch(
+            race_id, bet_types, lambda: scrape_odds(race_id, bet_types, browser_pool)
+        )
+        # OddsTableはJSONに変換できないため辞書にする
+        return {**select_odds(odds, names, horses), "error": None}
     except Exception as e:
-        return {
-            "tansho": {},
-            "fukusho": {},
-            "umaren": {},
-            "error": str(e),
-        }
+        return {**{name: {} for name in names}, "error": str(e)}
 
 
 def handler(request):
@@ -128,8 +193,26 @@ def handler(request):
                 }),
             }
         
-        # オッズを取得（非同期処理を実行）
-        odds_data = asyncio.run(fetch_odds(race_id))
+        # 返すオッズと馬番を取得（例: bet_types=tansho,umaren&horses=5）
+        try:
+            names, horses = parse_odds_request(
+                query_params.get("bet_types"), query_params.get("horses")
+            )
+        except ValueError as e:
+            return {
+                "statusCode": 400,
+                "headers": headers,
+                "body": json.dumps({
+                    "success": False,
+                    "error": str(e),
+                }),
+            }
+        
+        # オッズを取得（モジュールに保持したイベントループで実行し、Chromiumを使い回す）
+        loop, browser_pool = get_loop()
+        odds_data = asyncio.run_coroutine_threadsafe(
+            fetch_odds(race_id, names, horses, browser_pool), loop
+        ).result()
         
         if odds_data.get("error"):
             return {
@@ -147,11 +230,7 @@ def handler(request):
             "headers": headers,
             "body": json.dumps({
                 "success": True,
-                "data": {
-                    "tansho": odds_data["tansho"],
-                    "fukusho": odds_data["fukusho"],
-                    "umaren": odds_data["umaren"],
-                },
+                "data": {name: odds_data[name] for name in names},
             }),
         }
     
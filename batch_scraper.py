@@ -0,0 +1,276 @@
+"""
+複数レースの一括オッズ取得
+
+概要:
+    開催日全体（最大3場×12レース）のように複数のレースのオッズをまとめて取得する。
+    race_idを開催（回・場・日）ごとにまとめ、開催ごとに1度だけトップページから
+    レース一覧までリンクをたどり、そのブラウザコンテキスト内で各レースを別タブで開く。
+    ブラウザはBrowserPoolから借りるため、レースごとの起動待ちも発生しない。
+
+主な機能:
+    - 同時に取得するレース数の上限（max_concurrency）
+    - 取得が終わったレースから順に結果を返す（async for）
+    - レースごとにエラーを分けて返し、1レースの失敗で全体を止めない
+
+使用例:
+    scraper = BatchScraper(skip_bet_types=["wakuren", "wide", "sanrentan"])
+    # 発売中の開催のレース（日付を指定する場合は race_ids_for_kaisai(2025, 5, 1, 4) など）
+    race_ids = await discover_race_ids(2025)
+    async for result in scraper.run(race_ids):
+        if result["error"] is None:
+            print(result["race_id"], result["odds"].tansho)
+"""
+
+import asyncio
+import re
+from typing import AsyncIterator, Iterable, Optional
+
+from bs4 import BeautifulSoup
+from playwright.async_api import Page
+
+from browser_pool import BrowserPool
+from extract_pool import ExtractPool
+from extract_odds import PLACE_MAPPING, RealtimeOdds, race_link_name
+from fetchers import HttpFetcher
+from odds_resolver import OddsPageResolver, default_resolver, parse_link_target
+
+KAISAI_NAME_PATTERN = re.compile(r"(\d+)回\s*([^\d\s]+)\s*(\d+)日")
+
+
+def race_ids_for_kaisai(
+    year: int, place_code: int, kai: int, day: int, races: int = 12
+) -> list[str]:
+    """
+    開催（年・場・回・日）の全レースのrace_idを作成する。
+
+    Parameters
+    --------
+    year : int
+        開催年
+    place_code : int
+        競馬場コード（PLACE_MAPPINGのキー）
+    kai : int
+        回
+    day : int
+        日目
+    races : int, optional
+        レース数。デフォルトは12
+    """
+    return [
+        f"{year:04d}{place_code:02d}{kai:02d}{day:02d}{race:02d}"
+        for race in range(1, races + 1)
+    ]
+
+
+def race_ids_from_kaisai_names(year: int, names: Iterable[str], races: int = 12) -> list[str]:
+    """
+    「1回東京4日」のような開催名から、その開催の全レースのrace_idを作成する。
+    オッズページに並ぶ開催名から、その日に行われる全レースを得る場合に使用する。
+    """
+    place_codes = {place: code for code, place in PLACE_MAPPING.items()}
+    race_ids = []
+    for name in names:
+        match = KAISAI_NAME_PATTERN.search(name)
+        if not match or match.group(2) not in place_codes:
+            continue
+        race_ids.extend(
+            race_ids_for_kaisai(
+                year,
+                place_codes[match.group(2)],
+                int(match.group(1)),
+                int(match.group(3)),
+                races,
+            )
+        )
+    return race_ids
+
+
+async def discover_race_ids(year: int, fetcher: Optional[HttpFetcher] = None) -> list[str]:
+    """
+    JRA公式サイトのオッズページに並んでいる開催（その日の開催）の全レースのrace_idを返す。
+
+    オッズページには現在発売中の開催しか並ばないため、日付を指定して過去・将来の開催を
+    調べることはできない。その場合はrace_ids_for_kaisaiで開催（場・回・日）から作成する。
+
+    Parameters
+    --------
+    year : int
+        開催年（race_idの先頭4桁）
+    fetcher : HttpFetcher, optional
+        使用するHttpFetcher。指定しない場合は作成して使用後に閉じる。
+    """
+    owns_fetcher = fetcher is None
+    fetcher = fetcher or HttpFetcher()
+    try:
+        html = await fetcher.fetch_kaisai_list()
+    finally:
+        if owns_fetcher:
+            await fetcher.close()
+    names = KAISAI_NAME_PATTERN.findall(BeautifulSoup(html, "lxml").get_text(" "))
+    return race_ids_from_kaisai_names(
+        year, dict.fromkeys(f"{kai}回{place}{day}日" for kai, place, day in names)
+    )
+
+
+class BatchScraper:
+    """
+    複数レースのオッズを開催ごとにまとめて取得するクラス。
+    """
+
+    def __init__(
+        self,
+        browser_pool: Optional[BrowserPool] = None,
+        resolver: Optional[OddsPageResolver] = None,
+        skip_bet_types: list[str] = ["wakuren", "wide"],
+        max_concurrency: int = 4,
+        delay_time: Optional[int] = None,
+        extract: bool = True,
+        extract_pool: Optional[ExtractPool] = None,
+    ):
+        """
+        Parameters
+        --------
+        browser_pool : BrowserPool, optional
+            使用するブラウザプール。指定しない場合はrunの間だけ作成する。
+        resolver : OddsPageResolver, optional
+            オッズページの遷移先キャッシュ。指定しない場合はプロセス内で共有されるものを使用する。
+        skip_bet_types : list[str], optional
+            スキップする馬券種のリスト。デフォルトは["wakuren", "wide"]
+        max_concurrency : int, optional
+            同時に取得するレース数の上限。デフォルトは4
+        delay_time : int, optional
+            リンクのクリックごとに加える遅延（ミリ秒）。
+            デフォルトはNone（遷移の完了を待ち、間隔はAdaptivePacerが決める）
+        extract : bool, optional
+            Trueの場合、取得したHTMLからオッズを抽出してから返す。デフォルトはTrue
+        extract_pool : ExtractPool, optional
+            指定した場合、オッズの抽出を別プロセスで行い、抽出中も他のレースの取得を進める。
+        """
+        self.browser_pool = browser_pool
+        self.resolver = resolver if resolver is not None else default_resolver
+        self.skip_bet_types = skip_bet_types
+        self.max_concurrency = max_concurrency
+        self.delay_time = delay_time
+        self.extract = extract
+        self.extract_pool = extract_pool
+
+    async def run(self, race_ids: Iterable[str]) -> AsyncIterator[dict]:
+        """
+        race_idのリストのオッズを取得し、取得が終わったレースから順に結果を返す。
+
+        Yields
+        --------
+        dict
+            {"race_id": race_id, "odds": RealtimeOdds または None, "error": エラーメッセージ または None}
+        """
+        groups: dict[str, list[str]] = {}
+        for race_id in dict.fromkeys(race_ids):
+            groups.setdefault(race_id[:10], []).append(race_id)
+        if not groups:
+            return
+
+        pool = self.browser_pool
+        owns_pool = pool is None
+        if owns_pool:
+            pool = BrowserPool(max_size=min(len(groups), self.max_concurrency), profile="lean")
+            await pool.start()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        tasks = [
+            asyncio.create_task(self._run_kaisai(pool, group, semaphore, results))
+            for group in groups.values()
+        ]
+        try:
+            for _ in range(sum(len(group) for group in groups.values())):
+                yield await results.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if owns_pool:
+                await pool.close()
+
+    async def _run_kaisai(
+        self,
+        pool: BrowserPool,
+        race_ids: list[str],
+        semaphore: asyncio.Semaphore,
+        results: asyncio.Queue,
+    ) -> None:
+        """
+        1開催分のレースを取得する。レース一覧ページまでの遷移は1度だけ行う。
+        """
+        scraping = False
+        try:
+            async with pool.page() as page:
+                if all(self.resolver.get_targets(race_id) for race_id in race_ids):
+                    # 全レースの遷移先がキャッシュ済みであればレース一覧を開く必要はない
+                    race_targets = {}
+                else:
+                    race_targets = await self._open_race_list(page, race_ids[0])
+
+                async def scrape_in_tab(race_id: str) -> None:
+                    # タブの作成・終了の失敗も含め、エラーはそのレースの結果として1回だけ返す
+                    async with semaphore:
+                        try:
+                            tab = await page.context.new_page()
+                            try:
+                                result = await self._scrape_race(tab, race_id, race_targets)
+                            finally:
+                                await tab.close()
+                        except Exception as e:
+                            result = {"race_id": race_id, "odds": None, "error": str(e)}
+                    await results.put(result)
+
+                scraping = True
+                await asyncio.gather(*(scrape_in_tab(race_id) for race_id in race_ids))
+        except Exception as e:
+            if scraping:
+                # 各レースの結果は返し終えているため、ページを返せなかったことだけを知らせる
+                print(f"警告: BatchScraper - ページの返却に失敗しました: {e}")
+                return
+            # ページを借りられなかった・開催のページを開けなかった場合は、全レースをエラーとして返す
+            for race_id in race_ids:
+                await results.put({"race_id": race_id, "odds": None, "error": str(e)})
+
+    async def _open_race_list(self, page: Page, race_id: str) -> dict[str, dict]:
+        """
+        開催のレース一覧ページを開き、{レースのリンク名: 遷移先}を返す。
+        オッズページに開催のリンクがない場合は空の辞書を返す（各レースで従来の遷移を行う）。
+        """
+        odds = RealtimeOdds(race_id, resolver=self.resolver)
+        if not await odds.open_kaisai_page(page, self.delay_time):
+            return {}
+        links = await page.eval_on_selector_all(
+            "a",
+            "els => els.map(a => [a.innerText.trim(), a.getAttribute('onclick'), a.getAttribute('href')])",
+        )
+        race_targets = {}
+        for name, onclick, href in links:
+            target = parse_link_target(onclick, href)
+            if target is not None and name not in race_targets:
+                race_targets[name] = target
+        return race_targets
+
+    async def _scrape_race(
+        self, page: Page, race_id: str, race_targets: dict[str, dict]
+    ) -> dict:
+        """
+        1レースのオッズページを取得する。エラーは例外にせず結果に含めて返す。
+        """
+        odds = RealtimeOdds(race_id, resolver=self.resolver)
+        try:
+            await odds.scrape_page(
+                page,
+                self.skip_bet_types,
+                self.delay_time,
+                race_target=race_targets.get(race_link_name(race_id)),
+            )
+            if self.extract and self.extract_pool is not None:
+                await odds.extract_all_async(self.extract_pool)
+            elif self.extract:
+                odds.extract_all()
+        except Exception as e:
+            print(f"警告: BatchScraper - {race_id}の取得に失敗しました: {e}")
+            return {"race_id": race_id, "odds": None, "error": str(e)}
+        return {"race_id": race_id, "odds": odds, "error": None}
@@ -0,0 +1,389 @@
+"""
+ベンチマーク用のオッズページとJRA公式サイトの代わりのローカルサーバー
+
+概要:
+    JRA公式サイトと同じ構造（doActionのフォームPOSTでたどるリンク、ul.nav.pillsの馬券種タブ、
+    馬券種ごとのオッズ表）のページを作成し、ローカルのHTTPサーバーで配信する。
+    HttpFetcherはbase_urlを、Playwrightはcontext.routeでjra.go.jpへのリクエストを
+    このサーバーに向けることで、ネットワークに接続せずに取得の経路全体を計測できる。
+
+    オッズページは乱数（シード固定）で作成するか、HtmlArchiveに保存した実際のページを使う。
+    作成するページは実際のページと同じくCSS・フォント・画像・JavaScript・アクセス解析の
+    スクリプトを参照し、サーバーは中身を埋めたダミーのファイルを返す（ASSETS）。
+    JRA以外のドメインへのリクエストは /__external/<ホスト名>/<パス> で受け付ける。
+
+制限事項:
+    - 作成するページはodds_parserが参照する要素を再現したもので、実際のページの装飾は含まない
+    - 参照するファイルの大きさは実際のサイトのおおよその値で、中身は意味を持たない
+    - 枠連・ワイドのページは取得の計測用で、抽出の対象ではない
+"""
+
+import multiprocessing
+import random
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from bs4 import BeautifulSoup
+
+from extract_odds import ALL_BET_TYPES, BET_TYPE_MAPPING, kaisai_link_name, race_link_name
+from html_archive import HtmlArchive
+from odds_parser import iter_odds, parse_tanpuku
+from odds_resolver import parse_link_target
+from odds_table import BET_TYPE_SHAPES
+
+# 合成したページで使うrace_id（2025年 1回東京4日 11レース）
+DEFAULT_RACE_ID = "202505010411"
+ACTION_PATH = "/JRADB/accessO.html"
+
+# 馬券種ごとのタブの表示名（サイト上の表記）
+_TAB_NAMES = {bet_type: name for name, bet_type in reversed(BET_TYPE_MAPPING.items())}
+# JRA公式サイトのdoActionと同じくcnameをフォームPOSTで送る
+_DO_ACTION_JS = """
+<script>
+function doAction(action, cname) {
+    var form = document.createElement("form");
+    form.method = "POST";
+    form.action = action;
+    var input = document.createElement("input");
+    input.type = "hidden";
+    input.name = "cname";
+    input.value = cname;
+    form.appendChild(input);
+    document.body.appendChild(form);
+    form.submit();
+    return false;
+}
+</script>
+"""
+
+# ページが参照するファイル: {パス: (Content-Type, バイト数)}
+ASSETS = {
+    "/common/css/style.css": ("text/css", 96 * 1024),
+    "/common/css/keiba.css": ("text/css", 48 * 1024),
+    "/common/font/NotoSansJP.woff2": ("font/woff2", 180 * 1024),
+    "/common/js/common.js": ("text/javascript", 120 * 1024),
+    "/common/img/logo.png": ("image/png", 12 * 1024),
+    "/common/img/banner_1.jpg": ("image/jpeg", 64 * 1024),
+    "/common/img/banner_2.jpg": ("image/jpeg", 64 * 1024),
+    "/__external/www.googletagmanager.com/gtag/js": ("text/javascript", 140 * 1024),
+    "/__external/www.google-analytics.com/analytics.js": ("text/javascript", 50 * 1024),
+}
+_ASSET_TAGS = (
+    '<link rel="stylesheet" href="/common/css/style.css">'
+    '<link rel="stylesheet" href="/common/css/keiba.css">'
+    '<script src="/common/js/common.js"></script>'
+    '<script async src="https://www.googletagmanager.com/gtag/js?id=G-BENCH"></script>'
+    '<script async src="https://www.google-analytics.com/analytics.js"></script>'
+)
+_BANNER_TAGS = (
+    '<header><img src="/common/img/logo.png" alt="JRA"></header>'
+    '<aside><img src="/common/img/banner_1.jpg" alt=""><img src="/common/img/banner_2.jpg" alt=""></aside>'
+)
+_FONT_FACE = (
+    '@font-face{font-family:"Noto Sans JP";src:url("/common/font/NotoSansJP.woff2") format("woff2")}'
+    'body{font-family:"Noto Sans JP",sans-serif}'
+)
+
+
+def _asset_body(content_type: str, size: int) -> bytes:
+    """
+    指定した大きさのダミーのファイルを作成する（CSS・JavaScriptは構文として正しい内容にする）。
+    """
+    if content_type == "text/css":
+        head = _FONT_FACE.encode("ascii")
+    elif content_type == "text/javascript":
+        head = b"window.__benchAssets=(window.__benchAssets||0)+1;"
+    else:
+        return random.Random(size).randbytes(size)
+    padding = size - len(head) - 4
+    return head + b"/*" + b"x" * max(padding, 0) + b"*/"
+
+
+def _link(text: str, cname: str) -> str:
+    return f"""<a href="#" onclick="return doAction('{ACTION_PATH}', '{cname}');">{text}</a>"""
+
+
+def _document(title: str, body: str) -> str:
+    return (
+        '<!DOCTYPE html><html lang="ja"><head><meta charset="Shift_JIS">'
+        f"<title>{title}｜JRA</title>{_ASSET_TAGS}{_DO_ACTION_JS}</head>"
+        f"<body>{_BANNER_TAGS}{body}</body></html>"
+    )
+
+
+def _bet_cname(race_id: str, bet_type: str) -> str:
+    return f"pw15{race_id}{bet_type}"
+
+
+def _odds_page(race_id: str, bet_type: str, content: str) -> str:
+    tabs = "".join(
+        f"<li>{_link(_TAB_NAMES[name], _bet_cname(race_id, name))}</li>"
+        for name in ALL_BET_TYPES
+    )
+    return _document(
+        f"オッズ {race_link_name(race_id)}",
+        f'<div id="contents"><ul class="nav pills">{tabs}</ul>'
+        f'<div class="odds_{bet_type}">{content}</div></div>',
+    )
+
+
+def _tanpuku(rng: random.Random, horses: int) -> str:
+    rows = "".join(
+        f'<tr><td class="waku">{(horse + 1) // 2}</td><td class="num">{horse}</td>'
+        f'<td class="horse"><a href="#">ウマ{horse}</a></td>'
+        f'<td class="odds_tan">{rng.uniform(1.1, 300):.1f}</td>'
+        f'<td class="odds_fuku"><span class="min">{rng.uniform(1.0, 30):.1f}</span>'
+        f'-<span class="max">{rng.uniform(30, 60):.1f}</span></td></tr>'
+        for horse in range(1, horses + 1)
+    )
+    return (
+        '<table class="basic narrow-xy tanpuku"><thead><tr><th>枠</th><th>馬番</th>'
+        f"<th>馬名</th><th>単勝</th><th>複勝</th></tr></thead><tbody>{rows}</tbody></table>"
+    )
+
+
+def _pair_list(rng: random.Random, horses: int, list_class: str, ordered: bool) -> str:
+    items = ""
+    for first in range(1, horses + 1):
+        rows = "".join(
+            f"<tr><th>{second}</th><td>{rng.uniform(2, 3000):,.1f}</td></tr>"
+            for second in range(1, horses + 1)
+            if (second != first if ordered else second > first)
+        )
+        items += f"<li><table><caption>{first}</caption><tbody>{rows}</tbody></table></li>"
+    return f'<ul class="{list_class}">{items}</ul>'
+
+
+def _wide(rng: random.Random, horses: int) -> str:
+    items = ""
+    for first in range(1, horses + 1):
+        rows = ""
+        for second in range(first + 1, horses + 1):
+            low = rng.uniform(1.1, 500)
+            rows += f"<tr><th>{second}</th><td>{low:,.1f}-{low * 1.5:,.1f}</td></tr>"
+        items += f"<li><table><caption>{first}</caption><tbody>{rows}</tbody></table></li>"
+    return f'<ul class="wide_list">{items}</ul>'
+
+
+def _sanrenpuku(rng: random.Random, horses: int) -> str:
+    units = ""
+    for first in range(1, horses + 1):
+        items = ""
+        for second in range(first + 1, horses + 1):
+            rows = "".join(
+                f"<tr><th>{third}</th><td>{rng.uniform(10, 9000):,.1f}</td></tr>"
+                for third in range(second + 1, horses + 1)
+            )
+            items += (
+                f"<li><table><caption>{first}-{second}</caption>"
+                f"<tbody>{rows}</tbody></table></li>"
+            )
+        units += (
+            f'<div class="fuku3_unit"><h4><span class="inner"><span class="num">{first}</span>'
+            f'</span></h4><ul class="fuku3_list">{items}</ul></div>'
+        )
+    return units
+
+
+def _sanrentan(rng: random.Random, horses: int) -> str:
+    units = ""
+    for first in range(1, horses + 1):
+        items = ""
+        for second in range(1, horses + 1):
+            if second == first:
+                continue
+            rows = "".join(
+                f"<tr><th>{third}</th><td>{rng.uniform(10, 90000):,.1f}</td></tr>"
+                for third in range(1, horses + 1)
+                if third not in (first, second)
+            )
+            items += (
+                f'<li><div class="p_line"><div class="num">{first}</div></div>'
+                f'<div class="p_line"><div class="num">{second}</div></div>'
+                f'<table class="tan3"><tbody>{rows}</tbody></table></li>'
+            )
+        units += (
+            f'<div class="tan3_unit"><h4><span class="num">{first}</span></h4>'
+            f'<ul class="tan3_list">{items}</ul></div>'
+        )
+    return units
+
+
+def synthetic_pages(
+    race_id: str = DEFAULT_RACE_ID, horses: int = 18, seed: int = 1
+) -> dict[str, str]:
+    """
+    全馬券種のオッズページを乱数で作成する（同じ引数なら同じ内容になる）。
+
+    Parameters
+    --------
+    race_id : str, optional
+        ページのタブ・リンクに使うrace_id
+    horses : int, optional
+        出走頭数。デフォルトは18（最大）
+    seed : int, optional
+        オッズの乱数のシード
+
+    Returns
+    --------
+    dict[str, str]
+        {馬券種: HTML}
+    """
+    rng = random.Random(seed)
+    contents = {
+        "tanpuku": _tanpuku(rng, horses),
+        "wakuren": _pair_list(rng, min(horses, 8), "wakuren_list", ordered=False),
+        "umaren": _pair_list(rng, horses, "umaren_list", ordered=False),
+        "wide": _wide(rng, horses),
+        "umatan": _pair_list(rng, horses, "umatan_list", ordered=True),
+        "sanrenpuku": _sanrenpuku(rng, horses),
+        "sanrentan": _sanrentan(rng, horses),
+    }
+    return {
+        bet_type: _odds_page(race_id, bet_type, content)
+        for bet_type, content in contents.items()
+    }
+
+
+def archived_pages(root: Path, race_id: str, at: Optional[float] = None) -> dict[str, str]:
+    """
+    HtmlArchiveに保存した実際のオッズページを読み込む。
+
+    Raises
+    --------
+    RuntimeError
+        単勝・複勝のページ（レースのオッズページとして最初に開くページ）が保存されていない場合
+    """
+    pages = HtmlArchive(root).load(race_id, at)
+    if "tanpuku" not in pages:
+        raise RuntimeError(f"{race_id}の単勝・複勝のページがアーカイブに保存されていません。")
+    return pages
+
+
+def packed_odds(pages: dict[str, str]) -> dict[str, dict]:
+    """
+    オッズページをodds_parserで解析し、odds_dom.EXTRACT_ODDS_JSの出力と同じ形式の配列にする
+    （Chromiumを使わずに配列からの変換を計測するため）。
+    """
+    packed = {}
+    if "tanpuku" in pages:
+        parsed = parse_tanpuku(pages["tanpuku"])
+        if parsed is not None:
+            tansho, fukusho = parsed
+            horses = sorted(tansho.keys() | fukusho.keys())
+            packed["tanpuku"] = {
+                "horses": horses,
+                "tan": [tansho.get(horse) for horse in horses],
+                "fuku": [fukusho.get(horse) for horse in horses],
+            }
+    for bet_type, (size, _) in BET_TYPE_SHAPES.items():
+        if bet_type not in pages:
+            continue
+        horses, odds = [], []
+        for combination, value in iter_odds(bet_type, pages[bet_type]):
+            horses.extend(combination)
+            odds.append(value)
+        packed[bet_type] = {"size": size, "horses": horses, "odds": odds}
+    return packed
+
+
+def site_routes(race_id: str, pages: dict[str, str]) -> tuple[str, dict[str, str]]:
+    """
+    トップページからレースのオッズページまでのページを作成し、
+    (トップページのHTML, {cname: HTML})を返す。
+
+    馬券種のページはタブのリンク（onclickのcname）を読み取って登録するため、
+    アーカイブした実際のページの遷移先もそのまま使える。
+    """
+    kaisai_name = kaisai_link_name(race_id)
+    top = _document("競馬メニュー", f"<nav>{_link('オッズ', 'pw15oliday')}</nav>")
+    routes = {
+        "pw15oliday": _document(
+            "オッズ", f"<ul><li>{_link(kaisai_name, 'pw15kaisai' + race_id[:10])}</li></ul>"
+        ),
+        "pw15kaisai" + race_id[:10]: _document(
+            kaisai_name,
+            "<ul>"
+            + "".join(
+                f"<li>{_link(f'{number}レース', 'pw15race' + race_id[:10] + f'{number:02d}')}</li>"
+                for number in range(1, 13)
+            )
+            + "</ul>",
+        ),
+        # レースのリンクは単勝・複勝のオッズページを開く
+        "pw15race" + race_id: pages["tanpuku"],
+    }
+    for html in pages.values():
+        for link in BeautifulSoup(html, "lxml").select("ul.nav.pills li a"):
+            bet_type = BET_TYPE_MAPPING.get(link.get_text(strip=True))
+            target = parse_link_target(link.get("onclick"), link.get("href"))
+            if bet_type in pages and target is not None and target["cname"] is not None:
+                routes[target["cname"]] = pages[bet_type]
+    return top, routes
+
+
+def _handler_class(top: bytes, routes: dict[str, bytes]) -> type:
+    class StubJraHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:
+            path = urlsplit(self.path).path
+            if path in ASSETS:
+                content_type, size = ASSETS[path]
+                self._send(_asset_body(content_type, size), content_type)
+                return
+            self._send(top if path.startswith("/keiba/") else None)
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            form = parse_qs(self.rfile.read(length).decode("ascii", errors="replace"))
+            cname = form.get("cname", [""])[0]
+            self._send(routes.get(cname) if self.path == ACTION_PATH else None)
+
+        def _send(self, body: Optional[bytes], content_type: str = "text/html") -> None:
+            if body is None:
+                self.send_error(404)
+                return
+            # JRA公式サイトと同じく文字コードはmetaタグのみで示す
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return StubJraHandler
+
+
+def _serve(top: str, routes: dict[str, str], ready: "multiprocessing.Queue") -> None:
+    encoded = {cname: html.encode("cp932", errors="replace") for cname, html in routes.items()}
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), _handler_class(top.encode("cp932"), encoded)
+    )
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+@contextmanager
+def stub_jra_site(race_id: str, pages: dict[str, str]) -> Iterator[str]:
+    """
+    JRA公式サイトの代わりのサーバーを別プロセスで起動し、そのbase_url（末尾は"/"）を返す。
+
+    サーバーを別プロセスにすることで、計測するプロセスのCPU時間に配信の処理を含めない。
+    """
+    top, routes = site_routes(race_id, pages)
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    process = context.Process(target=_serve, args=(top, routes, ready), daemon=True)
+    process.start()
+    try:
+        port = ready.get(timeout=30)
+        yield f"http://127.0.0.1:{port}/"
+    finally:
+        process.terminate()
+        process.join()
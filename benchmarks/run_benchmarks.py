@@ -0,0 +1,523 @@
+"""
+オッズ取得パイプライン（取得 → 抽出 → 表示用の変換）のベンチマーク
+
+概要:
+    ネットワークに接続せず、全馬券種のオッズページ（合成したページ、またはHtmlArchiveに
+    保存した実際のページ）をローカルのJRA公式サイトの代わりのサーバー（fixtures.py）から配信し、
+    段階ごとに壁時計時間・CPU時間・ピークRSS・メモリ割り当てを計測する。
+    結果はJSONファイルに保存し、--compareで以前の結果と比べて遅くなった段階を表示する。
+
+使用例:
+    python benchmarks/run_benchmarks.py --output results/before.json
+    python benchmarks/run_benchmarks.py --output results/after.json --compare results/before.json
+    python benchmarks/run_benchmarks.py --browser --stages "scrape_*"
+    python benchmarks/run_benchmarks.py --archive data/html --race-id 202505010411
+
+計測する段階:
+    scrape_http / scrape_http_cached
+        HttpFetcherでの取得（トップページからリンクをたどる場合 / 遷移先がキャッシュ済みの場合）
+    scrape_browser / scrape_browser_cached
+        BrowserPoolのChromiumでの取得（--browserを指定し、Chromiumがある場合のみ）
+    scrape_browser_lean / scrape_browser_lean_cached
+        profile="lean"のBrowserPoolでの取得。ブラウザの段階には転送量（transfer）を記録し、
+        結果のbrowser_profile_savingsにオッズページ1枚あたりの転送量・時間の差を保存する
+    scrape_browser_lean_dom
+        extraction="dom"での取得（遷移先はキャッシュ済み）。transferのpayload_kibは
+        ブラウザからPythonに渡したHTML・オッズの配列の大きさ
+    extract_<属性名>
+        RealtimeOddsのextract_*（単勝の解析結果を使い回す複勝は、単勝の抽出後の追加分）
+    extract_all_async
+        ExtractPoolの別プロセスでの全馬券種の抽出
+    extract_dom_<馬券種>
+        ページ内で取り出したオッズの配列（odds_dom.EXTRACT_ODDS_JSの出力と同じ形式）からの変換
+    extract_incremental_<馬券種>
+        前回の取得から1つのブロックのオッズだけが変わったページのIncrementalParserでの解析
+    render_json / render_packed / render_odds_table
+        APIのJSON・packed形式への変換、Streamlit版の一覧表の作成（odds_display.build_odds_table）
+
+制限事項:
+    - CPU時間はこのプロセスの分のみ（サーバーとChromiumは別プロセスのため含まない）
+    - ピークRSSはプロセス全体の最大値のため、その段階までに使われた最大のメモリを表す
+    - メモリ割り当てはtracemallocを有効にした別の1回で計測するため、時間の計測には影響しない。
+      tracemallocが追跡するのはPythonの割り当てのみで、lxmlやNumPyが内部で確保するメモリは含まない
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import gc
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional
+from urllib.parse import urlsplit
+
+# 親ディレクトリをパスに追加（extract_odds.pyなどをインポートするため）
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lxml.html
+
+from extract_odds import ALL_BET_TYPES, RealtimeOdds
+from extract_pool import ExtractPool
+from fetchers import HttpFetcher
+from odds_codec import encode_odds
+from odds_display import build_odds_table
+from odds_dom import extract_packed
+from odds_incremental import IncrementalParser
+from odds_parser import iter_blocks
+from odds_table import BET_TYPE_SHAPES
+from odds_poller import ODDS_ATTRIBUTES, snapshot_odds
+from odds_query import select_odds
+from odds_resolver import JRA_BASE_URL, OddsPageResolver
+
+from fixtures import DEFAULT_RACE_ID, archived_pages, packed_odds, stub_jra_site, synthetic_pages
+
+# 以前の結果より壁時計時間がこの割合以上長くなった段階を遅くなったとみなす
+DEFAULT_THRESHOLD = 0.2
+
+
+def _peak_rss_kib() -> int:
+    # LinuxではKiB、macOSではバイト単位
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(
+    run: Callable[[Any], Any], repeat: int, setup: Optional[Callable[[], Any]] = None
+) -> dict:
+    """
+    runをrepeat回実行して時間を計測し、さらに1回tracemallocを有効にして割り当てを計測する。
+
+    Parameters
+    --------
+    run : Callable[[Any], Any]
+        計測する処理。setupの戻り値を受け取る。
+    repeat : int
+        時間を計測する回数
+    setup : Callable[[], Any], optional
+        毎回runの前に実行する準備（計測に含めない）
+
+    Returns
+    --------
+    dict
+        wall_ms・cpu_ms（median/min/max）、alloc_peak_kib、alloc_net_kib、
+        rss_peak_kib、rss_growth_kib
+    """
+    rss_before = _peak_rss_kib()
+    walls, cpus = [], []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        gc.collect()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        run(state)
+        cpus.append((time.process_time() - cpu_start) * 1000)
+        walls.append((time.perf_counter() - wall_start) * 1000)
+    state = setup() if setup is not None else None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        result = run(state)
+        current, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+    rss_after = _peak_rss_kib()
+    return {
+        "wall_ms": _summary(walls),
+        "cpu_ms": _summary(cpus),
+        "alloc_peak_kib": round((peak - baseline) / 1024, 1),
+        "alloc_net_kib": round((current - baseline) / 1024, 1),
+        "rss_peak_kib": rss_after,
+        "rss_growth_kib": rss_after - rss_before,
+    }
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "median": round(statistics.median(values), 3),
+        "min": round(min(values), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def _one_block_changed(bet_type: str, html: str) -> tuple[str, str]:
+    """
+    ページをlxmlで書き出し直したものと、最初のブロックの最初のオッズだけを変えたものを返す。
+    """
+    blocks = iter_blocks(bet_type, html)
+    tree = blocks[0].getroottree()
+    before = lxml.html.tostring(tree, encoding="unicode")
+    td = blocks[0].find(".//td")
+    td.text = "9,999.9" if td.text_content().strip() != "9,999.9" else "8,888.8"
+    return before, lxml.html.tostring(tree, encoding="unicode")
+
+
+class PipelineBenchmark:
+    """
+    1つのレースのオッズページに対して、段階ごとの計測を行うクラス。
+    """
+
+    def __init__(
+        self,
+        race_id: str,
+        pages: dict[str, str],
+        base_url: str,
+        repeat: int = 5,
+        patterns: list[str] = ["*"],
+    ):
+        """
+        Parameters
+        --------
+        race_id : str
+            JRA形式のrace_id
+        pages : dict[str, str]
+            {馬券種: HTML}（抽出の段階の入力）
+        base_url : str
+            JRA公式サイトの代わりのサーバーのURL
+        repeat : int, optional
+            段階ごとに時間を計測する回数。デフォルトは5
+        patterns : list[str], optional
+            計測する段階名のパターン（fnmatch形式）
+        """
+        self.race_id = race_id
+        self.pages = pages
+        self.base_url = base_url
+        self.repeat = repeat
+        self.patterns = patterns
+        self.loop = asyncio.new_event_loop()
+        self.results: dict[str, dict] = {}
+        self.savings: Optional[dict] = None
+
+    def _wanted(self, name: str) -> bool:
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in self.patterns)
+
+    def stage(
+        self, name: str, run: Callable[[Any], Any], setup: Optional[Callable[[], Any]] = None
+    ) -> None:
+        if not self._wanted(name):
+            return
+        result = measure(run, self.repeat, setup)
+        self.results[name] = result
+        print(
+            f"{name:<30} wall {result['wall_ms']['median']:>10.3f} ms"
+            f"  cpu {result['cpu_ms']['median']:>10.3f} ms"
+            f"  alloc {result['alloc_peak_kib']:>10.1f} KiB"
+            f"  rss {result['rss_peak_kib']:>8d} KiB"
+        )
+
+    def _scrape(self, odds: RealtimeOdds) -> RealtimeOdds:
+        self.loop.run_until_complete(odds.scrape_html(skip_bet_types=[]))
+        missing = set(self.pages) - set(odds.htmls) - set(odds.packed)
+        if missing:
+            raise RuntimeError(f"取得できなかった馬券種があります: {sorted(missing)}")
+        return odds
+
+    def run_scrape_http(self) -> None:
+        fetcher = HttpFetcher(base_url=self.base_url)
+        cached = OddsPageResolver()
+
+        def with_resolver(resolver: OddsPageResolver) -> RealtimeOdds:
+            # HttpFetcherは自身のresolverで遷移先を引くため、RealtimeOddsと同じものにする
+            fetcher.resolver = resolver
+            return RealtimeOdds(self.race_id, resolver=resolver, fetcher=fetcher)
+
+        try:
+            self.stage("scrape_http", self._scrape, lambda: with_resolver(OddsPageResolver()))
+            # 遷移先を記録してから、キャッシュ済みの場合を計測する
+            self._scrape(with_resolver(cached))
+            self.stage("scrape_http_cached", self._scrape, lambda: with_resolver(cached))
+        finally:
+            self.loop.run_until_complete(fetcher.close())
+
+    def _stub_url(self, url: str) -> str:
+        """
+        ブラウザのリクエストのURLを、JRA公式サイトの代わりのサーバーのURLに置き換える。
+        """
+        if url.startswith(JRA_BASE_URL):
+            return self.base_url + url[len(JRA_BASE_URL):]
+        parts = urlsplit(url)
+        return f"{self.base_url}__external/{parts.hostname}{parts.path}"
+
+    def run_scrape_browser(self) -> None:
+        for profile in ("full", "lean"):
+            prefix = "scrape_browser" if profile == "full" else "scrape_browser_lean"
+            if self._wanted(prefix) or self._wanted(prefix + "_cached"):
+                if not self._run_scrape_browser(profile, prefix):
+                    return
+        full = self.results.get("scrape_browser")
+        lean = self.results.get("scrape_browser_lean")
+        if full is not None and lean is not None:
+            pages = len(self.pages)
+            self.savings = {
+                "transfer_kib_per_page": round(
+                    (full["transfer"]["kib"] - lean["transfer"]["kib"]) / pages, 1
+                ),
+                "requests_per_page": round(
+                    (full["transfer"]["requests"] - lean["transfer"]["requests"]) / pages, 2
+                ),
+                "wall_ms_per_page": round(
+                    (full["wall_ms"]["median"] - lean["wall_ms"]["median"]) / pages, 3
+                ),
+            }
+            print(
+                f"{'lean profile savings':<30} {self.savings['transfer_kib_per_page']:.1f} KiB/page"
+                f"  {self.savings['requests_per_page']:.2f} requests/page"
+                f"  {self.savings['wall_ms_per_page']:.3f} ms/page"
+            )
+
+    def _run_scrape_browser(self, profile: str, prefix: str) -> bool:
+        """
+        指定したプロファイルのBrowserPoolで取得を計測する。Chromiumを起動できない場合はFalseを返す。
+        """
+        from browser_pool import BrowserPool
+
+        transfer = {"requests": 0, "bytes": 0}
+
+        async def route_to_stub(context) -> None:
+            # profile="lean"で遮断したリクエストはこのハンドラーに届かないため、転送量に含まれない
+            async def handle(route) -> None:
+                response = await route.fetch(url=self._stub_url(route.request.url))
+                transfer["requests"] += 1
+                transfer["bytes"] += len(await response.body())
+                await route.fulfill(response=response)
+
+            await context.route("**/*", handle)
+
+        def scrape_counted(odds: RealtimeOdds) -> dict:
+            transfer.update(requests=0, bytes=0)
+            self._scrape(odds)
+            payload = sum(len(html.encode("utf-8")) for html in odds.htmls.values()) + sum(
+                len(json.dumps(packed, separators=(",", ":"))) for packed in odds.packed.values()
+            )
+            return {
+                "requests": transfer["requests"],
+                "kib": round(transfer["bytes"] / 1024, 1),
+                "payload_kib": round(payload / 1024, 1),
+            }
+
+        pool = BrowserPool(max_size=1, context_setup=route_to_stub, profile=profile)
+        try:
+            self.loop.run_until_complete(pool.start())
+            self.loop.run_until_complete(pool.warm_up())
+        except Exception as e:
+            print(f"警告: run_benchmarks - Chromiumを起動できないため、ブラウザでの取得の計測を省略します: {e}")
+            self.loop.run_until_complete(pool.close())
+            return False
+        cached = OddsPageResolver()
+        try:
+            self.stage(
+                prefix,
+                self._scrape,
+                lambda: RealtimeOdds(self.race_id, browser_pool=pool, resolver=OddsPageResolver()),
+            )
+            if prefix in self.results:
+                self.results[prefix]["transfer"] = scrape_counted(
+                    RealtimeOdds(self.race_id, browser_pool=pool, resolver=OddsPageResolver())
+                )
+            self._scrape(RealtimeOdds(self.race_id, browser_pool=pool, resolver=cached))
+            self.stage(
+                prefix + "_cached",
+                self._scrape,
+                lambda: RealtimeOdds(self.race_id, browser_pool=pool, resolver=cached),
+            )
+            if prefix + "_cached" in self.results:
+                self.results[prefix + "_cached"]["transfer"] = scrape_counted(
+                    RealtimeOdds(self.race_id, browser_pool=pool, resolver=cached)
+                )
+            if profile == "lean":
+                self.stage(
+                    prefix + "_dom",
+                    self._scrape,
+                    lambda: RealtimeOdds(
+                        self.race_id, browser_pool=pool, resolver=cached, extraction="dom"
+                    ),
+                )
+                if prefix + "_dom" in self.results:
+                    self.results[prefix + "_dom"]["transfer"] = scrape_counted(
+                        RealtimeOdds(self.race_id, browser_pool=pool, resolver=cached, extraction="dom")
+                    )
+        finally:
+            self.loop.run_until_complete(pool.close())
+        return True
+
+    def _loaded_odds(self, before: list[str] = []) -> RealtimeOdds:
+        odds = RealtimeOdds(self.race_id)
+        odds.htmls.update(self.pages)
+        for name in before:
+            getattr(odds, f"extract_{name}")()
+        return odds
+
+    def run_extract(self) -> None:
+        for name in ODDS_ATTRIBUTES:
+            # 複勝は単勝と同じページの解析結果を使い回すため、単勝の抽出後に計測する
+            before = ["tansho"] if name == "fukusho" else []
+            self.stage(
+                f"extract_{name}",
+                lambda odds, name=name: getattr(odds, f"extract_{name}")(),
+                lambda before=before: self._loaded_odds(before),
+            )
+        for bet_type, packed in packed_odds(self.pages).items():
+            self.stage(
+                f"extract_dom_{bet_type}",
+                lambda _, bet_type=bet_type, packed=packed: extract_packed(bet_type, packed),
+            )
+        for bet_type in BET_TYPE_SHAPES:
+            if bet_type not in self.pages or not self._wanted(f"extract_incremental_{bet_type}"):
+                continue
+            before, after = _one_block_changed(bet_type, self.pages[bet_type])
+
+            def primed(bet_type: str = bet_type, before: str = before) -> IncrementalParser:
+                parser = IncrementalParser()
+                parser.table(self.race_id, bet_type, before)
+                return parser
+
+            self.stage(
+                f"extract_incremental_{bet_type}",
+                lambda parser, bet_type=bet_type, after=after: parser.table(self.race_id, bet_type, after),
+                primed,
+            )
+        if not self._wanted("extract_all_async"):
+            return
+        pool = ExtractPool()
+        try:
+            # プロセスの起動は計測に含めない
+            self.loop.run_until_complete(self._loaded_odds().extract_all_async(pool))
+            self.stage(
+                "extract_all_async",
+                lambda odds: self.loop.run_until_complete(odds.extract_all_async(pool)),
+                self._loaded_odds,
+            )
+        finally:
+            pool.close()
+
+    def run_render(self) -> None:
+        odds = self._loaded_odds()
+        odds.extract_all()
+        snapshot = snapshot_odds(odds)
+        self.stage(
+            "render_json",
+            lambda _: json.dumps(select_odds(snapshot, list(snapshot))),
+        )
+        self.stage("render_packed", lambda _: encode_odds(snapshot))
+        if {"tansho", "fukusho", "umaren"} <= snapshot.keys():
+            self.stage("render_odds_table", lambda _: build_odds_table(snapshot))
+
+    def run(self, browser: bool = False) -> dict[str, dict]:
+        try:
+            self.run_scrape_http()
+            if browser:
+                self.run_scrape_browser()
+            self.run_extract()
+            self.run_render()
+        finally:
+            self.loop.close()
+        return self.results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def compare_results(current: dict, previous: dict, threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """
+    段階ごとに壁時計時間の中央値を以前の結果と比べて表示し、遅くなった段階名のリストを返す。
+    """
+    print(f"\n比較対象: {previous.get('git_commit')} ({previous.get('created_at')})")
+    regressions = []
+    for name, result in current["stages"].items():
+        before = previous.get("stages", {}).get(name)
+        if before is None:
+            print(f"{name:<30} （以前の結果なし）")
+            continue
+        ratio = result["wall_ms"]["median"] / max(before["wall_ms"]["median"], 1e-9)
+        cpu_ratio = result["cpu_ms"]["median"] / max(before["cpu_ms"]["median"], 1e-9)
+        alloc_diff = result["alloc_peak_kib"] - before["alloc_peak_kib"]
+        mark = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = "  <- 遅くなっています"
+        print(
+            f"{name:<30} wall x{ratio:.2f}  cpu x{cpu_ratio:.2f}"
+            f"  alloc {alloc_diff:+.1f} KiB{mark}"
+        )
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="オッズ取得パイプラインのベンチマーク")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"),
+                        help="結果を保存するJSONファイル（デフォルト: benchmark_results.json）")
+    parser.add_argument("--compare", type=Path, help="比較する以前の結果のJSONファイル")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="遅くなったとみなす壁時計時間の増加率（デフォルト: 0.2）")
+    parser.add_argument("--repeat", type=int, default=5, help="段階ごとの計測回数（デフォルト: 5）")
+    parser.add_argument("--stages", nargs="+", default=["*"],
+                        help="計測する段階名のパターン（例: \"extract_*\"）")
+    parser.add_argument("--browser", action="store_true", help="Chromiumでの取得も計測する")
+    parser.add_argument("--horses", type=int, default=18, help="合成するページの頭数（デフォルト: 18）")
+    parser.add_argument("--archive", type=Path,
+                        help="合成したページの代わりに使うHtmlArchiveのディレクトリ")
+    parser.add_argument("--race-id", default=DEFAULT_RACE_ID,
+                        help="--archiveから読み込むrace_id")
+    args = parser.parse_args(argv)
+
+    if args.archive is not None:
+        pages = archived_pages(args.archive, args.race_id)
+        fixture = {"source": "archive", "path": str(args.archive)}
+    else:
+        pages = synthetic_pages(args.race_id, horses=args.horses)
+        fixture = {"source": "synthetic", "horses": args.horses}
+    fixture.update(
+        race_id=args.race_id,
+        bytes={bet_type: len(pages[bet_type].encode("cp932", errors="replace"))
+               for bet_type in ALL_BET_TYPES if bet_type in pages},
+    )
+
+    with stub_jra_site(args.race_id, pages) as base_url:
+        benchmark = PipelineBenchmark(
+            args.race_id, pages, base_url, repeat=args.repeat, patterns=args.stages
+        )
+        stages = benchmark.run(browser=args.browser)
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "fixture": fixture,
+        "stages": stages,
+    }
+    if benchmark.savings is not None:
+        results["browser_profile_savings"] = benchmark.savings
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n結果を保存しました: {args.output}")
+
+    if args.compare is not None:
+        previous = json.loads(args.compare.read_text(encoding="utf-8"))
+        if compare_results(results, previous, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
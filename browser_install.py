@@ -0,0 +1,204 @@
+"""
+PlaywrightのChromiumのインストール確認とバックグラウンドでのインストール
+
+概要:
+    以前はapp.pyの読み込み時にsync_playwrightでChromiumを起動・終了してインストールを
+    確認していたため、セッションごとに数秒かかり、未インストールの場合は
+    playwright installが終わるまで画面が表示されなかった。
+    このモジュールはPlaywrightのbrowsers.jsonから必要なリビジョンを読み取り、
+    ブラウザの保存先（PLAYWRIGHT_BROWSERS_PATH、既定は~/.cache/ms-playwrightなど）に
+    インストール完了の印（INSTALLATION_COMPLETE）があるかをファイルの有無だけで確認する。
+    結果はプロセス内で共有し、インストールとウォームアップ（1回の起動）は
+    バックグラウンドのスレッドで行う。
+
+使用例:
+    ensure_chromium_in_background()  # すぐに戻る。プロセスで1回だけスレッドを起動する
+    chromium_status()["state"]       # "ready", "installing", "warming_up", "failed"など
+
+制限事項:
+    - install-depsはroot権限が必要な場合があり、失敗しても続行する
+      （Streamlit Cloudではpackages.txtでシステムの依存関係をインストールする）
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Optional
+
+# headless=Trueでの起動に使われるブラウザ（新しいPlaywrightはheadless shellを使う）
+HEADLESS_BROWSERS = ("chromium-headless-shell", "chromium")
+INSTALL_TIMEOUT = 300
+INSTALL_DEPS_TIMEOUT = 180
+
+_status = {"state": "unknown", "path": None, "error": None}
+_status_lock = threading.Lock()
+_setup_thread: Optional[threading.Thread] = None
+
+
+def browsers_path() -> Path:
+    """
+    Playwrightがブラウザを保存するディレクトリを返す。
+    """
+    configured = os.environ.get("PLAYWRIGHT_BROWSERS_PATH")
+    if configured == "0":
+        import playwright
+
+        return Path(playwright.__file__).parent / "driver" / "package" / ".local-browsers"
+    if configured:
+        return Path(configured)
+    if sys.platform == "win32":
+        return Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")) / "ms-playwright"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "ms-playwright"
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "ms-playwright"
+
+
+def _revisions() -> dict[str, set[str]]:
+    """
+    インストール済みのPlaywrightが使うブラウザのリビジョンを{ブラウザ名: リビジョン}で返す。
+    """
+    import playwright
+
+    path = Path(playwright.__file__).parent / "driver" / "package" / "browsers.json"
+    revisions = {}
+    for browser in json.loads(path.read_text(encoding="utf-8"))["browsers"]:
+        revisions[browser["name"]] = {browser["revision"], *browser.get("revisionOverrides", {}).values()}
+    return revisions
+
+
+def find_chromium() -> Optional[Path]:
+    """
+    headless=Trueで起動するChromiumのインストール先を返す。インストールされていない場合はNone。
+    Chromiumは起動せず、ファイルの有無だけを確認する。
+    """
+    try:
+        revisions = _revisions()
+    except (ImportError, OSError, ValueError, KeyError) as e:
+        print(f"警告: find_chromium - Playwrightのbrowsers.jsonを読み込めませんでした: {e}")
+        return None
+    root = browsers_path()
+    # headless shellを含むPlaywrightではheadless=Trueでそちらが使われる
+    for name in HEADLESS_BROWSERS:
+        if name not in revisions:
+            continue
+        for revision in sorted(revisions[name]):
+            directory = root / f"{name.replace('-', '_')}-{revision}"
+            if (directory / "INSTALLATION_COMPLETE").exists():
+                return directory
+        return None
+    return None
+
+
+def chromium_status() -> dict:
+    """
+    Chromiumの状態を返す（プロセス内で共有）。
+
+    Returns
+    --------
+    dict
+        {"state": 状態, "path": インストール先, "error": 失敗した場合の内容}。
+        状態は"unknown"（未確認）, "missing", "installing", "warming_up", "ready", "failed"のいずれか
+    """
+    with _status_lock:
+        if _status["state"] == "unknown":
+            path = find_chromium()
+            _status.update(state="ready" if path is not None else "missing", path=path)
+        return dict(_status)
+
+
+def _set_status(state: str, **values) -> None:
+    with _status_lock:
+        _status.update(state=state, **values)
+
+
+def install_chromium() -> None:
+    """
+    playwright install chromiumを実行する（システムの依存関係のインストールも試みる）。
+
+    Raises
+    --------
+    RuntimeError
+        インストールに失敗した場合
+    """
+    result = subprocess.run(
+        [sys.executable, "-m", "playwright", "install", "chromium"],
+        capture_output=True,
+        text=True,
+        timeout=INSTALL_TIMEOUT,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Chromiumのインストールに失敗しました: {result.stderr}")
+    try:
+        subprocess.run(
+            [sys.executable, "-m", "playwright", "install-deps", "chromium"],
+            capture_output=True,
+            text=True,
+            timeout=INSTALL_DEPS_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"警告: install_chromium - システムの依存関係のインストールで警告がありました（続行します）: {e}")
+
+
+def warm_up_chromium() -> None:
+    """
+    Chromiumを1回起動・終了し、実行ファイルをOSのキャッシュに載せる（最初の取得を速くする）。
+    """
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as playwright:
+        browser = playwright.chromium.launch(headless=True)
+        browser.close()
+
+
+def _setup(install: bool, warm_up: bool) -> None:
+    state = chromium_status()["state"]
+    try:
+        if state == "missing":
+            if not install:
+                return
+            _set_status("installing")
+            install_chromium()
+            path = find_chromium()
+            if path is None:
+                raise RuntimeError("インストール後もChromiumが見つかりませんでした。")
+            _set_status("ready", path=path)
+    except Exception as e:
+        print(f"警告: ensure_chromium_in_background - {e}")
+        _set_status("failed", error=str(e))
+        return
+    if not warm_up:
+        return
+    _set_status("warming_up")
+    try:
+        warm_up_chromium()
+    except Exception as e:
+        # インストールは済んでいるため、取得時の起動に任せる
+        print(f"警告: ensure_chromium_in_background - ウォームアップに失敗しました: {e}")
+        _set_status("ready", error=str(e))
+        return
+    _set_status("ready")
+
+
+def ensure_chromium_in_background(install: bool = True, warm_up: bool = True) -> threading.Thread:
+    """
+    Chromiumのインストール（未インストールの場合）とウォームアップをバックグラウンドのスレッドで行う。
+    プロセスで最初の呼び出しのみスレッドを起動し、以降は同じスレッドを返す。
+
+    Parameters
+    --------
+    install : bool, optional
+        未インストールの場合にインストールするかどうか。デフォルトはTrue
+    warm_up : bool, optional
+        インストール済みの場合に1回起動しておくかどうか。デフォルトはTrue
+    """
+    global _setup_thread
+    with _status_lock:
+        if _setup_thread is None:
+            _setup_thread = threading.Thread(
+                target=_setup, args=(install, warm_up), name="chromium-setup", daemon=True
+            )
+            _setup_thread.start()
+        return _setup_thread
@@ -0,0 +1,301 @@
+"""
+Playwright用ブラウザプール
+
+概要:
+    Chromiumを常駐させておき、RealtimeOddsがページを借りて使い回せるようにする。
+    リクエストごとにブラウザを起動・終了する場合に比べ、起動待ち（数秒）が不要になる。
+
+主な機能:
+    - 同時に起動するブラウザ数の上限（max_size）
+    - 貸し出し前のヘルスチェック（切断済みブラウザは破棄して再起動）
+    - 指定回数（max_uses）使用したブラウザの再起動（メモリリーク対策）
+    - ブラウザがクラッシュした場合の自動復旧
+    - 省メモリの起動設定と、オッズの抽出に不要なリソースの遮断（profile="lean"）
+
+制限事項:
+    - プールは作成したイベントループに紐づくため、asyncio.runを都度呼ぶ用途では再利用されない
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+from urllib.parse import urlsplit
+
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, Route, async_playwright
+
+from odds_metrics import BLOCKED_REQUESTS, span
+
+BROWSER_PROFILES = ("full", "lean")
+# profile="lean"でChromiumに渡す省メモリの起動オプション
+LEAN_LAUNCH_ARGS = [
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--no-first-run",
+    "--mute-audio",
+    "--renderer-process-limit=1",
+    "--disable-features=Translate,BackForwardCache,MediaRouter,OptimizationHints",
+    "--js-flags=--max-old-space-size=128",
+    "--blink-settings=imagesEnabled=false",
+]
+LEAN_CONTEXT_OPTIONS = {
+    "viewport": {"width": 800, "height": 600},
+    "device_scale_factor": 1,
+    "service_workers": "block",
+}
+# オッズの抽出には表のマークアップしか使わないため、これらのリソースは読み込まない
+# （doActionなどの遷移にJavaScriptを使うため、scriptは遮断しない）
+BLOCKED_RESOURCE_TYPES = frozenset(
+    {"image", "stylesheet", "font", "media", "texttrack", "manifest", "eventsource", "websocket"}
+)
+# アクセス解析・広告のドメイン（サブドメインを含む）
+BLOCKED_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "facebook.net",
+    "facebook.com",
+    "twitter.com",
+    "x.com",
+    "yjtag.jp",
+    "yimg.jp",
+    "adobedtm.com",
+    "omtrdc.net",
+    "demdex.net",
+    "criteo.com",
+    "clarity.ms",
+)
+
+
+def profile_options(profile: str) -> tuple[dict, dict]:
+    """
+    プロファイルの(chromium.launchのオプション, browser.new_contextのオプション)を返す。
+    """
+    if profile not in BROWSER_PROFILES:
+        raise ValueError(f"profileは{BROWSER_PROFILES}のいずれかを指定してください: {profile}")
+    if profile == "lean":
+        return {"args": list(LEAN_LAUNCH_ARGS)}, dict(LEAN_CONTEXT_OPTIONS)
+    return {}, {}
+
+
+class ResourceBlocker:
+    """
+    コンテキスト内の不要なリクエスト（画像・CSS・フォントやアクセス解析のドメイン）を遮断する。
+
+    遮断しないリクエストはroute.fallbackで先に登録されたハンドラーに渡すため、
+    BrowserPoolのcontext_setupで登録したハンドラーとも併用できる。
+    """
+
+    def __init__(
+        self,
+        resource_types: Iterable[str] = BLOCKED_RESOURCE_TYPES,
+        domains: Iterable[str] = BLOCKED_DOMAINS,
+    ):
+        self.resource_types = frozenset(resource_types)
+        self.domains = tuple(domains)
+        self.blocked: dict[str, int] = {}
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.resource_types:
+            return True
+        host = urlsplit(url).hostname or ""
+        return any(host == domain or host.endswith("." + domain) for domain in self.domains)
+
+    async def attach(self, context: BrowserContext) -> None:
+        await context.route("**/*", self._handle)
+
+    async def _handle(self, route: Route) -> None:
+        request = route.request
+        if not self.should_block(request.resource_type, request.url):
+            await route.fallback()
+            return
+        self.blocked[request.resource_type] = self.blocked.get(request.resource_type, 0) + 1
+        BLOCKED_REQUESTS.inc(resource_type=request.resource_type)
+        await route.abort("blockedbyclient")
+
+
+class _PooledBrowser:
+    """
+    プール内の1ブラウザと、その使用回数・状態を保持する。
+    """
+
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.uses = 0
+        self.broken = False
+        browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, _browser: Browser) -> None:
+        self.broken = True
+
+    def is_healthy(self) -> bool:
+        return not self.broken and self.browser.is_connected()
+
+
+class BrowserPool:
+    """
+    起動済みChromiumを使い回すためのプール。
+
+    使用例:
+        async with BrowserPool(max_size=2) as pool:
+            odds = RealtimeOdds(race_id, browser_pool=pool)
+            await odds.scrape_html()
+    """
+
+    def __init__(
+        self,
+        max_size: int = 2,
+        max_uses: int = 50,
+        headless: bool = True,
+        launch_options: Optional[dict] = None,
+        context_options: Optional[dict] = None,
+        context_setup: Optional[Callable[[BrowserContext], Awaitable[None]]] = None,
+        profile: str = "full",
+    ):
+        """
+        Parameters
+        --------
+        max_size : int, optional
+            同時に起動するブラウザの最大数。デフォルトは2
+        max_uses : int, optional
+            1つのブラウザを再起動するまでの貸し出し回数。デフォルトは50
+        headless : bool, optional
+            ブラウザをヘッドレスモードで実行するかどうか。デフォルトはTrue
+        launch_options : dict, optional
+            chromium.launchに渡す追加オプション
+        context_options : dict, optional
+            browser.new_contextに渡すオプション
+        context_setup : Callable[[BrowserContext], Awaitable[None]], optional
+            作成したコンテキストをページの貸し出し前に設定する関数
+            （context.routeによるリクエストの差し替えなど）
+        profile : str, optional
+            "lean"の場合、Chromiumを省メモリのオプション・小さいビューポートで起動し、
+            画像・CSS・フォント・アクセス解析などのリクエストを遮断する。デフォルトは"full"
+        """
+        if max_size < 1:
+            raise ValueError("max_sizeは1以上を指定してください。")
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.headless = headless
+        profile_launch, profile_context = profile_options(profile)
+        self.profile = profile
+        self.launch_options = {**profile_launch, **(launch_options or {})}
+        if "args" in profile_launch and launch_options and "args" in launch_options:
+            self.launch_options["args"] = profile_launch["args"] + list(launch_options["args"])
+        self.context_options = {**profile_context, **(context_options or {})}
+        self.context_setup = context_setup
+        self._playwright: Optional[Playwright] = None
+        self._idle: list[_PooledBrowser] = []
+        self._slots = asyncio.Semaphore(max_size)
+        self._start_lock = asyncio.Lock()
+        self._closed = False
+
+    async def __aenter__(self) -> "BrowserPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        """
+        Playwrightを起動する。ブラウザ自体は最初の貸し出し時に起動する。
+        """
+        async with self._start_lock:
+            if self._closed:
+                raise RuntimeError("BrowserPoolは既に終了しています。")
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+
+    async def close(self) -> None:
+        """
+        待機中のブラウザとPlaywrightを終了する。
+        """
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for entry in idle:
+            await self._discard(entry)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def warm_up(self, count: Optional[int] = None) -> None:
+        """
+        指定数のブラウザを事前に起動し、最初のリクエストの起動待ちをなくす。
+        """
+        count = self.max_size if count is None else min(count, self.max_size)
+        entries = [await self._acquire() for _ in range(count)]
+        for entry in entries:
+            await self._release(entry)
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """
+        プールからブラウザを借り、新しいコンテキストのページを貸し出す。
+
+        コンテキストは貸し出しごとに作成・破棄するため、Cookie等は共有されない。
+        ページ操作中にブラウザが落ちた場合、そのブラウザは返却時に破棄される。
+        """
+        entry = await self._acquire()
+        context = None
+        try:
+            context = await entry.browser.new_context(**self.context_options)
+            if self.context_setup is not None:
+                await self.context_setup(context)
+            if self.profile == "lean":
+                # 後に登録したハンドラーが先に呼ばれるため、遮断の判定はcontext_setupより先に行われる
+                await ResourceBlocker().attach(context)
+            yield await context.new_page()
+        except Exception:
+            if not entry.browser.is_connected():
+                entry.broken = True
+            raise
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    entry.broken = True
+            await self._release(entry)
+
+    async def _acquire(self) -> _PooledBrowser:
+        await self._slots.acquire()
+        try:
+            if self._playwright is None:
+                await self.start()
+            while self._idle:
+                entry = self._idle.pop()
+                if entry.is_healthy():
+                    return entry
+                print("警告: BrowserPool - 切断されたブラウザを破棄します。")
+                await self._discard(entry)
+            with span("browser.launch"):
+                browser = await self._playwright.chromium.launch(
+                    headless=self.headless, **self.launch_options
+                )
+            return _PooledBrowser(browser)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release(self, entry: _PooledBrowser) -> None:
+        try:
+            entry.uses += 1
+            if self._closed or not entry.is_healthy() or entry.uses >= self.max_uses:
+                await self._discard(entry)
+            else:
+                self._idle.append(entry)
+        finally:
+            self._slots.release()
+
+    async def _discard(self, entry: _PooledBrowser) -> None:
+        try:
+            await entry.browser.close()
+        except Exception:
+            pass
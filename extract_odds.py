@@ -1,8 +1,25 @@
-import re
+import asyncio
+import functools
+import json
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
 
-from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright
+from playwright.async_api import Locator, Page, async_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from browser_pool import BrowserPool, ResourceBlocker, profile_options
+from odds_dom import EXTRACT_ODDS_JS, extract_packed, packed_size, verify_packed
+from odds_metrics import CLICK_DELAY, FETCH_RETRIES, PAGE_BYTES, PARSED_ROWS, span
+from odds_pacing import AdaptivePacer, default_pacer
+from odds_parser import filter_horses, filter_rows, iter_odds, parse_tanpuku
+from odds_resolver import OddsPageResolver, default_resolver, open_target, parse_link_target
+from odds_table import BET_TYPE_SHAPES, OddsTable
+
+if TYPE_CHECKING:
+    from fetchers import HtmlFetcher
+    from extract_pool import ExtractPool
+    from html_archive import HtmlArchive
+    from odds_incremental import IncrementalParser
 
 DATA_DIR = Path("..", "data")
 HTML_DIR = DATA_DIR / "html"
@@ -31,6 +48,73 @@ BET_TYPE_MAPPING = {
     "3連単": "sanrentan",
     "連単": "sanrentan",  # 表記揺れに対応
 }
+# サイト上に並ぶ順の馬券種
+ALL_BET_TYPES = list(dict.fromkeys(BET_TYPE_MAPPING.values()))
+# 抽出結果（RealtimeOddsの属性名）と、それを含むオッズページの馬券種の対応付け
+ODDS_PAGES = {
+    "tansho": "tanpuku",
+    "fukusho": "tanpuku",
+    "umaren": "umaren",
+    "umatan": "umatan",
+    "sanrenpuku": "sanrenpuku",
+    "sanrentan": "sanrentan",
+}
+# 馬券種ごとのオッズページの表示が終わったと判定する要素
+NAV_PILLS_SELECTOR = "ul.nav.pills"
+ODDS_READY_SELECTORS = {
+    "tanpuku": "table.tanpuku",
+    "umaren": "ul.umaren_list",
+    "umatan": "ul.umatan_list",
+    "sanrenpuku": "div.fuku3_unit",
+    "sanrentan": "div.tan3_unit",
+}
+# ブラウザでオッズを取り出す方法
+EXTRACTION_MODES = ("html", "dom")
+
+
+def skip_bet_types_for(names: Iterable[str]) -> list[str]:
+    """
+    必要なオッズ（"tansho"のような属性名、または"tanpuku"のような馬券種）以外の
+    馬券種のリストを返す。scrape_htmlのskip_bet_typesに渡すと、必要なページだけを開く。
+    """
+    needed = {ODDS_PAGES.get(name, name) for name in names}
+    return [bet_type for bet_type in ALL_BET_TYPES if bet_type not in needed]
+
+
+def kaisai_link_name(race_id: str) -> str:
+    """
+    race_idから開催のリンク名（例: "1回東京4日"）を作成する。
+    """
+    return (
+        f"{int(race_id[6:8])}回"
+        + f"{PLACE_MAPPING[int(race_id[4:6])]}"
+        + f"{int(race_id[8:10])}日"
+    )
+
+
+def race_link_name(race_id: str) -> str:
+    """
+    race_idからレースのリンク名（例: "11レース"）を作成する。
+    """
+    return f"{int(race_id[10:12])}レース"
+
+
+def _extract_step(name: str) -> Callable[[Callable], Callable]:
+    """
+    extract_*をspan("extract.<属性名>")で囲み、抽出した件数をodds_parsed_rows_totalに加算するデコレータ。
+    """
+
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self: "RealtimeOdds") -> None:
+            with span(f"extract.{name}", race_id=self.race_id) as attributes:
+                method(self)
+                attributes["rows"] = rows = len(getattr(self, name))
+            PARSED_ROWS.inc(rows, bet_type=name)
+
+        return wrapper
+
+    return decorator
 
 
 class RealtimeOdds:
@@ -41,429 +125,631 @@ class RealtimeOdds:
     def __init__(
         self,
         race_id: str,
+        browser_pool: Optional[BrowserPool] = None,
+        resolver: Optional[OddsPageResolver] = None,
+        fetcher: Optional["HtmlFetcher"] = None,
+        archive: Optional["HtmlArchive"] = None,
+        replay: bool = False,
+        replay_at: Optional[float] = None,
+        horses: Optional[Iterable[int]] = None,
+        pacer: Optional[AdaptivePacer] = None,
+        profile: str = "full",
+        extraction: str = "html",
+        verify_extraction: bool = False,
+        incremental: Optional["IncrementalParser"] = None,
     ):
+        """
+        Parameters
+        --------
+        race_id : str
+            JRA形式のrace_id
+        browser_pool : BrowserPool, optional
+            起動済みブラウザを借りるためのプール。
+            指定しない場合はscrape_htmlのたびにブラウザを起動・終了する。
+        resolver : OddsPageResolver, optional
+            オッズページの遷移先キャッシュ。指定しない場合はプロセス内で共有されるものを使用する。
+        fetcher : HtmlFetcher, optional
+            ブラウザより先に試すHTML取得バックエンド（fetchers.HttpFetcherなど）。
+            取得に失敗した場合はPlaywrightでの取得に切り替える。
+        archive : HtmlArchive, optional
+            取得したHTMLを保存するアーカイブ。replay=Trueの場合は読み込み元。
+        replay : bool, optional
+            Trueの場合、scrape_htmlはネットワークを使わずarchiveからHTMLを読み込む。デフォルトはFalse
+        replay_at : float, optional
+            リプレイする時刻（UNIX時間、秒）。指定しない場合は最後に保存したHTML
+        horses : Iterable[int], optional
+            指定した場合、extract_*はこれらの馬番のいずれかを含む組み合わせ
+            （単勝・複勝はその馬番）だけを保存する。
+        pacer : AdaptivePacer, optional
+            ブラウザでのページ遷移の間隔とタイムアウトを決めるもの。
+            指定しない場合はプロセス内で共有されるものを使用する。
+        profile : str, optional
+            "lean"の場合、ブラウザを省メモリのオプション・小さいビューポートで起動し、
+            画像・CSS・フォント・アクセス解析などのリクエストを遮断する。デフォルトは"full"
+            browser_poolを使用する場合はプール側の設定が優先される。
+        extraction : str, optional
+            "dom"の場合、ブラウザで取得するページはHTMLを転送せず、ページ内のスクリプト
+            （odds_dom.EXTRACT_ODDS_JS）で取り出した馬番とオッズの配列をself.packedに格納する。
+            オッズ表が見つからない場合はHTMLを取得してextract_*で解析する。デフォルトは"html"
+            archiveを指定した場合は保存のためHTMLも取得する。
+        verify_extraction : bool, optional
+            extraction="dom"の場合に、HTMLも取得してodds_parserの解析結果と突き合わせる。
+            一致しない場合は警告を出し、HTMLの解析結果を使用する。デフォルトはFalse
+        incremental : IncrementalParser, optional
+            指定した場合、extract_*はHTMLを前回の解析結果と比べ、変わったブロックだけを解析し直す。
+            同じレースを繰り返し取得する場合に、取得ごとに同じものを渡す。
+        """
+        if replay and archive is None:
+            raise ValueError("replay=Trueの場合はarchiveを指定してください。")
+        if extraction not in EXTRACTION_MODES:
+            raise ValueError(f"extractionは{EXTRACTION_MODES}のいずれかを指定してください: {extraction}")
         self.race_id = race_id
+        self.browser_pool = browser_pool
+        self.resolver = resolver if resolver is not None else default_resolver
+        self.fetcher = fetcher
+        self.archive = archive
+        self.replay = replay
+        self.replay_at = replay_at
+        self.horses = frozenset(horses) if horses is not None else None
+        self.pacer = pacer if pacer is not None else default_pacer
+        self.launch_options, self.context_options = profile_options(profile)
+        self.profile = profile
+        self.extraction = extraction
+        self.verify_extraction = verify_extraction
+        self.incremental = incremental
         self.htmls = {}
+        self.packed = {}
+        self._tanpuku_parsed = None
 
     async def scrape_html(
         self,
         skip_bet_types: list[str] = ["wakuren", "wide"],
         headless: bool = True,
-        delay_time: int = 1000,
+        delay_time: Optional[int] = None,
+        parallel: bool = False,
+        max_concurrency: int = 4,
     ) -> None:
         """
         レースIDを指定してJRA公式サイトからオッズページのHTMLを取得する関数。
 
+        ページ遷移はクリック後の遷移の完了（DOMContentLoaded）と、馬券種ごとのオッズ表の要素
+        （ODDS_READY_SELECTORS）の表示を待つ。遷移の間隔とタイムアウトはpacerが
+        観測した応答時間とエラーの状況から決める。
+
         Parameters
         --------
         skip_bet_types : list[str], optional
             スキップする馬券種のリスト。デフォルトは["wakuren", "wide"]
         headless : bool, optional
             ブラウザをヘッドレスモードで実行するかどうか。デフォルトはTrue
+            browser_poolを使用する場合はプール側の設定が優先される。
         delay_time : int, optional
-            ページ遷移時の遅延時間（ミリ秒）。デフォルトは1000
+            指定した場合、リンクのクリックごとにこの遅延（ミリ秒）を加える（以前の固定の待ち）。
+            デフォルトはNone（遅延を加えない）
+        parallel : bool, optional
+            Trueの場合、オッズページ到達後に馬券種ごとのページを別タブで同時に開く。
+            デフォルトはFalse（タブを順にクリックする）
+        max_concurrency : int, optional
+            parallel=Trueの場合に同時に開くタブの最大数。デフォルトは4
 
         Returns
         --------
         None
             結果はインスタンス変数 self.htmls に辞書形式で格納される。
         """
+        with span("scrape_html", race_id=self.race_id, replay=self.replay):
+            if self.replay:
+                htmls = self.archive.load(self.race_id, self.replay_at, skip_bet_types)
+                if not htmls:
+                    raise RuntimeError(f"{self.race_id}のHTMLがアーカイブに保存されていません。")
+                self._store_htmls(htmls)
+                return
+            await self._fetch_html(skip_bet_types, headless, delay_time, parallel, max_concurrency)
+            if self.archive is not None:
+                with span("archive.save", race_id=self.race_id):
+                    self.archive.save(self.race_id, self.htmls)
+
+    async def _fetch_html(
+        self,
+        skip_bet_types: list[str],
+        headless: bool,
+        delay_time: Optional[int],
+        parallel: bool,
+        max_concurrency: int,
+    ) -> None:
+        """
+        fetcher・ブラウザプール・新しく起動したブラウザのいずれかでHTMLを取得する。
+        """
+        if self.fetcher is not None:
+            try:
+                with span(f"fetch.{type(self.fetcher).__name__}", race_id=self.race_id):
+                    htmls = await self.fetcher.fetch(self.race_id, skip_bet_types)
+                if htmls:
+                    self._store_htmls(htmls)
+                    return
+                print(f"警告: scrape_html - {type(self.fetcher).__name__}でHTMLを取得できませんでした。ブラウザで取得します。")
+            except Exception as e:
+                print(f"警告: scrape_html - {type(self.fetcher).__name__}での取得に失敗しました。ブラウザで取得します: {e}")
+            FETCH_RETRIES.inc(reason="fetcher_fallback")
+        if self.browser_pool is not None:
+            async with self.browser_pool.page() as page:
+                await self._scrape_page(
+                    page, skip_bet_types, delay_time, parallel, max_concurrency
+                )
+            return
         async with async_playwright() as playwright:
-            kaisai_name = (
-                f"{int(self.race_id[6:8])}回"
-                + f"{PLACE_MAPPING[int(self.race_id[4:6])]}"
-                + f"{int(self.race_id[8:10])}日"
-            )
-            race_name = f"{int(self.race_id[10:12])}レース"
-            browser = await playwright.chromium.launch(headless=headless)
-            context = await browser.new_context()
+            with span("browser.launch", profile=self.profile):
+                browser = await playwright.chromium.launch(headless=headless, **self.launch_options)
+            context = await browser.new_context(**self.context_options)
+            blocker = None
+            if self.profile == "lean":
+                blocker = ResourceBlocker()
+                await blocker.attach(context)
             page = await context.new_page()
             try:
-                await page.goto("https://www.jra.go.jp/keiba/")
-                await page.get_by_role("link", name="オッズ", exact=True).click(
-                    delay=delay_time
-                )
-                await page.wait_for_load_state("domcontentloaded")
-                kaisai_link = page.get_by_role("link", name=kaisai_name)
-                if await kaisai_link.count() > 0:
-                    await kaisai_link.click(delay=delay_time)
-                    await page.get_by_role("link", name=race_name, exact=True).click(
-                        delay=delay_time
+                with span("browser.scrape", race_id=self.race_id, profile=self.profile) as attributes:
+                    await self._scrape_page(
+                        page, skip_bet_types, delay_time, parallel, max_concurrency
                     )
-                else:
-                    # オッズページにリンクが存在しない場合、レース結果ページから遷移させる
-                    await page.get_by_role("link", name="レース結果").click(
-                        delay=delay_time
-                    )
-                    await page.get_by_role("link", name=kaisai_name).click(
-                        delay=delay_time
-                    )
-                    await page.get_by_role("link", name=race_name, exact=True).click(
-                        delay=delay_time
-                    )
-                    await page.locator("#race_result").get_by_role(
-                        "link", name="オッズ"
-                    ).click(delay=delay_time)
-                nav_pills = page.locator("ul.nav.pills")
-                await page.wait_for_load_state("domcontentloaded")
-                bet_type_items = nav_pills.locator("li")
-                for i in range(await bet_type_items.count()):
-                    bet_item = bet_type_items.nth(i)
-                    bet_link = bet_item.locator("a")
-                    bet_type_name = await bet_link.inner_text()
-                    bet_type = BET_TYPE_MAPPING[bet_type_name]
-                    if bet_type in skip_bet_types:
-                        continue
-                    await bet_link.click()
-                    await page.wait_for_load_state("domcontentloaded")
-                    html = await page.content()
-                    self.htmls[bet_type] = html
+                    if blocker is not None:
+                        attributes["blocked_requests"] = dict(blocker.blocked)
             finally:
                 await context.close()
                 await browser.close()
 
+    async def _scrape_page(
+        self,
+        page: Page,
+        skip_bet_types: list[str],
+        delay_time: Optional[int] = None,
+        parallel: bool = False,
+        max_concurrency: int = 4,
+    ) -> None:
+        """
+        渡されたページでオッズページまで遷移し、馬券種ごとのHTMLをself.htmlsに格納する。
+
+        遷移先がキャッシュ済みのレースは各馬券種のページを直接開き、
+        キャッシュがない場合や直接遷移に失敗した場合のみリンクをたどる。
+        """
+        concurrency = max_concurrency if parallel else 1
+        targets = self.resolver.get_targets(self.race_id)
+        if targets:
+            try:
+                await self._scrape_targets(page, targets, skip_bet_types, concurrency)
+                return
+            except Exception as e:
+                print(f"警告: scrape_html - キャッシュ済みの遷移先で取得できませんでした。リンクをたどって再取得します: {e}")
+                self.resolver.forget(self.race_id)
+                FETCH_RETRIES.inc(reason="stale_targets")
+        with span("browser.navigate", race_id=self.race_id):
+            await self._navigate_to_odds_page(page, delay_time)
+        targets = await self._learn_targets(page)
+        if parallel and targets:
+            await self._scrape_targets(page, targets, skip_bet_types, concurrency)
+        else:
+            await self._collect_bet_htmls(page, skip_bet_types)
+
+    async def scrape_page(
+        self,
+        page: Page,
+        skip_bet_types: list[str] = ["wakuren", "wide"],
+        delay_time: Optional[int] = None,
+        race_target: Optional[dict] = None,
+    ) -> None:
+        """
+        借りているページ（BatchScraperのタブなど）でこのレースのオッズページを取得し、
+        馬券種ごとのHTML（またはオッズの配列）を格納する。
+
+        Parameters
+        --------
+        page : Page
+            使用するページ
+        skip_bet_types : list[str], optional
+            スキップする馬券種のリスト。デフォルトは["wakuren", "wide"]
+        delay_time : int, optional
+            指定した場合、リンクのクリックごとにこの遅延（ミリ秒）を加える。
+        race_target : dict, optional
+            レース一覧で読み取ったレースのリンクの遷移先（odds_resolver.parse_link_targetの形式）。
+            指定した場合、遷移先がキャッシュされていなければトップページからたどらずにこの遷移先を開く。
+
+        Raises
+        --------
+        RuntimeError
+            馬券種タブが見つからない場合や、どの馬券種のページも取得できなかった場合
+        """
+        if race_target is None or self.resolver.get_targets(self.race_id):
+            # 遷移先がキャッシュ済みの場合は直接、レースのリンクがない場合は従来どおり遷移する
+            await self._scrape_page(page, skip_bet_types, delay_time)
+        else:
+            await self._open_target(page, race_target, race_link_name(self.race_id))
+            targets = await self._learn_targets(page)
+            if not targets:
+                raise RuntimeError("オッズページの馬券種タブが見つかりませんでした。")
+            await self._scrape_targets(page, targets, skip_bet_types)
+        if not self.htmls and not self.packed:
+            raise RuntimeError(f"{self.race_id}のオッズページを取得できませんでした。")
+
+    async def open_kaisai_page(self, page: Page, delay_time: Optional[int] = None) -> bool:
+        """
+        JRA公式サイトのトップページからオッズページを開き、開催のリンクをクリックする。
+        BatchScraperは開いたレース一覧から各レースの遷移先を読み取り、scrape_pageに渡す。
+
+        Returns
+        --------
+        bool
+            開催のレース一覧を開いた場合はTrue。
+            オッズページに開催のリンクがない場合はFalse（オッズページのまま）。
+        """
+        async with self.pacer.step():
+            with span("browser.goto"):
+                await page.goto(
+                    "https://www.jra.go.jp/keiba/",
+                    wait_until="domcontentloaded",
+                    timeout=self.pacer.timeout_ms(),
+                )
+        await self._click(
+            page, page.get_by_role("link", name="オッズ", exact=True), "オッズ", delay_time
+        )
+        kaisai_name = kaisai_link_name(self.race_id)
+        kaisai_link = page.get_by_role("link", name=kaisai_name)
+        if await kaisai_link.count() == 0:
+            return False
+        await self._click(page, kaisai_link, kaisai_name, delay_time)
+        return True
+
+    async def _navigate_to_odds_page(self, page: Page, delay_time: Optional[int] = None) -> None:
+        """
+        JRA公式サイトのトップページからリンクをたどり、レースのオッズページを開く。
+        """
+        kaisai_name = kaisai_link_name(self.race_id)
+        race_name = race_link_name(self.race_id)
+        if await self.open_kaisai_page(page, delay_time):
+            await self._click(
+                page, page.get_by_role("link", name=race_name, exact=True), race_name, delay_time
+            )
+        else:
+            # オッズページにリンクが存在しない場合、レース結果ページから遷移させる
+            await self._click(
+                page, page.get_by_role("link", name="レース結果"), "レース結果", delay_time
+            )
+            await self._click(
+                page, page.get_by_role("link", name=kaisai_name), kaisai_name, delay_time
+            )
+            await self._click(
+                page, page.get_by_role("link", name=race_name, exact=True), race_name, delay_time
+            )
+            await self._click(
+                page,
+                page.locator("#race_result").get_by_role("link", name="オッズ"),
+                "オッズ",
+                delay_time,
+            )
+        await self._wait_for_selector(page, NAV_PILLS_SELECTOR)
+
+    async def _click(
+        self, page: Page, link: Locator, name: str, delay_time: Optional[int] = None
+    ) -> None:
+        """
+        リンクをクリックし、遷移先のページのDOMContentLoadedまで待つ。
+        delay_timeを指定した場合、その遅延はodds_click_delay_seconds_totalに加算する。
+        """
+        async with self.pacer.step():
+            with span("browser.click", link=name, delay_ms=delay_time or 0):
+                async with page.expect_navigation(
+                    wait_until="domcontentloaded", timeout=self.pacer.timeout_ms()
+                ):
+                    await link.click(delay=delay_time or 0)
+        if delay_time:
+            CLICK_DELAY.inc(delay_time / 1000)
+
+    async def _wait_for_selector(self, page: Page, selector: str) -> None:
+        with span("browser.wait_for_selector", selector=selector):
+            await page.wait_for_selector(
+                selector, state="attached", timeout=self.pacer.timeout_ms()
+            )
+
+    async def _wait_for_odds(self, page: Page, bet_type: str) -> None:
+        """
+        馬券種のオッズ表が表示されるまで待つ。
+
+        オッズ表がなく馬券種タブがある場合（発売前など）は警告を出してそのまま続ける。
+        馬券種タブもない場合はオッズページではないとして例外を送出する。
+        """
+        selector = ODDS_READY_SELECTORS.get(bet_type, NAV_PILLS_SELECTOR)
+        try:
+            await self._wait_for_selector(page, selector)
+        except PlaywrightTimeoutError:
+            if await page.locator(NAV_PILLS_SELECTOR).count() == 0:
+                raise RuntimeError(f"{bet_type}のオッズページが表示されませんでした。")
+            print(f"警告: scrape_html - {bet_type}のオッズ表（{selector}）が見つかりませんでした。")
+
+    def _store_htmls(self, htmls: dict[str, str]) -> None:
+        """
+        取得したHTMLをself.htmlsに格納する。同じ馬券種の以前の配列は使わないように削除する。
+        """
+        self.htmls.update(htmls)
+        for bet_type in htmls:
+            self.packed.pop(bet_type, None)
+
+    async def _read_page(self, page: Page, bet_type: str) -> None:
+        """
+        表示中の馬券種のページから、extractionに応じてHTMLまたはオッズの配列を取り出して格納する。
+        """
+        if self.extraction == "dom" and bet_type in ODDS_READY_SELECTORS:
+            packed = await self._page_odds(page, bet_type)
+            if packed is None:
+                print(f"警告: scrape_html - {bet_type}のオッズをページ内で取り出せませんでした。HTMLを解析します。")
+                FETCH_RETRIES.inc(reason="dom_fallback")
+            elif self.verify_extraction or self.archive is not None:
+                html = await self._page_content(page, bet_type)
+                mismatched = verify_packed(bet_type, packed, html) if self.verify_extraction else []
+                self._store_htmls({bet_type: html})
+                if mismatched:
+                    print(f"警告: scrape_html - ページ内で取り出したオッズがHTMLの解析結果と一致しません: {mismatched}")
+                    FETCH_RETRIES.inc(reason="dom_mismatch")
+                else:
+                    self.packed[bet_type] = packed
+                return
+            else:
+                self.packed[bet_type] = packed
+                self.htmls.pop(bet_type, None)
+                return
+        self._store_htmls({bet_type: await self._page_content(page, bet_type)})
+
+    async def _page_odds(self, page: Page, bet_type: str) -> Optional[dict]:
+        """
+        ページ内でEXTRACT_ODDS_JSを実行し、馬番とオッズの配列を返す。オッズ表がない場合はNone。
+        転送した配列のJSONの大きさをodds_page_bytes_total（source="dom"）に加算する。
+        """
+        with span("browser.evaluate", bet_type=bet_type) as attributes:
+            packed = await page.evaluate(EXTRACT_ODDS_JS, bet_type)
+            if packed is None:
+                return None
+            attributes["values"] = packed_size(packed)
+        PAGE_BYTES.inc(len(json.dumps(packed, separators=(",", ":"))), bet_type=bet_type, source="dom")
+        return packed
+
+    async def _page_content(self, page: Page, bet_type: str) -> str:
+        """
+        ページのHTMLを返し、その大きさをodds_page_bytes_totalに加算する。
+        """
+        with span("browser.content", bet_type=bet_type) as attributes:
+            html = await page.content()
+            attributes["bytes"] = size = len(html.encode("utf-8"))
+        PAGE_BYTES.inc(size, bet_type=bet_type, source="browser")
+        return html
+
+    async def _learn_targets(self, page: Page) -> dict[str, dict]:
+        """
+        オッズページの馬券種タブから遷移先を読み取り、resolverに記録する。
+        """
+        links = await page.eval_on_selector_all(
+            "ul.nav.pills li a",
+            "els => els.map(a => [a.innerText.trim(), a.getAttribute('onclick'), a.getAttribute('href')])",
+        )
+        targets = {}
+        for bet_type_name, onclick, href in links:
+            bet_type = BET_TYPE_MAPPING.get(bet_type_name)
+            target = parse_link_target(onclick, href)
+            if bet_type is not None and target is not None:
+                targets[bet_type] = target
+        self.resolver.remember(self.race_id, targets)
+        return targets
+
+    async def _collect_bet_htmls(self, page: Page, skip_bet_types: list[str]) -> None:
+        """
+        オッズページの馬券種タブを順にクリックし、HTML（またはオッズの配列）を格納する。
+        """
+        nav_pills = page.locator("ul.nav.pills")
+        bet_type_items = nav_pills.locator("li")
+        for i in range(await bet_type_items.count()):
+            bet_item = bet_type_items.nth(i)
+            bet_link = bet_item.locator("a")
+            bet_type_name = await bet_link.inner_text()
+            bet_type = BET_TYPE_MAPPING[bet_type_name]
+            if bet_type in skip_bet_types:
+                continue
+            await self._click(page, bet_link, bet_type_name)
+            await self._wait_for_odds(page, bet_type)
+            await self._read_page(page, bet_type)
+
+    async def _scrape_targets(
+        self,
+        page: Page,
+        targets: dict[str, dict],
+        skip_bet_types: list[str],
+        max_concurrency: int = 1,
+    ) -> None:
+        """
+        記録済みの遷移先から各馬券種のページを直接開き、HTML（またはオッズの配列）を格納する。
+
+        max_concurrencyが1の場合は渡されたページで順に開く。
+        2以上の場合は同じコンテキストに馬券種ごとのタブを作り、同時に開く。
+        """
+        bet_targets = [
+            (bet_type, target)
+            for bet_type, target in targets.items()
+            if bet_type not in skip_bet_types
+        ]
+        if max_concurrency <= 1:
+            for bet_type, target in bet_targets:
+                await self._open_bet_page(page, bet_type, target)
+            return
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch_in_new_tab(bet_type: str, target: dict) -> None:
+            async with semaphore:
+                tab = await page.context.new_page()
+                try:
+                    await self._open_bet_page(tab, bet_type, target)
+                finally:
+                    await tab.close()
+
+        await asyncio.gather(
+            *(fetch_in_new_tab(bet_type, target) for bet_type, target in bet_targets)
+        )
+
+    async def _open_bet_page(self, page: Page, bet_type: str, target: dict) -> None:
+        """
+        馬券種のオッズページを開き、そのHTML（またはオッズの配列）を格納する。
+        """
+        await self._open_target(page, target, bet_type)
+        await self._wait_for_odds(page, bet_type)
+        await self._read_page(page, bet_type)
+
+    async def _open_target(self, page: Page, target: dict, name: str) -> None:
+        """
+        記録済みの遷移先をpacerの間隔・タイムアウトで開く。
+        """
+        async with self.pacer.step():
+            with span("browser.open_target", target=name):
+                await open_target(page, target, timeout=self.pacer.timeout_ms())
+
+    def extract_all(self) -> None:
+        """
+        self.htmls・self.packedに保存されている全ての馬券種についてオッズを抽出する。
+        """
+        extractors = {
+            "tanpuku": [self.extract_tansho, self.extract_fukusho],
+            "umaren": [self.extract_umaren],
+            "umatan": [self.extract_umatan],
+            "sanrenpuku": [self.extract_sanrenpuku],
+            "sanrentan": [self.extract_sanrentan],
+        }
+        for bet_type in dict.fromkeys([*self.htmls, *self.packed]):
+            for extract in extractors.get(bet_type, []):
+                extract()
+
+    async def extract_all_async(self, pool: "ExtractPool") -> None:
+        """
+        extract_allと同じ抽出をExtractPoolの別プロセスで行う。
+        解析の間もイベントループを止めないため、多数のレースを扱うサーバーで使用する。
+        self.packedに格納したオッズの配列は解析が不要なため、このプロセスで変換する。
+        """
+        htmls = {
+            bet_type: html
+            for bet_type, html in self.htmls.items()
+            if bet_type in ("tanpuku", *BET_TYPE_SHAPES) and bet_type not in self.packed
+        }
+        with span("extract.pool", race_id=self.race_id, pages=len(htmls)):
+            extracted = await pool.extract_htmls(htmls, self.horses)
+        for bet_type, packed in self.packed.items():
+            extracted.update(extract_packed(bet_type, packed, self.horses))
+        if "tanpuku" in htmls and "tansho" not in extracted:
+            print(f"警告: extract_all_async - table.tanpukuが見つかりませんでした。")
+            extracted.update(tansho={}, fukusho={})
+        for name, odds in extracted.items():
+            setattr(self, name, odds)
+            PARSED_ROWS.inc(len(odds), bet_type=name)
+
+    def _parse_tanpuku(self) -> Optional[tuple[dict[int, float], dict[int, float]]]:
+        """
+        単勝・複勝ページを解析する。同じHTMLに対する解析結果は使い回し、
+        extract_tanshoとextract_fukushoで二重に解析しないようにする。
+        ページ内で取り出した配列がある場合はHTMLの代わりにそれを使う。
+        """
+        source = self.packed.get("tanpuku", self.htmls.get("tanpuku"))
+        if self._tanpuku_parsed is None or self._tanpuku_parsed[0] is not source:
+            if isinstance(source, dict):
+                extracted = extract_packed("tanpuku", source)
+                parsed = (extracted["tansho"], extracted["fukusho"])
+            elif self.incremental is not None:
+                parsed = self.incremental.tanpuku(self.race_id, source)
+            else:
+                parsed = parse_tanpuku(source)
+            self._tanpuku_parsed = (source, parsed)
+        return self._tanpuku_parsed[1]
+
+    def _odds_table(self, bet_type: str) -> OddsTable:
+        """
+        組み合わせ馬券のオッズ表を、ページ内で取り出した配列またはHTMLから作成する。
+        """
+        packed = self.packed.get(bet_type)
+        if packed is not None:
+            return extract_packed(bet_type, packed, self.horses)[bet_type]
+        if self.incremental is not None:
+            table = self.incremental.table(self.race_id, bet_type, self.htmls[bet_type])
+            return table.containing_any(self.horses) if self.horses is not None else table
+        return OddsTable.from_rows(
+            bet_type, filter_rows(iter_odds(bet_type, self.htmls[bet_type]), self.horses)
+        )
+
+    @_extract_step("tansho")
     def extract_tansho(self) -> None:
         """
         単勝オッズのHTMLを解析し、{馬番: オッズ}の辞書をself.tanshoに保存する。
-        self.htmls["tanpuku"]に保存されたHTMLを解析対象とする。
+        self.htmls["tanpuku"]に保存されたHTML（self.packedに配列がある場合はそれ）を解析対象とする。
         """
-        if "tanpuku" not in self.htmls:
+        if "tanpuku" not in self.htmls and "tanpuku" not in self.packed:
             print(f"警告: extract_tansho - self.htmlsに'tanpuku'キーが存在しません。")
             print(f"利用可能なキー: {list(self.htmls.keys())}")
             self.tansho = {}
             return
-        
-        soup = BeautifulSoup(self.htmls["tanpuku"], "lxml")
-        # 単勝・複勝オッズテーブルを取得
-        odds_table = soup.select_one("table.tanpuku")
-        if not odds_table:
+
+        parsed = self._parse_tanpuku()
+        if parsed is None:
             print(f"警告: extract_tansho - table.tanpukuが見つかりませんでした。")
             self.tansho = {}
             return
-        
-        # テーブルの行を取得
-        rows = odds_table.select("tbody tr")
-        odds_data = {}
-        for row in rows:
-            # 馬番を取得
-            umaban_elem = row.select_one("td.num")
-            if not umaban_elem:
-                print(f"No <td.num>")
-                continue
-            umaban = umaban_elem.text.strip()
-            # 単勝オッズを取得
-            tan_odds_elem = row.select_one("td.odds_tan")
-            if not tan_odds_elem:
-                print(f"No <td.odds_tan>")
-                continue
-            tan_odds = tan_odds_elem.text.strip().replace(",", "")
-            try:
-                odds_data[int(umaban)] = float(tan_odds)
-            except ValueError:
-                pass
-        self.tansho = odds_data
-        print(f"情報: extract_tansho - 単勝オッズを{len(odds_data)}件取得しました。")
+        self.tansho = filter_horses(parsed[0], self.horses)
+        print(f"情報: extract_tansho - 単勝オッズを{len(self.tansho)}件取得しました。")
 
+    @_extract_step("fukusho")
     def extract_fukusho(self) -> None:
         """
         複勝オッズのHTMLを解析し、{馬番: オッズ下限}の辞書をself.fukushoに保存する。
-        self.htmls["tanpuku"]に保存されたHTMLを解析対象とする。
+        self.htmls["tanpuku"]に保存されたHTML（self.packedに配列がある場合はそれ）を解析対象とする。
         複勝オッズは範囲（下限・上限）があるため、下限（最小値）を取得する。
         """
-        if "tanpuku" not in self.htmls:
+        if "tanpuku" not in self.htmls and "tanpuku" not in self.packed:
             print(f"警告: extract_fukusho - self.htmlsに'tanpuku'キーが存在しません。")
             print(f"利用可能なキー: {list(self.htmls.keys())}")
             self.fukusho = {}
             return
-        
-        soup = BeautifulSoup(self.htmls["tanpuku"], "lxml")
-        # 単勝・複勝オッズテーブルを取得
-        odds_table = soup.select_one("table.tanpuku")
-        if not odds_table:
+
+        parsed = self._parse_tanpuku()
+        if parsed is None:
             print(f"警告: extract_fukusho - table.tanpukuが見つかりませんでした。")
             self.fukusho = {}
             return
-        
-        # テーブルの行を取得
-        rows = odds_table.select("tbody tr")
-        odds_data = {}
-        
-        # デバッグ用: 最初の行のtd要素のクラス名を確認
-        if rows:
-            first_row = rows[0]
-            all_tds = first_row.select("td")
-            td_classes = [td.get("class", []) for td in all_tds]
-            print(f"デバッグ: extract_fukusho - 最初の行のtdクラス: {td_classes}")
-        
-        for row in rows:
-            # 馬番を取得
-            umaban_elem = row.select_one("td.num")
-            if not umaban_elem:
-                print(f"警告: extract_fukusho - <td.num>が見つかりませんでした。")
-                continue
-            umaban = umaban_elem.text.strip()
-            
-            # 複勝オッズを取得（複数の可能性のあるクラス名を試す）
-            fuku_odds_elem = None
-            
-            # 複数の可能性のあるクラス名を試す（td.odds_fukuを優先）
-            possible_classes = [
-                "td.odds_fuku",  # 最も一般的なクラス名
-                "td.odds_fukusho",
-                "td.odds_fuku1",
-                "td.odds_fuku2",
-                "td.odds_fuku3",
-            ]
-            
-            for class_name in possible_classes:
-                fuku_odds_elem = row.select_one(class_name)
-                if fuku_odds_elem:
-                    break
-            
-            # 上記のクラス名で見つからない場合、td要素を順に確認
-            if not fuku_odds_elem:
-                all_tds = row.select("td")
-                for td in all_tds:
-                    td_class = td.get("class", [])
-                    # odds_fukuを含むクラス名を探す
-                    if any("fuku" in str(c).lower() for c in td_class):
-                        fuku_odds_elem = td
-                        break
-                    # または、単勝オッズの後に来るtd要素を確認
-                    # (単勝オッズがodds_tanの場合、その次のtdが複勝オッズの可能性)
-            
-            # 最後の手段1: 単勝オッズのtdの次のtd要素を確認
-            if not fuku_odds_elem:
-                tan_odds_elem = row.select_one("td.odds_tan")
-                if tan_odds_elem:
-                    # 単勝オッズのtdの次の兄弟要素（td）を取得
-                    next_td = tan_odds_elem.find_next_sibling("td")
-                    if next_td:
-                        # 単勝オッズのクラス名ではないことを確認
-                        next_td_class = next_td.get("class", [])
-                        if "odds_tan" not in str(next_td_class).lower():
-                            fuku_odds_elem = next_td
-            
-            # 最後の手段2: td要素のインデックスで判断（単勝オッズの次のtd）
-            if not fuku_odds_elem:
-                all_tds = row.select("td")
-                tan_odds_idx = None
-                for idx, td in enumerate(all_tds):
-                    if "odds_tan" in str(td.get("class", [])).lower():
-                        tan_odds_idx = idx
-                        break
-                if tan_odds_idx is not None and tan_odds_idx + 1 < len(all_tds):
-                    next_td = all_tds[tan_odds_idx + 1]
-                    # 単勝オッズのクラス名ではないことを確認
-                    next_td_class = next_td.get("class", [])
-                    if "odds_tan" not in str(next_td_class).lower():
-                        fuku_odds_elem = next_td
-            
-            if not fuku_odds_elem:
-                # デバッグ出力: この行のすべてのtd要素を確認
-                all_tds = row.select("td")
-                td_info = [
-                    {
-                        "class": td.get("class", []),
-                        "text": td.text.strip()[:20],
-                    }
-                    for td in all_tds
-                ]
-                print(f"警告: extract_fukusho - 馬番{umaban}の複勝オッズtdが見つかりません。td情報: {td_info}")
-                continue
-            
-            # 複勝オッズの下限（最小値）を取得（span.minから）
-            min_odds_span = fuku_odds_elem.select_one("span.min")
-            if not min_odds_span:
-                print(f"警告: extract_fukusho - 馬番{umaban}の<span.min>が見つかりませんでした。")
-                continue
-            
-            fuku_odds_low = min_odds_span.text.strip().replace(",", "")
-            try:
-                # 複勝オッズの下限（最小値）を取得
-                odds_data[int(umaban)] = float(fuku_odds_low)
-            except ValueError as e:
-                print(f"警告: extract_fukusho - 馬番{umaban}の複勝オッズ下限変換エラー: {fuku_odds_low}, エラー: {e}")
-                pass
-        
-        self.fukusho = odds_data
-        print(f"情報: extract_fukusho - 複勝オッズを{len(odds_data)}件取得しました。")
+        self.fukusho = filter_horses(parsed[1], self.horses)
+        print(f"情報: extract_fukusho - 複勝オッズを{len(self.fukusho)}件取得しました。")
 
+    @_extract_step("umaren")
     def extract_umaren(self) -> None:
         """
-        馬連オッズのHTMLを解析し、{馬番の組み合わせ: オッズ}の辞書をself.umarenに保存する。
-        self.htmls["umaren"]に保存されたHTMLを解析対象とする。
+        馬連オッズのHTMLを解析し、{馬番の組み合わせ: オッズ}のOddsTableをself.umarenに保存する。
+        self.htmls["umaren"]に保存されたHTML（self.packedに配列がある場合はそれ）を解析対象とする。
         """
-        if "umaren" not in self.htmls:
+        if "umaren" not in self.htmls and "umaren" not in self.packed:
             print(f"警告: extract_umaren - self.htmlsに'umaren'キーが存在しません。")
             print(f"利用可能なキー: {list(self.htmls.keys())}")
-            self.umaren = {}
+            self.umaren = OddsTable("umaren")
             return
-        
-        soup = BeautifulSoup(self.htmls["umaren"], "lxml")
-        odds_data = {}
-        list_blocks = soup.select("ul.umaren_list")
-        for list_block in list_blocks:
-            table_elements = list_block.select("li")
-            for table_element in table_elements:
-                # テーブルのキャプションから第一馬番を取得
-                caption = table_element.select_one("caption")
-                if not caption:
-                    print(f"No <caption>")
-                    continue
-                first_horse = caption.text.strip()
-                rows = table_element.select("tbody tr")
-                for row in rows:
-                    second_horse_elem = row.select_one("th")
-                    if not second_horse_elem:
-                        print(f"No <th>")
-                        continue
-                    second_horse = second_horse_elem.text.strip()
-                    odds_td = row.select_one("td")
-                    if not odds_td:
-                        print(f"No <td>")
-                        continue
-                    odds_text = odds_td.text.strip().replace(",", "")
-                    kumi = f"{first_horse.zfill(2)},{second_horse.zfill(2)}"
-                    try:
-                        odds_data[kumi] = float(odds_text)
-                    except ValueError:
-                        pass
-        self.umaren = odds_data
 
+        self.umaren = self._odds_table("umaren")
+
+    @_extract_step("umatan")
     def extract_umatan(self) -> None:
         """
-        馬単オッズのHTMLを解析し、{馬番の組み合わせ: オッズ}の辞書をself.umatanに保存する。
-        self.htmls["umatan"]に保存されたHTMLを解析対象とする。
-        """
-        soup = BeautifulSoup(self.htmls["umatan"], "lxml")
-        odds_data = {}
-        list_blocks = soup.select("ul.umatan_list")
-        for list_block in list_blocks:
-            table_elements = list_block.select("li")
-            for table_element in table_elements:
-                # テーブルのキャプションから1着馬番を取得
-                caption = table_element.select_one("caption")
-                if not caption:
-                    print(f"No <caption>")
-                    continue
-                first_horse = caption.text.strip()
-                rows = table_element.select("tbody tr")
-                for row in rows:
-                    second_horse_element = row.select_one("th")
-                    if not second_horse_element:
-                        print(f"No <th>")
-                        continue
-                    second_horse = second_horse_element.text.strip()
-                    odds_td = row.select_one("td")
-                    if not odds_td:
-                        print(f"No <td>")
-                        continue
-                    odds_text = odds_td.text.strip().replace(",", "")
-                    # 組み合わせの作成（2桁,2桁の形式）
-                    kumi = f"{first_horse.zfill(2)},{second_horse.zfill(2)}"
-                    try:
-                        odds_data[kumi] = float(odds_text)
-                    except ValueError:
-                        pass
-        self.umatan = odds_data
+        馬単オッズのHTMLを解析し、{馬番の組み合わせ: オッズ}のOddsTableをself.umatanに保存する。
+        self.htmls["umatan"]に保存されたHTML（self.packedに配列がある場合はそれ）を解析対象とする。
+        """
+        self.umatan = self._odds_table("umatan")
 
+    @_extract_step("sanrenpuku")
     def extract_sanrenpuku(self) -> None:
         """
-        3連複オッズのHTMLを解析し、{馬番の組み合わせ: オッズ}の辞書をself.sanrenpukuに保存する。
-        self.htmls["sanrenpuku"]に保存されたHTMLを解析対象とする。
-        """
-        soup = BeautifulSoup(self.htmls["sanrenpuku"], "lxml")
-        odds_data = {}
-        fuku3_units = soup.select("div.fuku3_unit")
-        for unit in fuku3_units:
-            # 1頭目の馬番を取得
-            first_horse_elem = unit.select_one("h4 span.inner span.num")
-            if not first_horse_elem:
-                print(f"No <span.num>")
-                continue
-            first_horse = first_horse_elem.text.strip()
-            list_blocks = unit.select("ul.fuku3_list")
-            for list_block in list_blocks:
-                list_items = list_block.select("li")
-                for item in list_items:
-                    # 2頭目の馬番を取得
-                    caption = item.select_one("table caption")
-                    if not caption:
-                        print(f"No <caption>")
-                        continue
-                    caption_text = caption.text
-                    second_horse_match = re.search(r"(\d+)-(\d+)", caption_text)
-                    if not second_horse_match:
-                        print(f"No match")
-                        continue
-                    second_horse = second_horse_match.group(2)
-                    rows = item.select("table tbody tr")
-                    for row in rows:
-                        # 3頭目の馬番を取得
-                        third_horse_elem = row.select_one("th")
-                        if not third_horse_elem:
-                            print(f"No <th>")
-                            continue
-                        third_horse = third_horse_elem.text.strip()
-                        # オッズを取得
-                        odds_td = row.select_one("td")
-                        if not odds_td:
-                            print(f"No <td>")
-                            continue
-                        odds_text = odds_td.text.strip().replace(",", "")
-                        # 組み合わせの作成（2桁,2桁,2桁の形式）
-                        kumi = f"{first_horse.zfill(2)},{second_horse.zfill(2)},{third_horse.zfill(2)}"
-                        try:
-                            odds_data[kumi] = float(odds_text)
-                        except ValueError:
-                            pass
-        self.sanrenpuku = odds_data
+        3連複オッズのHTMLを解析し、{馬番の組み合わせ: オッズ}のOddsTableをself.sanrenpukuに保存する。
+        self.htmls["sanrenpuku"]に保存されたHTML（self.packedに配列がある場合はそれ）を解析対象とする。
+        """
+        self.sanrenpuku = self._odds_table("sanrenpuku")
 
+    @_extract_step("sanrentan")
     def extract_sanrentan(self) -> None:
         """
-        3連単オッズのHTMLを解析し、{馬番の組み合わせ: オッズ}の辞書をself.sanrentanに保存する。
-        self.htmls["sanrentan"]に保存されたHTMLを解析対象とする。
-        """
-        soup = BeautifulSoup(self.htmls["sanrentan"], "lxml")
-        odds_data = {}
-        tan3_units = soup.select("div.tan3_unit")
-        for unit in tan3_units:
-            # 1着馬の番号を取得
-            first_horse_elem = unit.select_one("span.num")
-            if not first_horse_elem:
-                print(f"No <span.num>")
-                continue
-            first_horse = first_horse_elem.text.strip()
-            list_blocks = unit.select("ul.tan3_list")
-            for list_block in list_blocks:
-                list_items = list_block.select("li")
-                for item in list_items:
-                    # 2着馬の番号を取得
-                    second_horse_elem = item.select_one(
-                        "div.p_line:nth-of-type(2) div.num"
-                    )
-                    if not second_horse_elem:
-                        print(f"No <div.num>")
-                        continue
-                    second_horse = second_horse_elem.text.strip()
-                    rows = item.select("table.tan3 tbody tr")
-                    for row in rows:
-                        # 3着馬の番号を取得
-                        third_horse_elem = row.select_one("th")
-                        if not third_horse_elem:
-                            print(f"No <th>")
-                            continue
-                        third_horse = third_horse_elem.text.strip()
-                        # オッズ値を取得
-                        odds_td = row.select_one("td")
-                        if not odds_td:
-                            print(f"No <td>")
-                            continue
-                        odds_text = odds_td.text.strip().replace(",", "")
-                        kumi = f"{first_horse.zfill(2)},{second_horse.zfill(2)},{third_horse.zfill(2)}"
-                        try:
-                            odds_data[kumi] = float(odds_text)
-                        except ValueError:
-                            pass
-        self.sanrentan = odds_data
+        3連単オッズのHTMLを解析し、{馬番の組み合わせ: オッズ}のOddsTableをself.sanrentanに保存する。
+        self.htmls["sanrentan"]に保存されたHTML（self.packedに配列がある場合はそれ）を解析対象とする。
+        """
+        self.sanrentan = self._odds_table("sanrentan")
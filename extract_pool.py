@@ -0,0 +1,85 @@
+"""
+オッズ抽出のプロセスプール
+
+概要:
+    3連単（最大4,896通り）や3連複のページの解析はCPUを使い続けるため、
+    イベントループのスレッドで実行すると他の非同期処理（他レースの取得やAPIの応答）が止まる。
+    ExtractPoolはodds_parser.extract_pageをProcessPoolExecutorで実行し、
+    イベントループを止めずに全てのCPUコアで解析する。
+
+使用例:
+    async with ExtractPool() as pool:
+        await odds.scrape_html()
+        await odds.extract_all_async(pool)
+
+制限事項:
+    - HTMLと抽出結果はプロセス間でpickleして受け渡すため、単勝・複勝のような
+      小さなページでは解析時間より受け渡しの時間の方が長くなることがある
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Optional
+
+from odds_parser import extract_page
+
+
+class ExtractPool:
+    """
+    odds_parser.extract_pageを別プロセスで実行するプール。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        Parameters
+        --------
+        max_workers : int, optional
+            プロセス数。指定しない場合はCPUコア数
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def __aenter__(self) -> "ExtractPool":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # プロセスは最初の抽出時に起動する
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def extract(
+        self, bet_type: str, html: str, horses: Optional[Iterable[int]] = None
+    ) -> dict[str, Any]:
+        """
+        1つの馬券種のページを別プロセスで解析する（引数・戻り値はextract_pageと同じ）。
+        """
+        loop = asyncio.get_running_loop()
+        if horses is not None:
+            horses = frozenset(horses)
+        return await loop.run_in_executor(
+            self._get_executor(), extract_page, bet_type, html, horses
+        )
+
+    async def extract_htmls(
+        self, htmls: dict[str, str], horses: Optional[Iterable[int]] = None
+    ) -> dict[str, Any]:
+        """
+        馬券種ごとのページを同時に解析し、{RealtimeOddsの属性名: オッズ}をまとめて返す。
+        """
+        results = await asyncio.gather(
+            *(self.extract(bet_type, html, horses) for bet_type, html in htmls.items())
+        )
+        extracted = {}
+        for result in results:
+            extracted.update(result)
+        return extracted
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
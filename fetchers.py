@@ -0,0 +1,258 @@
+"""
+オッズページHTMLの取得バックエンド
+
+概要:
+    RealtimeOddsがHTMLを取得する手段を差し替えられるようにする。
+    HttpFetcherはブラウザを起動せず、JRA公式サイトのdoActionフォームPOSTを
+    HTTPクライアントで再現してオッズページを取得する。
+    失敗した場合、RealtimeOdds.scrape_htmlは従来のPlaywrightによる取得に切り替える。
+
+使用例:
+    async with HttpFetcher() as fetcher:
+        odds = RealtimeOdds(race_id, fetcher=fetcher)
+        await odds.scrape_html()
+
+制限事項:
+    - JavaScriptで描画される要素には対応しないため、サイト構造が変わった場合は
+      Playwrightでの取得にフォールバックする
+"""
+
+import re
+from typing import Optional
+
+import httpx
+from bs4 import BeautifulSoup
+
+from extract_odds import BET_TYPE_MAPPING, kaisai_link_name, race_link_name
+from odds_metrics import FETCH_RETRIES, PAGE_BYTES, span
+from odds_pacing import RateLimiter
+from odds_resolver import JRA_BASE_URL, OddsPageResolver, default_resolver, parse_link_target
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept-Language": "ja,en;q=0.8",
+}
+META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+# オッズページであることの判定に使う馬券種タブ（ul.nav.pills）
+NAV_PILLS_PATTERN = re.compile(r"""<ul[^>]*class=["'][^"']*\bnav\b[^"']*\bpills\b""")
+
+
+class HtmlFetcher:
+    """
+    オッズページのHTMLを取得するバックエンドの基底クラス。
+    """
+
+    async def fetch(self, race_id: str, skip_bet_types: list[str]) -> dict[str, str]:
+        """
+        レースの馬券種ごとのオッズページHTMLを取得する。
+
+        Parameters
+        --------
+        race_id : str
+            JRA形式のrace_id
+        skip_bet_types : list[str]
+            スキップする馬券種のリスト
+
+        Returns
+        --------
+        dict[str, str]
+            {馬券種: HTML}の辞書。取得できなかった場合は例外を送出する。
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "HtmlFetcher":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+class HttpFetcher(HtmlFetcher):
+    """
+    HTTPクライアントでJRA公式サイトのオッズページを取得するバックエンド。
+
+    コネクションはクライアント内でkeep-aliveされ、同じインスタンスで続けて取得する場合は再利用される。
+    遷移先はPlaywrightでの取得と同じOddsPageResolverに記録されるため、
+    どちらかで一度たどったレースはもう一方でも直接開ける。
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        resolver: Optional[OddsPageResolver] = None,
+        base_url: str = JRA_BASE_URL,
+        timeout: float = 10.0,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        """
+        Parameters
+        --------
+        client : httpx.AsyncClient, optional
+            使用するHTTPクライアント。指定しない場合は作成し、close()で閉じる。
+        resolver : OddsPageResolver, optional
+            オッズページの遷移先キャッシュ。指定しない場合はプロセス内で共有されるものを使用する。
+        base_url : str, optional
+            JRA公式サイトのURL。ローカルのテスト用サーバーに向ける場合に変更する。
+        timeout : float, optional
+            1リクエストあたりのタイムアウト（秒）。デフォルトは10.0
+        rate_limiter : RateLimiter, optional
+            指定した場合、リクエスト（POST・GET）ごとに1トークンを取得してから送る。
+        """
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        self.resolver = resolver if resolver is not None else default_resolver
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+
+    async def close(self) -> None:
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def fetch(self, race_id: str, skip_bet_types: list[str]) -> dict[str, str]:
+        targets = self.resolver.get_targets(race_id)
+        if targets:
+            try:
+                return await self._fetch_targets(targets, skip_bet_types)
+            except Exception as e:
+                print(f"警告: HttpFetcher - キャッシュ済みの遷移先で取得できませんでした。リンクをたどって再取得します: {e}")
+                self.resolver.forget(race_id)
+                FETCH_RETRIES.inc(reason="stale_targets")
+        with span("http.navigate", race_id=race_id):
+            odds_html = await self._navigate_to_odds_page(race_id)
+        targets = self._find_bet_targets(odds_html)
+        if not targets:
+            raise RuntimeError("オッズページの馬券種タブが見つかりませんでした。")
+        self.resolver.remember(race_id, targets)
+        return await self._fetch_targets(targets, skip_bet_types)
+
+    async def fetch_kaisai_list(self) -> str:
+        """
+        トップページから「オッズ」のリンクをたどり、開催の一覧（オッズのメニューページ）のHTMLを返す。
+        """
+        html = await self._get(self.base_url + "keiba/")
+        return await self._follow(html, "オッズ", exact=True)
+
+    async def _navigate_to_odds_page(self, race_id: str) -> str:
+        """
+        トップページからリンクをたどり、レースのオッズページ（単勝・複勝）のHTMLを返す。
+        RealtimeOdds._navigate_to_odds_pageと同じ経路をHTTPリクエストで再現する。
+        """
+        kaisai_name = kaisai_link_name(race_id)
+        race_name = race_link_name(race_id)
+        html = await self.fetch_kaisai_list()
+        kaisai_target = self._find_link(html, kaisai_name)
+        if kaisai_target is not None:
+            html = await self._request(kaisai_target)
+            return await self._follow(html, race_name, exact=True)
+        # オッズページにリンクが存在しない場合、レース結果ページから遷移させる
+        html = await self._follow(html, "レース結果")
+        html = await self._follow(html, kaisai_name)
+        html = await self._follow(html, race_name, exact=True)
+        return await self._follow(html, "オッズ", scope="#race_result")
+
+    async def _fetch_targets(
+        self, targets: dict[str, dict], skip_bet_types: list[str]
+    ) -> dict[str, str]:
+        htmls = {}
+        for bet_type, target in targets.items():
+            if bet_type in skip_bet_types:
+                continue
+            html = await self._request(target)
+            if not NAV_PILLS_PATTERN.search(html):
+                raise RuntimeError(f"{bet_type}のオッズページが表示されませんでした。")
+            PAGE_BYTES.inc(len(html.encode("utf-8")), bet_type=bet_type, source="http")
+            htmls[bet_type] = html
+        return htmls
+
+    async def _follow(
+        self, html: str, name: str, exact: bool = False, scope: Optional[str] = None
+    ) -> str:
+        target = self._find_link(html, name, exact=exact, scope=scope)
+        if target is None:
+            raise RuntimeError(f"リンク「{name}」が見つかりませんでした。")
+        return await self._request(target)
+
+    def _find_link(
+        self, html: str, name: str, exact: bool = False, scope: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        リンク名でリンクを探し、遷移先を返す。
+        Playwrightのget_by_roleと同様に、exact=Falseの場合は部分一致で探す。
+        """
+        soup = BeautifulSoup(html, "lxml")
+        root = soup.select_one(scope) if scope else soup
+        if root is None:
+            return None
+        for link in root.find_all("a"):
+            text = " ".join(link.get_text().split())
+            if (text == name) if exact else (name in text):
+                target = parse_link_target(link.get("onclick"), link.get("href"))
+                if target is not None:
+                    return target
+        return None
+
+    def _find_bet_targets(self, html: str) -> dict[str, dict]:
+        soup = BeautifulSoup(html, "lxml")
+        targets = {}
+        for link in soup.select("ul.nav.pills li a"):
+            bet_type = BET_TYPE_MAPPING.get(link.get_text(strip=True))
+            target = parse_link_target(link.get("onclick"), link.get("href"))
+            if bet_type is not None and target is not None:
+                targets[bet_type] = target
+        return targets
+
+    async def _request(self, target: dict) -> str:
+        url = self._rebase(target["url"])
+        if target["cname"] is None:
+            return await self._get(url)
+        await self._wait_for_rate_limit()
+        with span("http.request", method="POST", url=url, cname=target["cname"]) as attributes:
+            response = await self.client.post(url, data={"cname": target["cname"]})
+            attributes.update(http_status=response.status_code, bytes=len(response.content))
+            response.raise_for_status()
+        return self._decode(response)
+
+    async def _get(self, url: str) -> str:
+        await self._wait_for_rate_limit()
+        with span("http.request", method="GET", url=url) as attributes:
+            response = await self.client.get(url)
+            attributes.update(http_status=response.status_code, bytes=len(response.content))
+            response.raise_for_status()
+        return self._decode(response)
+
+    async def _wait_for_rate_limit(self) -> None:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+
+    def _rebase(self, url: str) -> str:
+        """
+        遷移先のURLをbase_urlに合わせる（テスト用サーバーを使う場合のため）。
+        """
+        if self.base_url != JRA_BASE_URL and url.startswith(JRA_BASE_URL):
+            return self.base_url + url[len(JRA_BASE_URL):]
+        return url
+
+    @staticmethod
+    def _decode(response: httpx.Response) -> str:
+        """
+        レスポンスを文字列に変換する。
+        JRA公式サイトはShift_JISのため、ヘッダーに文字コードがない場合はmetaタグから判定する。
+        """
+        encoding = response.charset_encoding
+        if encoding is None:
+            match = META_CHARSET_PATTERN.search(response.content[:2048])
+            encoding = match.group(1).decode("ascii") if match else "utf-8"
+        if encoding.lower().replace("-", "_") in ("shift_jis", "sjis", "x_sjis"):
+            encoding = "cp932"
+        return response.content.decode(encoding, errors="replace")
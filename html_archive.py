@@ -0,0 +1,201 @@
+"""
+オッズページHTMLのアーカイブ
+
+概要:
+    取得したオッズページのHTMLを内容のハッシュ（SHA-256）をキーにzstdで圧縮して保存し、
+    レース・馬券種ごとにどの時刻にどのHTMLを取得したかを索引として記録する。
+    前回の取得と同じ内容のHTMLは保存も索引への追記も行わない。
+    保存したHTMLはRealtimeOddsのリプレイ（replay=True）でネットワークの代わりに読み込めるため、
+    抽出処理を変更した際に過去のページで再実行したり、解析のベンチマークに使用できる。
+
+保存形式:
+    HTML_DIR/objects/ab/abcdef....html.zst   HTML本体（ハッシュの先頭2文字でディレクトリを分ける）
+    HTML_DIR/index/202505010411.jsonl       {"timestamp", "bet_type", "digest"}の行
+
+使用例:
+    archive = HtmlArchive()
+    odds = RealtimeOdds(race_id, archive=archive)   # 取得したHTMLを保存する
+    await odds.scrape_html()
+
+    replay = RealtimeOdds(race_id, archive=archive, replay=True)   # ネットワークを使わない
+    await replay.scrape_html()
+    replay.extract_all()
+"""
+
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+import zstandard
+
+from extract_odds import HTML_DIR
+
+
+class HtmlArchive:
+    """
+    オッズページのHTMLを内容で重複排除して圧縮保存するアーカイブ。
+    """
+
+    def __init__(self, root: Path = HTML_DIR, level: int = 10):
+        """
+        Parameters
+        --------
+        root : Path, optional
+            保存先のディレクトリ。デフォルトはHTML_DIR
+        level : int, optional
+            zstdの圧縮レベル。デフォルトは10
+        """
+        self.root = Path(root)
+        self.level = level
+        self._last_digests: dict[str, dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}.html.zst"
+
+    def _index_path(self, race_id: str) -> Path:
+        return self.root / "index" / f"{race_id}.jsonl"
+
+    def _write_object(self, digest: str, data: bytes) -> bool:
+        """
+        HTMLを保存する。同じ内容のHTMLが保存済みの場合は何もせずFalseを返す。
+        """
+        path = self._object_path(digest)
+        if path.exists():
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(zstandard.ZstdCompressor(level=self.level).compress(data))
+        tmp_path.replace(path)
+        return True
+
+    def read_object(self, digest: str) -> str:
+        """
+        ハッシュを指定してHTMLを読み込む。
+        """
+        data = self._object_path(digest).read_bytes()
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+
+    def history(self, race_id: str) -> list[dict]:
+        """
+        レースの索引（{"timestamp", "bet_type", "digest"}のリスト、取得時刻順）を返す。
+        """
+        path = self._index_path(race_id)
+        if not path.exists():
+            return []
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _last_digests_for(self, race_id: str) -> dict[str, str]:
+        if race_id not in self._last_digests:
+            self._last_digests[race_id] = {
+                entry["bet_type"]: entry["digest"] for entry in self.history(race_id)
+            }
+        return self._last_digests[race_id]
+
+    def save(self, race_id: str, htmls: dict[str, str], timestamp: Optional[float] = None) -> int:
+        """
+        馬券種ごとのHTMLを保存する。前回の取得から変化のない馬券種は記録しない。
+
+        Parameters
+        --------
+        race_id : str
+            JRA形式のrace_id
+        htmls : dict[str, str]
+            {馬券種: HTML}（RealtimeOdds.htmls）
+        timestamp : float, optional
+            取得時刻（UNIX時間、秒）。指定しない場合は現在時刻
+
+        Returns
+        --------
+        int
+            索引に追記した馬券種の数
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        entries = []
+        with self._lock:
+            last_digests = self._last_digests_for(race_id)
+            for bet_type, html in htmls.items():
+                data = html.encode("utf-8")
+                digest = hashlib.sha256(data).hexdigest()
+                if last_digests.get(bet_type) == digest:
+                    continue
+                self._write_object(digest, data)
+                last_digests[bet_type] = digest
+                entries.append({"timestamp": timestamp, "bet_type": bet_type, "digest": digest})
+            if entries:
+                path = self._index_path(race_id)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        return len(entries)
+
+    def load(
+        self,
+        race_id: str,
+        at: Optional[float] = None,
+        skip_bet_types: list[str] = [],
+    ) -> dict[str, str]:
+        """
+        指定した時刻の時点で最新のHTMLを馬券種ごとに返す。
+
+        Parameters
+        --------
+        race_id : str
+            JRA形式のrace_id
+        at : float, optional
+            時刻（UNIX時間、秒）。指定しない場合は最後に保存したHTML
+        skip_bet_types : list[str], optional
+            読み込まない馬券種のリスト
+
+        Returns
+        --------
+        dict[str, str]
+            {馬券種: HTML}。保存されていない場合は空の辞書。
+        """
+        digests = {}
+        for entry in self.history(race_id):
+            if at is not None and entry["timestamp"] > at:
+                break
+            if entry["bet_type"] not in skip_bet_types:
+                digests[entry["bet_type"]] = entry["digest"]
+        return {bet_type: self.read_object(digest) for bet_type, digest in digests.items()}
+
+    def race_ids(self) -> list[str]:
+        """
+        HTMLを保存済みのrace_idのリストを返す。
+        """
+        return sorted(path.stem for path in (self.root / "index").glob("*.jsonl"))
+
+    def iter_snapshots(
+        self, race_ids: Optional[list[str]] = None
+    ) -> Iterator[tuple[str, float, dict[str, str]]]:
+        """
+        保存した全ての取得時点を(race_id, 取得時刻, {馬券種: HTML})として順に返す。
+        HTMLは変化した馬券種だけでなく、その時点の全馬券種を含む。
+        抽出処理の変更を過去のページでまとめて再実行する場合などに使用する。
+        """
+        for race_id in race_ids if race_ids is not None else self.race_ids():
+            digests = {}
+            htmls = {}
+            for timestamp, entries in _group_by_timestamp(self.history(race_id)):
+                for entry in entries:
+                    if digests.get(entry["bet_type"]) != entry["digest"]:
+                        digests[entry["bet_type"]] = entry["digest"]
+                        htmls[entry["bet_type"]] = self.read_object(entry["digest"])
+                yield race_id, timestamp, dict(htmls)
+
+
+def _group_by_timestamp(entries: list[dict]) -> Iterator[tuple[float, list[dict]]]:
+    group: list[dict] = []
+    for entry in entries:
+        if group and entry["timestamp"] != group[0]["timestamp"]:
+            yield group[0]["timestamp"], group
+            group = []
+        group.append(entry)
+    if group:
+        yield group[0]["timestamp"], group
@@ -0,0 +1,315 @@
+"""
+オッズ取得結果のキャッシュ
+
+概要:
+    RealtimeOddsによる取得結果を(race_id, 馬券種の組)ごとに一定時間（TTL）保持し、
+    同じレースへの問い合わせでブラウザやHTTPでの取得を繰り返さないようにする。
+    同じキーへの同時リクエストは1回の取得にまとめ、結果を全員に返す。
+
+主な機能:
+    - MemoryBackend: プロセス内のLRUキャッシュ（スレッドセーフ）
+    - DiskBackend: ディレクトリに保存するキャッシュ。複数のワーカープロセスで共有でき、
+      ロックファイルでプロセスをまたいだ同時取得もまとめる
+    - 環境変数 ODDS_CACHE_DIR / ODDS_CACHE_TTL で既定のキャッシュを切り替え
+
+使用例:
+    cache = OddsCache(ttl=30)
+    odds = await cache.get_or_fetch(race_id, ["tanpuku", "umaren"], lambda: scrape(race_id))
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from odds_metrics import CACHE_REQUESTS
+
+
+def cache_key(race_id: str, bet_types: Iterable[str]) -> str:
+    """
+    race_idと馬券種の組からキャッシュのキーを作成する（馬券種の順序は問わない）。
+    """
+    return f"{race_id}:{','.join(sorted(set(bet_types)))}"
+
+
+class MemoryBackend:
+    """
+    プロセス内で保持するLRUキャッシュ。
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[tuple[float, Any]]:
+        """
+        (保存時刻, 値)を返す。存在しない場合はNone。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def try_lock(self, key: str) -> bool:
+        # プロセス内の同時取得はOddsCache側でまとめるため、常に取得できる
+        return True
+
+    def unlock(self, key: str) -> None:
+        pass
+
+
+class DiskBackend:
+    """
+    ディレクトリにpickleで保存するキャッシュ。複数のプロセスから同じディレクトリを共有できる。
+
+    LRUの判定にはファイルの更新時刻を使い、読み込み時に更新時刻を進める。
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_entries: int = 1024,
+        lock_timeout: float = 120.0,
+    ):
+        """
+        Parameters
+        --------
+        cache_dir : Path
+            保存先のディレクトリ
+        max_entries : int, optional
+            保持する最大件数。超えた場合は最も古く使われたものから削除する。デフォルトは1024
+        lock_timeout : float, optional
+            取得中を示すロックファイルを無効とみなすまでの秒数（取得したプロセスが落ちた場合のため）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.lock_timeout = lock_timeout
+
+    def _path(self, key: str, suffix: str = ".pkl") -> Path:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{digest}{suffix}"
+
+    def get(self, key: str) -> Optional[tuple[float, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, stored_at, value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        if stored_key != key:
+            return None
+        return stored_at, value
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump((key, time.time(), value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path.replace(path)
+        except OSError as e:
+            print(f"警告: DiskBackend - キャッシュを保存できませんでした: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        self._evict()
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def try_lock(self, key: str) -> bool:
+        """
+        キーの取得中ロックを獲得する。他のプロセスが取得中の場合はFalse。
+        """
+        lock_path = self._path(key, ".lock")
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime < self.lock_timeout:
+                    return False
+                lock_path.unlink()
+            except FileNotFoundError:
+                pass
+            return self.try_lock(key)
+        os.close(fd)
+        return True
+
+    def unlock(self, key: str) -> None:
+        self._path(key, ".lock").unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        entries = list(self.cache_dir.glob("*.pkl"))
+        if len(entries) <= self.max_entries:
+            return
+        mtimes = []
+        for path in entries:
+            try:
+                mtimes.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                pass
+        mtimes.sort()
+        for _, path in mtimes[: len(mtimes) - self.max_entries]:
+            path.unlink(missing_ok=True)
+
+
+class OddsCache:
+    """
+    TTL付きのオッズ取得結果キャッシュ。同じキーへの同時リクエストは1回の取得にまとめる。
+
+    呼び出し元のスレッドやイベントループが異なっていても（Streamlitのセッションごとの
+    asyncio.runなど）、取得中の結果を共有できる。
+    """
+
+    def __init__(
+        self,
+        backend: Optional[Any] = None,
+        ttl: float = 30.0,
+        poll_interval: float = 0.2,
+    ):
+        """
+        Parameters
+        --------
+        backend : MemoryBackend or DiskBackend, optional
+            保存先。指定しない場合はMemoryBackend
+        ttl : float, optional
+            取得結果を有効とみなす秒数。デフォルトは30.0
+        poll_interval : float, optional
+            他のプロセスが取得中の場合に結果を確認する間隔（秒）
+        """
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._in_flight: dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, race_id: str, bet_types: Iterable[str]) -> Optional[Any]:
+        """
+        TTL内の取得結果を返す。ない場合はNone。
+        """
+        value = self._get_fresh(cache_key(race_id, bet_types))
+        if value is not None:
+            # ヒットしなかった場合は続くget_or_fetchで記録されるため、ここではヒットのみ数える
+            CACHE_REQUESTS.inc(result="hit")
+        return value
+
+    def put(self, race_id: str, bet_types: Iterable[str], value: Any) -> None:
+        """
+        取得結果を保存する（配信用の定期取得など、キャッシュを通さずに取得した結果を共有する場合）。
+        """
+        self.backend.set(cache_key(race_id, bet_types), value)
+
+    def invalidate(self, race_id: str, bet_types: Iterable[str]) -> None:
+        self.backend.delete(cache_key(race_id, bet_types))
+
+    def _get_fresh(self, key: str) -> Optional[Any]:
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.time() - stored_at > self.ttl:
+            return None
+        return value
+
+    async def get_or_fetch(
+        self,
+        race_id: str,
+        bet_types: Iterable[str],
+        fetch: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        TTL内の取得結果があればそれを返し、なければfetchを実行して結果を保存する。
+
+        Parameters
+        --------
+        race_id : str
+            JRA形式のrace_id
+        bet_types : Iterable[str]
+            取得する馬券種
+        fetch : Callable[[], Awaitable[Any]]
+            キャッシュがない場合に実行する取得処理。例外を送出した場合は保存しない。
+        """
+        key = cache_key(race_id, bet_types)
+        value = self._get_fresh(key)
+        if value is not None:
+            CACHE_REQUESTS.inc(result="hit")
+            return value
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = concurrent.futures.Future()
+                self._in_flight[key] = future
+        CACHE_REQUESTS.inc(result="miss" if is_leader else "coalesced")
+        if not is_leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            value = await self._fetch_once(key, fetch)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    async def _fetch_once(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        他のプロセスが同じキーを取得中であれば結果を待ち、そうでなければ自分で取得する。
+        """
+        while not self.backend.try_lock(key):
+            await asyncio.sleep(self.poll_interval)
+            value = self._get_fresh(key)
+            if value is not None:
+                return value
+        try:
+            # ロック待ちの間に他のプロセスが保存している場合がある
+            value = self._get_fresh(key)
+            if value is not None:
+                return value
+            value = await fetch()
+            self.backend.set(key, value)
+            return value
+        finally:
+            self.backend.unlock(key)
+
+
+def create_default_cache() -> OddsCache:
+    """
+    環境変数から既定のキャッシュを作成する。
+
+    ODDS_CACHE_DIRが設定されている場合はそのディレクトリを共有するDiskBackend、
+    設定されていない場合はMemoryBackendを使用する。TTLはODDS_CACHE_TTL（秒、既定30）。
+    """
+    ttl = float(os.environ.get("ODDS_CACHE_TTL", "30"))
+    cache_dir = os.environ.get("ODDS_CACHE_DIR")
+    backend = DiskBackend(Path(cache_dir)) if cache_dir else MemoryBackend()
+    return OddsCache(backend=backend, ttl=ttl)
+
+
+# app.pyとapi/odds.pyで共有されるキャッシュ
+default_odds_cache = create_default_cache()
@@ -0,0 +1,116 @@
+"""
+オッズのバイナリ形式（packed形式）
+
+概要:
+    APIのJSONでは馬連のキーが"01,05"のような文字列、値が浮動小数点数の文字列になり、
+    3連単（最大4,896通り）では非常に大きくなる。packed形式は組み合わせを馬番から計算する
+    番号（uint16）、オッズを10倍した整数（uint16、収まらない場合はuint32）の配列で表す。
+    public/static/js/app.jsのdecodePackedOddsで復元できる。
+
+形式（リトルエンディアン）:
+    ヘッダー（8バイト）
+        magic    4バイト  b"ODDS"
+        version  uint8    1
+        sections uint8    馬券種の数
+        reserved uint16
+    馬券種ごと
+        code       uint8   BET_TYPE_CODESの番号
+        size       uint8   選ぶ頭数（単勝・複勝は1、馬連・馬単は2、3連複・3連単は3）
+        odds_width uint8   オッズの配列の要素のバイト数（2または4）
+        reserved   uint8
+        count      uint32  組み合わせの数
+        index      uint16 × count  組み合わせの番号（馬番-1を18進数とみなした値）
+        odds       uint16/uint32 × count  オッズの10倍
+
+使用例:
+    body = encode_odds({"tansho": {1: 2.5}, "umaren": odds_extractor.umaren})
+    decode_odds(body)  # {"tansho": {1: 2.5}, "umaren": {"01,05": 12.3, ...}}
+"""
+
+import struct
+from collections.abc import Mapping
+
+import numpy as np
+
+from odds_table import MAX_HORSES, OddsTable
+
+MEDIA_TYPE = "application/x-odds-packed"
+MAGIC = b"ODDS"
+VERSION = 1
+
+# 馬券種（RealtimeOddsの属性名）の番号と選ぶ頭数
+BET_TYPE_CODES = {
+    "tansho": (1, 1),
+    "fukusho": (2, 1),
+    "umaren": (3, 2),
+    "umatan": (4, 2),
+    "sanrenpuku": (5, 3),
+    "sanrentan": (6, 3),
+}
+
+_HEADER = struct.Struct("<4sBBH")
+_SECTION = struct.Struct("<BBBBI")
+
+
+def _arrays(name: str, odds: Mapping) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (馬番の配列（件数×頭数、1始まり）, オッズの配列)に変換する。
+    """
+    if isinstance(odds, OddsTable):
+        return odds.combinations()
+    if BET_TYPE_CODES[name][1] > 1:
+        return OddsTable.from_dict(name, odds).combinations()
+    horses = np.fromiter(odds.keys(), dtype=np.int64, count=len(odds)).reshape(-1, 1)
+    values = np.fromiter(odds.values(), dtype=np.float64, count=len(odds))
+    return horses, values
+
+
+def encode_odds(odds: Mapping[str, Mapping]) -> bytes:
+    """
+    {RealtimeOddsの属性名: オッズ}をpacked形式に変換する。
+    """
+    sections = []
+    for name, values in odds.items():
+        code, size = BET_TYPE_CODES[name]
+        horses, prices = _arrays(name, values)
+        index = np.zeros(len(prices), dtype=np.int64)
+        for column in range(size):
+            index = index * MAX_HORSES + (horses[:, column] - 1)
+        scaled = np.rint(np.asarray(prices, dtype=np.float64) * 10).astype(np.int64)
+        odds_dtype = "<u2" if len(scaled) == 0 or scaled.max() <= 0xFFFF else "<u4"
+        sections.append(
+            _SECTION.pack(code, size, np.dtype(odds_dtype).itemsize, 0, len(scaled))
+            + index.astype("<u2").tobytes()
+            + scaled.astype(odds_dtype).tobytes()
+        )
+    return _HEADER.pack(MAGIC, VERSION, len(sections), 0) + b"".join(sections)
+
+
+def decode_odds(data: bytes) -> dict[str, dict]:
+    """
+    packed形式を{属性名: {馬番 または "01,05"形式の組み合わせ: オッズ}}に戻す。
+    """
+    magic, version, n_sections, _ = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("packed形式のオッズではありません。")
+    names = {code: name for name, (code, _) in BET_TYPE_CODES.items()}
+    offset = _HEADER.size
+    odds = {}
+    for _ in range(n_sections):
+        code, size, width, _, count = _SECTION.unpack_from(data, offset)
+        offset += _SECTION.size
+        index = np.frombuffer(data, dtype="<u2", count=count, offset=offset).astype(np.int64)
+        offset += 2 * count
+        scaled = np.frombuffer(data, dtype=f"<u{width}", count=count, offset=offset)
+        offset += width * count
+        horses = np.empty((count, size), dtype=np.int64)
+        for column in reversed(range(size)):
+            horses[:, column] = index % MAX_HORSES + 1
+            index //= MAX_HORSES
+        values = (scaled / 10).tolist()
+        if size == 1:
+            keys = horses[:, 0].tolist()
+        else:
+            keys = [",".join(f"{horse:02d}" for horse in row) for row in horses.tolist()]
+        odds[names[code]] = dict(zip(keys, values))
+    return odds
@@ -0,0 +1,322 @@
+"""
+オッズ表示用の表の作成
+
+概要:
+    取得したオッズ（単勝・複勝・馬連）から、Streamlit版（app.py）で表示する
+    オッズ順の一覧表（行: 単勝・複勝・馬連のオッズと馬番、列: 人気順）を作成する。
+    Streamlitに依存しないため、ベンチマーク（benchmarks/run_benchmarks.py）からも呼び出せる。
+
+使用例:
+    display_df, top_two_umaren, axis_horse = build_odds_table(fetch_odds(race_id))
+"""
+
+from typing import Optional
+
+import pandas as pd
+
+from odds_query import OddsQuery
+
+
+def format_umaren_kumi(horse1: int, horse2: int) -> str:
+    """
+    馬連の組み合わせをフォーマットする。
+    
+    小さい馬番を先頭に、ハイフンで区切り、ゼロ埋めなしで表記する。
+    例: (1, 15) -> "1-15", (5, 10) -> "5-10", (15, 1) -> "1-15"
+    
+    Parameters
+    ----------
+    horse1 : int
+        馬番1
+    horse2 : int
+        馬番2
+    
+    Returns
+    -------
+    str
+        フォーマットされた組み合わせ（例: "1-15"）
+    """
+    smaller = min(horse1, horse2)
+    larger = max(horse1, horse2)
+    return f"{smaller}-{larger}"
+
+
+def get_umaren_top_popular(
+    tansho_odds: dict, umaren_odds: dict
+) -> tuple[list, Optional[int], pd.DataFrame]:
+    """
+    馬連の上位人気2つを取得し、その2つに共通して含まれる馬番を軸として取得する。
+    
+    処理手順:
+        1. 馬連オッズの上位2つを取得
+        2. その2つの組み合わせに共通して含まれる馬番を軸とする
+        3. 軸を含む全ての馬連オッズを返す
+    
+    Parameters
+    ----------
+    tansho_odds : dict
+        単勝オッズの辞書（{馬番: オッズ}）
+    umaren_odds : dict
+        馬連オッズの辞書（{組み合わせ: オッズ}）
+    
+    Returns
+    -------
+    tuple[list, Optional[int], pd.DataFrame]
+        (馬連上位2つの組み合わせ情報のリスト, 軸馬番, 軸馬番を含む馬連オッズのDataFrame)
+        上位2つが見つからない場合は (空リスト, None, empty DataFrame)
+    """
+    if not umaren_odds:
+        return [], None, pd.DataFrame(columns=["軸馬番", "相手馬番", "組み合わせ", "オッズ"])
+    
+    # 馬連オッズの上位2つを取得（全件はソートしない）
+    query = OddsQuery.for_odds("umaren", umaren_odds)
+    top_two = query.top(2)
+    
+    if len(top_two) < 2:
+        return [], None, pd.DataFrame(columns=["軸馬番", "相手馬番", "組み合わせ", "オッズ"])
+    
+    top_two_combinations = []
+    for horses, odds in top_two:
+        # 新しい表記形式に変換（小さい数字を先頭、ハイフン区切り、ゼロ埋めなし）
+        formatted_kumi = format_umaren_kumi(horses[0], horses[1])
+        top_two_combinations.append({
+            "組み合わせ": formatted_kumi,
+            "オッズ": odds,
+            "馬番1": horses[0],
+            "馬番2": horses[1],
+        })
+    
+    # 2つの組み合わせに共通して含まれる馬番を探す
+    first_combo_horses = {top_two_combinations[0]["馬番1"], top_two_combinations[0]["馬番2"]}
+    second_combo_horses = {top_two_combinations[1]["馬番1"], top_two_combinations[1]["馬番2"]}
+    
+    # 共通の馬番を取得
+    common_horses = first_combo_horses & second_combo_horses
+    
+    if not common_horses:
+        # 共通の馬番がない場合は、上位1つ目の組み合わせの1番目の馬番を軸とする
+        axis_horse = top_two_combinations[0]["馬番1"]
+    else:
+        # 共通の馬番がある場合、その中から1つを軸とする（最初のもの）
+        axis_horse = list(common_horses)[0]
+    
+    # 軸馬番を含む全ての馬連オッズを抽出（オッズ順）
+    axis_umaren_odds = []
+    for horses, odds in query.containing(axis_horse):
+        # もう一頭の馬番を取得
+        other_horse = horses[1] if horses[0] == axis_horse else horses[0]
+        # 新しい表記形式に変換（小さい数字を先頭、ハイフン区切り、ゼロ埋めなし）
+        formatted_kumi = format_umaren_kumi(horses[0], horses[1])
+        axis_umaren_odds.append({
+            "軸馬番": axis_horse,
+            "相手馬番": other_horse,
+            "組み合わせ": formatted_kumi,
+            "オッズ": odds,
+        })
+    
+    # デバッグ: 軸馬番を含む全ての組み合わせを確認
+    print(f"デバッグ: 軸馬番{axis_horse}を含む組み合わせ数: {len(axis_umaren_odds)}")
+    print(f"デバッグ: 全ての組み合わせ: {[combo['相手馬番'] for combo in axis_umaren_odds]}")
+    
+    if not axis_umaren_odds:
+        return top_two_combinations, axis_horse, pd.DataFrame(columns=["軸馬番", "相手馬番", "組み合わせ", "オッズ"])
+    
+    # DataFrameに変換（query.containingでオッズ順にソート済み）
+    df = pd.DataFrame(axis_umaren_odds)
+    
+    return top_two_combinations, axis_horse, df
+
+
+def build_odds_table(odds_data: dict) -> tuple[pd.DataFrame, list, Optional[int]]:
+    """
+    取得したオッズ情報から表示用の一覧表を作成する。
+
+    Parameters
+    ----------
+    odds_data : dict
+        fetch_oddsの戻り値（キーは 'tansho', 'fukusho', 'umaren'）
+
+    Returns
+    -------
+    tuple[pd.DataFrame, list, Optional[int]]
+        (一覧表, 馬連上位2つの組み合わせ情報のリスト, 軸馬番)。
+        表示するオッズがない場合、一覧表は空のDataFrame
+    """
+    # データの整理
+    tansho_odds = odds_data["tansho"]
+    fukusho_odds = odds_data["fukusho"]
+    umaren_odds = odds_data["umaren"]
+    
+    # 単勝オッズを低い順にソート（馬番とオッズのペア）
+    if tansho_odds:
+        tansho_sorted = sorted(tansho_odds.items(), key=lambda x: x[1])
+        tansho_horses = [horse for horse, _ in tansho_sorted]
+        tansho_values = [odds for _, odds in tansho_sorted]
+    else:
+        tansho_sorted = []
+        tansho_horses = []
+        tansho_values = []
+    
+    # 複勝オッズを低い順にソート（馬番とオッズのペア）
+    if fukusho_odds:
+        fukusho_sorted = sorted(fukusho_odds.items(), key=lambda x: x[1])
+        fukusho_horses = [horse for horse, _ in fukusho_sorted]
+        fukusho_values = [odds for _, odds in fukusho_sorted]
+    else:
+        fukusho_sorted = []
+        fukusho_horses = []
+        fukusho_values = []
+    
+    # 馬連の上位人気2つを取得し、共通する馬番を軸とする
+    top_two_umaren = []
+    axis_horse = None
+    axis_umaren_df = pd.DataFrame()
+    if umaren_odds:
+        top_two_umaren, axis_horse, axis_umaren_df = get_umaren_top_popular(
+            tansho_odds, umaren_odds
+        )
+    
+    if not tansho_odds and not fukusho_odds and axis_umaren_df.empty:
+        return pd.DataFrame(), top_two_umaren, axis_horse
+    
+    # 各行ごとにオッズ順にソートしてデータを準備
+    display_data = {}
+    
+    # 単勝_オッズ行と単勝_馬番行（単勝オッズの低い順にソート）
+    if tansho_odds:
+        # 単勝オッズの低い順にソート
+        tansho_sorted_for_display = sorted(tansho_odds.items(), key=lambda x: x[1])
+        
+        # 単勝_オッズ行
+        tansho_row = []
+        # 単勝_馬番行
+        tansho_horses_row = []
+        
+        for idx, (horse, odds) in enumerate(tansho_sorted_for_display):
+            tansho_row.append(f"{odds:.1f}")  # 小数点第一位まで
+            tansho_horses_row.append(str(horse))  # 一桁の数字も一桁で出力（ゼロ埋めなし）
+        
+        display_data["単勝_オッズ"] = tansho_row
+        display_data["単勝_馬番"] = tansho_horses_row
+    else:
+        display_data["単勝_オッズ"] = []
+        display_data["単勝_馬番"] = []
+    
+    # 複勝_オッズ行と複勝_馬番行（複勝オッズの低い順にソート）
+    if fukusho_odds:
+        # 複勝オッズの低い順にソート
+        fukusho_sorted_for_display = sorted(fukusho_odds.items(), key=lambda x: x[1])
+        
+        # 複勝_オッズ行
+        fukusho_row = []
+        # 複勝_馬番行
+        fukusho_horses_row = []
+        
+        for idx, (horse, odds) in enumerate(fukusho_sorted_for_display):
+            fukusho_row.append(f"{odds:.1f}")  # 小数点第一位まで
+            fukusho_horses_row.append(str(horse))  # 一桁の数字も一桁で出力（ゼロ埋めなし）
+        
+        display_data["複勝_オッズ"] = fukusho_row
+        display_data["複勝_馬番"] = fukusho_horses_row
+    else:
+        display_data["複勝_オッズ"] = []
+        display_data["複勝_馬番"] = []
+    
+    
+    # 馬連_オッズ行と馬連_馬番行（新しい形式：先頭に軸馬番のみ、次に相手馬番のみ）
+    if axis_horse is not None and not axis_umaren_df.empty:
+        umaren_odds_row = []
+        umaren_horses_row = []
+        
+        # 軸馬番を含む全ての組み合わせを取得（オッズ順にソート済み）
+        # axis_umaren_dfには軸馬番を含む全ての組み合わせが含まれているはず
+        sorted_combinations = []
+        for _, row in axis_umaren_df.iterrows():
+            sorted_combinations.append({
+                "相手馬番": int(row['相手馬番']),  # 整数型に変換
+                "オッズ": row['オッズ'],
+            })
+        
+        # 相手馬番でソート（オッズ順が既に保たれているが、念のため確認）
+        # オッズ順に既にソートされているはずだが、念のため再ソート
+        sorted_combinations = sorted(sorted_combinations, key=lambda x: x['オッズ'])
+        
+        if len(sorted_combinations) >= 3:
+            # 先頭には軸馬番のみ（数字のみ、記号なし）
+            umaren_horses_row.append(str(axis_horse))
+            
+            # 先頭のオッズは、2番目と3番目の組み合わせから「相手馬番同士の組み合わせ」のオッズを探す
+            # 例: 2番目が6-10、3番目が6-9の場合、9-10のオッズを先頭に入れる
+            first_other_horse = sorted_combinations[1]["相手馬番"]  # 2番目の相手馬番（インデックス1）
+            second_other_horse = sorted_combinations[2]["相手馬番"]  # 3番目の相手馬番（インデックス2）
+            
+            # 小さい方を先頭にした組み合わせを探す
+            smaller = min(first_other_horse, second_other_horse)
+            larger = max(first_other_horse, second_other_horse)
+            
+            # umaren_oddsから該当する組み合わせのオッズを取得
+            first_odds = OddsQuery.for_odds("umaren", umaren_odds).pair(smaller, larger)
+            
+            # 見つからない場合は、2番目のオッズを使用
+            if first_odds is None:
+                first_odds = sorted_combinations[1]["オッズ"]
+            
+            umaren_odds_row.append(f"{first_odds:.1f}")  # 小数点第一位まで
+            
+            # 全ての組み合わせを表示（1番目から全て）
+            for combo in sorted_combinations:  # 全ての組み合わせ
+                umaren_odds_row.append(f"{combo['オッズ']:.1f}")  # 小数点第一位まで
+                umaren_horses_row.append(str(combo['相手馬番']))
+        elif len(sorted_combinations) >= 2:
+            # 組み合わせが2つしかない場合（先頭のオッズは2番目のオッズを使用）
+            umaren_horses_row.append(str(axis_horse))
+            umaren_odds_row.append(f"{sorted_combinations[1]['オッズ']:.1f}")  # 小数点第一位まで
+            # 全ての組み合わせを表示
+            for combo in sorted_combinations:
+                umaren_odds_row.append(f"{combo['オッズ']:.1f}")  # 小数点第一位まで
+                umaren_horses_row.append(str(combo['相手馬番']))
+        elif len(sorted_combinations) == 1:
+            # 組み合わせが1つだけの場合
+            umaren_horses_row.append(str(axis_horse))
+            umaren_odds_row.append(f"{sorted_combinations[0]['オッズ']:.1f}")  # 小数点第一位まで
+            umaren_horses_row.append(str(sorted_combinations[0]['相手馬番']))
+        else:
+            # 組み合わせがない場合
+            umaren_horses_row.append(str(axis_horse))
+        
+        display_data["馬連_オッズ"] = umaren_odds_row
+        display_data["馬連_馬番"] = umaren_horses_row
+    else:
+        display_data["馬連_オッズ"] = []
+        display_data["馬連_馬番"] = []
+    
+    # 最大の列数を取得（全ての行の長さを確認）
+    max_cols = max(
+        [len(display_data.get(key, [])) for key in display_data],
+        default=0,
+    )
+    
+    if max_cols == 0:
+        return pd.DataFrame(), top_two_umaren, axis_horse
+    
+    # 馬連の表示形式変更により、各行の長さが一致するようになったため、
+    # 空白で埋める処理は不要になりました
+    # （各行の長さが異なる場合は、そのまま表示します）
+    
+    # DataFrameを作成（行名がラベル、列は順番）
+    # display_dataは辞書で、キーが行名、値がリスト（列データ）になっている
+    # これを転置して、行がラベル、列がデータになるようにする
+    display_df = pd.DataFrame.from_dict(display_data, orient='index')
+    
+    # 実際の列数を確認（DataFrame作成後の実際の列数）
+    actual_cols = len(display_df.columns)
+    
+    # 列名を1から始まる連番に設定（順位を表す）
+    if actual_cols > 0:
+        display_df.columns = [f"{i+1:02d}" for i in range(actual_cols)]
+    
+    # 行名を保持（左端のラベル列として表示される）
+    display_df.index.name = None
+    
+
+    return display_df, top_two_umaren, axis_horse
@@ -0,0 +1,184 @@
+"""
+ブラウザ内でのオッズの抽出
+
+概要:
+    page.content()でDOM全体をHTML文字列にしてPythonで解析し直す代わりに、
+    ページ内で小さなスクリプト（EXTRACT_ODDS_JS）を実行し、表示中のDOMから
+    馬番とオッズだけを詰めた配列を受け取る。3連単では数百KBのHTMLの代わりに
+    数十KBの数値の配列だけを転送し、lxmlでの解析も不要になる。
+
+    スクリプトはodds_parserと同じ要素を同じ規則で読み取る。受け取った配列は
+    extract_packedでodds_parser.extract_pageと同じ形（{属性名: オッズ}）に変換する。
+    オッズ表が見つからない場合はNoneを返すため、呼び出し側はHTMLの取得と
+    extract_*での解析に切り替える（RealtimeOddsのextraction="dom"）。
+
+配列の形式:
+    単勝・複勝: {"horses": [馬番...], "tan": [オッズ|null...], "fuku": [下限|null...]}
+    組み合わせ馬券: {"size": 頭数, "horses": [馬番を組み合わせ順に平らに並べたもの], "odds": [オッズ...]}
+
+制限事項:
+    - 数値の解釈はodds_parserに合わせているが、全角数字などの表記はPython側と異なる場合がある。
+      verify_packedでHTMLの解析結果と突き合わせられる
+"""
+
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from odds_parser import extract_page, filter_horses
+from odds_table import BET_TYPE_SHAPES, OddsTable
+
+# page.evaluateに渡すスクリプト（引数は馬券種）
+EXTRACT_ODDS_JS = r"""
+(betType) => {
+    const text = (el) => (el ? el.textContent.trim() : "");
+    const horse = (el) => {
+        const t = text(el);
+        return /^\d+$/.test(t) ? parseInt(t, 10) : null;
+    };
+    const odds = (el) => {
+        const t = text(el).replace(/,/g, "");
+        return /^[+-]?(\d+\.?\d*|\.\d+)$/.test(t) ? parseFloat(t) : null;
+    };
+    const size = {umaren: 2, umatan: 2, sanrenpuku: 3, sanrentan: 3}[betType];
+    const horses = [];
+    const values = [];
+    const pushRows = (rows, prefix) => {
+        for (const row of rows) {
+            const last = horse(row.querySelector("th"));
+            const value = odds(row.querySelector("td"));
+            if (last === null || value === null) continue;
+            horses.push(...prefix, last);
+            values.push(value);
+        }
+    };
+
+    if (betType === "tanpuku") {
+        const table = document.querySelector("table.tanpuku");
+        if (!table) return null;
+        const result = {horses: [], tan: [], fuku: []};
+        const fukuClasses = ["odds_fuku", "odds_fukusho", "odds_fuku1", "odds_fuku2", "odds_fuku3"];
+        for (const row of table.querySelectorAll("tbody tr")) {
+            const number = horse(row.querySelector("td.num"));
+            if (number === null) continue;
+            const tds = Array.from(row.querySelectorAll("td"));
+            let fuku = null;
+            for (const name of fukuClasses) {
+                fuku = row.querySelector("td." + name);
+                if (fuku) break;
+            }
+            if (!fuku) fuku = tds.find((td) => (td.getAttribute("class") || "").toLowerCase().includes("fuku"));
+            if (!fuku) {
+                const i = tds.findIndex((td) => (td.getAttribute("class") || "").toLowerCase().includes("odds_tan"));
+                const next = i >= 0 ? tds[i + 1] : null;
+                if (next && !(next.getAttribute("class") || "").toLowerCase().includes("odds_tan")) fuku = next;
+            }
+            result.horses.push(number);
+            result.tan.push(odds(row.querySelector("td.odds_tan")));
+            result.fuku.push(fuku ? odds(fuku.querySelector("span.min")) : null);
+        }
+        return result;
+    }
+    if (betType === "umaren" || betType === "umatan") {
+        if (!document.querySelector("ul." + betType + "_list")) return null;
+        for (const item of document.querySelectorAll("ul." + betType + "_list li")) {
+            const first = horse(item.querySelector("caption"));
+            if (first === null) continue;
+            pushRows(item.querySelectorAll("tbody tr"), [first]);
+        }
+    } else if (betType === "sanrenpuku") {
+        const units = document.querySelectorAll("div.fuku3_unit");
+        if (units.length === 0) return null;
+        for (const unit of units) {
+            const first = horse(unit.querySelector("h4 span.inner span.num"));
+            if (first === null) continue;
+            for (const item of unit.querySelectorAll("ul.fuku3_list li")) {
+                const match = /(\d+)-(\d+)/.exec(item.querySelector("table caption")?.textContent || "");
+                if (!match) continue;
+                pushRows(item.querySelectorAll("table tbody tr"), [first, parseInt(match[2], 10)]);
+            }
+        }
+    } else if (betType === "sanrentan") {
+        const units = document.querySelectorAll("div.tan3_unit");
+        if (units.length === 0) return null;
+        for (const unit of units) {
+            const first = horse(unit.querySelector("span.num"));
+            if (first === null) continue;
+            for (const item of unit.querySelectorAll("ul.tan3_list li")) {
+                const second = horse(item.querySelector("div.p_line:nth-of-type(2) div.num"));
+                if (second === null) continue;
+                pushRows(item.querySelectorAll("table.tan3 tbody tr"), [first, second]);
+            }
+        }
+    } else {
+        return null;
+    }
+    return {size: size, horses: horses, odds: values};
+}
+"""
+
+
+def packed_size(packed: dict[str, Any]) -> int:
+    """
+    配列に含まれる値の数（転送量の目安）。
+    """
+    return sum(len(value) for value in packed.values() if isinstance(value, list))
+
+
+def _tanpuku_dicts(packed: dict[str, Any]) -> tuple[dict[int, float], dict[int, float]]:
+    tansho = {horse: odds for horse, odds in zip(packed["horses"], packed["tan"]) if odds is not None}
+    fukusho = {horse: odds for horse, odds in zip(packed["horses"], packed["fuku"]) if odds is not None}
+    return tansho, fukusho
+
+
+def extract_packed(
+    bet_type: str, packed: dict[str, Any], horses: Optional[Iterable[int]] = None
+) -> dict[str, Any]:
+    """
+    EXTRACT_ODDS_JSの結果をodds_parser.extract_pageと同じ形に変換する。
+
+    Parameters
+    --------
+    bet_type : str
+        "tanpuku", "umaren", "umatan", "sanrenpuku", "sanrentan"のいずれか
+    packed : dict[str, Any]
+        EXTRACT_ODDS_JSの結果
+    horses : Iterable[int], optional
+        指定した場合、これらの馬番のいずれかを含む組み合わせ（単勝・複勝はその馬番）だけを返す。
+
+    Returns
+    --------
+    dict[str, Any]
+        {RealtimeOddsの属性名: オッズ}
+    """
+    if bet_type == "tanpuku":
+        tansho, fukusho = _tanpuku_dicts(packed)
+        return {"tansho": filter_horses(tansho, horses), "fukusho": filter_horses(fukusho, horses)}
+    if bet_type in BET_TYPE_SHAPES:
+        combinations = np.asarray(packed["horses"], dtype=np.int64).reshape(-1, packed["size"])
+        table = OddsTable.from_arrays(bet_type, combinations, np.asarray(packed["odds"], dtype=np.float32))
+        return {bet_type: table.containing_any(horses) if horses is not None else table}
+    return {}
+
+
+def verify_packed(bet_type: str, packed: dict[str, Any], html: str) -> list[str]:
+    """
+    EXTRACT_ODDS_JSの結果を、同じページのHTMLをodds_parserで解析した結果と突き合わせる。
+
+    Returns
+    --------
+    list[str]
+        結果が一致しなかった属性名のリスト（一致した場合は空）
+    """
+    from_dom = extract_packed(bet_type, packed)
+    from_html = extract_page(bet_type, html)
+    mismatched = []
+    for name, expected in from_html.items():
+        actual = from_dom.get(name)
+        if isinstance(expected, OddsTable):
+            same = actual is not None and np.array_equal(actual.values, expected.values, equal_nan=True)
+        else:
+            same = actual == expected
+        if not same:
+            mismatched.append(name)
+    return mismatched
@@ -0,0 +1,155 @@
+"""
+前回の取得から変わった部分だけを解析し直すオッズの抽出
+
+概要:
+    同じレースを繰り返し取得する場合（odds_poller.pyなど）、オッズが変わるのは
+    一部の組み合わせだけのことが多いが、extract_*は毎回ページ全体を解析していた。
+    IncrementalParserは組み合わせ馬券のページを1頭目の馬番ごとのブロック
+    （odds_parser.iter_blocks）に分け、ブロックのマークアップのハッシュが前回と同じなら
+    前回読み取った馬番とオッズの配列を使い回し、変わったブロックだけを読み取り直す。
+    ページ全体が前回と同じ場合は、要素ツリーへの変換も行わない。
+
+    3連単ではページの変換とブロックのハッシュの計算（lxml、C実装）だけが毎回かかり、
+    Pythonでの行の読み取りは変わったブロックの分だけになる。
+
+使用例:
+    parser = IncrementalParser()
+    odds = RealtimeOdds(race_id, incremental=parser)  # 同じparserを次の取得でも使う
+
+制限事項:
+    - 結果はレース・馬券種ごとに最大max_pages件まで保持し、古いものから削除する
+    - ExtractPool（別プロセス）での抽出には使われない
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from lxml import etree
+
+from odds_metrics import PARSED_BLOCKS
+from odds_parser import iter_block_odds, iter_blocks, parse_tanpuku
+from odds_table import BET_TYPE_SHAPES, OddsTable
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _block_arrays(bet_type: str, block: etree._Element) -> tuple[np.ndarray, np.ndarray]:
+    """
+    ブロックから(馬番の配列（組み合わせ数×頭数）, オッズの配列)を読み取る。
+    """
+    size = BET_TYPE_SHAPES[bet_type][0]
+    horses = []
+    odds = []
+    for combination, value in iter_block_odds(bet_type, block):
+        if len(combination) != size:
+            print(f"警告: IncrementalParser - 頭数が合わないため無視しました: {combination}")
+            continue
+        horses.append(combination)
+        odds.append(value)
+    return (
+        np.array(horses, dtype=np.int64).reshape(-1, size),
+        np.array(odds, dtype=np.float32),
+    )
+
+
+class IncrementalParser:
+    """
+    レース・馬券種ごとに前回の解析結果を保持し、変わったブロックだけを解析し直すクラス。
+    """
+
+    def __init__(self, max_pages: int = 256):
+        """
+        Parameters
+        --------
+        max_pages : int, optional
+            解析結果を保持する(レース, 馬券種)の最大数。デフォルトは256
+        """
+        self.max_pages = max_pages
+        # (race_id, 馬券種) -> {"digest": ページのハッシュ, "result": 結果, "blocks": {ブロックのハッシュ: 配列}}
+        self._pages: OrderedDict[tuple[str, str], dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple[str, str]) -> Optional[dict]:
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None:
+                self._pages.move_to_end(key)
+            return entry
+
+    def _put(self, key: tuple[str, str], entry: dict) -> None:
+        with self._lock:
+            self._pages[key] = entry
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def tanpuku(
+        self, race_id: str, html: str
+    ) -> Optional[tuple[dict[int, float], dict[int, float]]]:
+        """
+        単勝・複勝ページを解析する（odds_parser.parse_tanpukuと同じ結果）。
+        単勝・複勝は1つの表のため、ページ全体が前回と同じ場合のみ結果を使い回す。
+        """
+        key = (race_id, "tanpuku")
+        digest = _digest(html.encode("utf-8"))
+        entry = self._get(key)
+        if entry is not None and entry["digest"] == digest:
+            PARSED_BLOCKS.inc(bet_type="tanpuku", result="reused")
+            return entry["result"]
+        result = parse_tanpuku(html)
+        PARSED_BLOCKS.inc(bet_type="tanpuku", result="parsed")
+        self._put(key, {"digest": digest, "result": result, "blocks": {}})
+        return result
+
+    def table(self, race_id: str, bet_type: str, html: str) -> OddsTable:
+        """
+        組み合わせ馬券のページを解析し、オッズ表を返す
+        （OddsTable.from_rows(bet_type, odds_parser.iter_odds(bet_type, html))と同じ結果）。
+
+        Parameters
+        --------
+        race_id : str
+            JRA形式のrace_id（前回の結果を探すキー）
+        bet_type : str
+            "umaren", "umatan", "sanrenpuku", "sanrentan"のいずれか
+        html : str
+            オッズページのHTML
+        """
+        key = (race_id, bet_type)
+        digest = _digest(html.encode("utf-8"))
+        entry = self._get(key)
+        if entry is not None and entry["digest"] == digest:
+            PARSED_BLOCKS.inc(len(entry["blocks"]), bet_type=bet_type, result="reused")
+            return OddsTable(bet_type, entry["result"].values.copy())
+
+        previous = entry["blocks"] if entry is not None else {}
+        blocks = {}
+        horses = []
+        odds = []
+        reused = 0
+        for block in iter_blocks(bet_type, html):
+            block_digest = _digest(etree.tostring(block))
+            arrays = previous.get(block_digest)
+            if arrays is None:
+                arrays = blocks.get(block_digest) or _block_arrays(bet_type, block)
+            else:
+                reused += 1
+            blocks[block_digest] = arrays
+            horses.append(arrays[0])
+            odds.append(arrays[1])
+        PARSED_BLOCKS.inc(reused, bet_type=bet_type, result="reused")
+        PARSED_BLOCKS.inc(len(horses) - reused, bet_type=bet_type, result="parsed")
+
+        size = BET_TYPE_SHAPES[bet_type][0]
+        table = OddsTable.from_arrays(
+            bet_type,
+            np.concatenate(horses) if horses else np.empty((0, size), dtype=np.int64),
+            np.concatenate(odds) if odds else np.empty(0, dtype=np.float32),
+        )
+        self._put(key, {"digest": digest, "result": table, "blocks": blocks})
+        return OddsTable(bet_type, table.values.copy())
@@ -0,0 +1,347 @@
+"""
+処理段階ごとの計測（スパンとPrometheus形式のメトリクス）
+
+概要:
+    オッズの取得が遅い場合に、時間がChromiumの起動・page.goto・リンクのクリック
+    （delayによる待ちを含む）・wait_for_load_state・HTMLの解析のどこで使われたかを
+    調べられるよう、各段階をspan()で囲んで所要時間を記録する。
+    記録した値はPrometheusのテキスト形式（odds_server.pyの /metrics）で公開し、
+    ODDS_TRACE_LOGを設定した場合はスパンごとに1行のJSONログも出力する。
+    span_listenerで囲んだ処理の中で終わったスパンは、その関数にも通知する
+    （app.pyでの取得の進み具合の表示など）。
+
+主なメトリクス:
+    odds_stage_duration_seconds  段階ごとの所要時間（stage, status）
+    odds_fetch_retries_total     取得のやり直し（reason）
+    odds_page_bytes_total        取得したオッズページの大きさ（bet_type, source）
+    odds_parsed_rows_total       抽出したオッズの件数（bet_type）
+    odds_cache_requests_total    OddsCacheの参照結果（result: hit, miss, coalesced）
+    odds_click_delay_seconds_total  クリック時に指定した遅延（delay_time）の合計
+    odds_pacing_delay_seconds_total  AdaptivePacerが遷移の間に空けた時間の合計
+    odds_blocked_requests_total  profile="lean"で遮断したリクエスト（resource_type）
+    odds_parsed_blocks_total     IncrementalParserが読み取った・使い回したブロック（bet_type, result）
+
+使用例:
+    with span("extract.umaren", race_id=race_id) as attributes:
+        table = ...
+        attributes["rows"] = len(table)
+    PARSED_ROWS.inc(len(table), bet_type="umaren")
+    render_metrics()  # /metricsのレスポンス本文
+
+環境変数:
+    ODDS_TRACE_LOG: "1"または"stderr"で標準エラー出力に、それ以外の値はそのパスのファイルに
+        スパンごとのJSONログを追記する（未設定の場合は出力しない）
+
+制限事項:
+    - 値はプロセスごとに保持するため、複数のワーカープロセスで動かす場合はワーカーごとに集計される
+    - ExtractPoolの別プロセスでの解析は、呼び出し側（extract.pool）の所要時間として記録される
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional, TextIO
+
+# 所要時間のヒストグラムの区切り（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """
+    ラベルの値の組ごとに値を保持するメトリクスの基底クラス。
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}のラベルは{list(self.labelnames)}を指定してください。")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    増えるだけの値（回数・バイト数など）。
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "_total" if not self.name.endswith("_total") else "", dict(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    """
+    値の分布（所要時間など）。区切りごとの件数・合計・件数を保持する。
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels: Any) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry is not None else 0
+
+    def _samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        with self._lock:
+            items = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield "_sum", labels, total
+            yield "_count", labels, count
+
+
+class MetricsRegistry:
+    """
+    メトリクスをまとめてPrometheusのテキスト形式に変換する。
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"{metric.name}は既に登録されています。")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "odds_stage_duration_seconds", "オッズ取得の段階ごとの所要時間（秒）", ("stage", "status")
+))
+FETCH_RETRIES = REGISTRY.register(Counter(
+    "odds_fetch_retries_total", "オッズページの取得をやり直した回数", ("reason",)
+))
+PAGE_BYTES = REGISTRY.register(Counter(
+    "odds_page_bytes_total", "取得したオッズページHTMLのバイト数（UTF-8）", ("bet_type", "source")
+))
+PARSED_ROWS = REGISTRY.register(Counter(
+    "odds_parsed_rows_total", "抽出したオッズの件数", ("bet_type",)
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "odds_cache_requests_total", "OddsCacheの参照結果の回数", ("result",)
+))
+CLICK_DELAY = REGISTRY.register(Counter(
+    "odds_click_delay_seconds_total", "リンクのクリック時に指定した遅延（delay_time）の合計（秒）"
+))
+PACING_DELAY = REGISTRY.register(Counter(
+    "odds_pacing_delay_seconds_total", "AdaptivePacerがページ遷移の間に空けた時間の合計（秒）"
+))
+BLOCKED_REQUESTS = REGISTRY.register(Counter(
+    "odds_blocked_requests_total", "profile=\"lean\"で遮断したブラウザのリクエスト数", ("resource_type",)
+))
+PARSED_BLOCKS = REGISTRY.register(Counter(
+    "odds_parsed_blocks_total", "IncrementalParserが読み取った（parsed）・使い回した（reused）ブロック数",
+    ("bet_type", "result"),
+))
+
+
+def render_metrics() -> str:
+    """
+    全てのメトリクスをPrometheusのテキスト形式で返す（/metricsのレスポンス本文）。
+    """
+    return REGISTRY.render()
+
+
+_current_span: ContextVar[Optional[tuple[str, str]]] = ContextVar("odds_current_span", default=None)
+_span_listener: ContextVar[Optional[Callable[[str, dict[str, Any], str], None]]] = ContextVar(
+    "odds_span_listener", default=None
+)
+_trace_log: Optional[TextIO] = None
+_trace_log_lock = threading.Lock()
+
+
+def configure_trace_log(destination: Optional[str]) -> None:
+    """
+    スパンのJSONログの出力先を設定する。
+
+    Parameters
+    --------
+    destination : str, optional
+        "1"または"stderr"で標準エラー出力、それ以外はファイルのパス。
+        None・空文字列・"0"の場合は出力しない。
+    """
+    global _trace_log
+    if _trace_log is not None and _trace_log is not sys.stderr:
+        _trace_log.close()
+    if not destination or destination == "0":
+        _trace_log = None
+    elif destination in ("1", "stderr"):
+        _trace_log = sys.stderr
+    else:
+        _trace_log = open(destination, "a", encoding="utf-8", buffering=1)
+
+
+def _write_trace_log(record: dict) -> None:
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _trace_log_lock:
+        if _trace_log is not None:
+            _trace_log.write(line + "\n")
+
+
+@contextmanager
+def span_listener(listener: Callable[[str, dict[str, Any], str], None]) -> Iterator[None]:
+    """
+    囲んだ処理の中で終わったスパンごとに listener(name, attributes, status) を呼び出す。
+
+    asyncioのタスクは作成時のコンテキストを引き継ぐため、囲んだ処理から作成したタスクの
+    スパンも通知される。並行して動く別の処理のスパンは通知されない。
+
+    Parameters
+    --------
+    listener : Callable[[str, dict[str, Any], str], None]
+        スパンの名前・属性・状態（"ok"または"error"）を受け取る関数
+    """
+    token = _span_listener.set(listener)
+    try:
+        yield
+    finally:
+        _span_listener.reset(token)
+
+
+def _notify_listener(name: str, attributes: dict[str, Any], status: str) -> None:
+    listener = _span_listener.get()
+    if listener is None:
+        return
+    try:
+        listener(name, attributes, status)
+    except Exception as e:
+        # 通知先のエラーで取得を止めない
+        print(f"警告: span_listener - 通知先でエラーが発生しました: {e}")
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[dict[str, Any]]:
+    """
+    処理の段階を囲み、所要時間をodds_stage_duration_secondsに記録する。
+
+    入れ子にしたスパンは同じtrace_idを持ち、JSONログのparent_idで親をたどれる。
+    asyncioのタスクごとに親子関係を保持するため、並行して動くタブの処理も区別される。
+
+    Parameters
+    --------
+    name : str
+        段階の名前（例: "browser.goto"）。メトリクスのstageラベルになる。
+    **attributes
+        JSONログに出力する値（race_idなど）。メトリクスのラベルにはしない。
+
+    Yields
+    --------
+    dict[str, Any]
+        attributes。処理の中で値（bytes、rowsなど）を追加するとJSONログに出力される。
+    """
+    parent = _current_span.get()
+    trace_id = parent[0] if parent is not None else uuid.uuid4().hex[:16]
+    span_id = uuid.uuid4().hex[:16]
+    token = _current_span.set((trace_id, span_id))
+    started_at = time.time()
+    start = time.perf_counter()
+    status = "ok"
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        status = "error"
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        STAGE_DURATION.observe(duration, stage=name, status=status)
+        _notify_listener(name, attributes, status)
+        if _trace_log is not None:
+            record = {
+                **attributes,
+                "timestamp": started_at,
+                "trace_id": trace_id,
+                "span_id": span_id,
+                "parent_id": parent[1] if parent is not None else None,
+                "name": name,
+                "duration_ms": round(duration * 1000, 3),
+                "status": status,
+            }
+            if error is not None:
+                record["error"] = error
+            _write_trace_log(record)
+
+
+configure_trace_log(os.environ.get("ODDS_TRACE_LOG"))
@@ -0,0 +1,170 @@
+"""
+ブラウザでのページ遷移の間隔とタイムアウトの調整
+
+概要:
+    以前はクリックのたびに固定の遅延（delay_time、既定1000ミリ秒）を入れていたため、
+    サイトが速く応答していても1遷移ごとに待ち時間が加わっていた。
+    AdaptivePacerは遷移にかかった時間とエラーの発生状況を記録し、次の値を決める。
+        - 遷移の間隔: エラーがなければ待たず、エラーが続くほど長く空ける（最大max_interval）
+        - タイムアウト: TCPの再送タイムアウトと同じく、平均の所要時間＋4×ばらつき
+          （min_timeout〜max_timeout）。エラーの後はばらつきを広げて長めに待つ
+    遷移の完了はページのDOMContentLoadedと、馬券種ごとのオッズ表の要素
+    （extract_odds.ODDS_READY_SELECTORS）の表示で判定する。
+    RateLimiterはjra.go.jpへのリクエスト全体の上限（1秒あたりのリクエスト数）を決め、
+    HttpFetcherとAdaptivePacerで共有できる。
+
+使用例:
+    async with pacer.step():
+        await page.goto(url, timeout=pacer.timeout_ms())
+
+制限事項:
+    - default_pacerはプロセス内で共有されるため、同時に取得する全てのレースの状況が反映される
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from odds_metrics import PACING_DELAY
+
+
+class RateLimiter:
+    """
+    トークンバケット方式のレート制限。jra.go.jpへの1リクエストごとに1トークンを使う。
+    HttpFetcher（POST・GETごと）とAdaptivePacer（ブラウザの遷移・クリックごと）に
+    同じインスタンスを渡すと、全レース・全経路のリクエストをまとめて制限できる。
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Parameters
+        --------
+        rate : float
+            1秒あたりに許可するリクエスト数
+        burst : int, optional
+            連続して許可するリクエスト数の上限。デフォルトは1
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptivePacer:
+    """
+    観測した遷移の所要時間とエラー率から、遷移の間隔とタイムアウトを決めるクラス。
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 0.0,
+        max_interval: float = 5.0,
+        min_timeout: float = 5.0,
+        max_timeout: float = 60.0,
+        initial_latency: float = 2.0,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        """
+        Parameters
+        --------
+        min_interval : float, optional
+            遷移の最小間隔（秒）。デフォルトは0.0
+        max_interval : float, optional
+            エラーが続いた場合の遷移の最大間隔（秒）。デフォルトは5.0
+        min_timeout : float, optional
+            タイムアウトの下限（秒）。デフォルトは5.0
+        max_timeout : float, optional
+            タイムアウトの上限（秒）。デフォルトは60.0
+        initial_latency : float, optional
+            観測前に仮定する遷移の所要時間（秒）。デフォルトは2.0
+        rate_limiter : RateLimiter, optional
+            指定した場合、遷移を始める前に1トークンを取得する（1遷移=1リクエスト）。
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.latency = initial_latency
+        self.deviation = initial_latency / 2
+        self.error_rate = 0.0
+        self.rate_limiter = rate_limiter
+        self._last_finished = 0.0
+
+    def interval(self) -> float:
+        """
+        次の遷移までに空ける秒数。
+        """
+        return min(self.max_interval, self.min_interval + self.error_rate * self.max_interval)
+
+    def timeout(self) -> float:
+        """
+        次の遷移のタイムアウト（秒）。
+        """
+        return min(self.max_timeout, max(self.min_timeout, self.latency + 4 * self.deviation))
+
+    def timeout_ms(self) -> float:
+        """
+        Playwrightに渡すタイムアウト（ミリ秒）。
+        """
+        return self.timeout() * 1000
+
+    def observe(self, elapsed: float, ok: bool) -> None:
+        """
+        遷移の結果を記録する。
+
+        Parameters
+        --------
+        elapsed : float
+            遷移にかかった秒数
+        ok : bool
+            遷移が成功した場合はTrue
+        """
+        self.error_rate = 0.8 * self.error_rate + (0.0 if ok else 0.2)
+        if ok:
+            self.deviation = 0.75 * self.deviation + 0.25 * abs(self.latency - elapsed)
+            self.latency = 0.875 * self.latency + 0.125 * elapsed
+        else:
+            # タイムアウトなどの後は、次の遷移を長めに待つ
+            self.deviation = min(self.max_timeout, max(self.deviation * 2, elapsed))
+
+    @asynccontextmanager
+    async def step(self) -> AsyncIterator[None]:
+        """
+        1回の遷移を囲む。必要なら前の遷移から間隔を空け（rate_limiterがあればその制限も待ち）、
+        所要時間と成否を記録する。
+        """
+        wait = self.interval() - (time.monotonic() - self._last_finished)
+        if wait > 0:
+            PACING_DELAY.inc(wait)
+            await asyncio.sleep(wait)
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.observe(time.monotonic() - start, ok=False)
+            raise
+        else:
+            self.observe(time.monotonic() - start, ok=True)
+        finally:
+            self._last_finished = time.monotonic()
+
+
+# RealtimeOddsでpacerを指定しなかった場合に共有される
+default_pacer = AdaptivePacer()
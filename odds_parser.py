@@ -0,0 +1,391 @@
+"""
+オッズページHTMLの解析
+
+概要:
+    馬券種ごとのオッズページHTMLを1回だけlxmlで解析し、コンパイル済みXPathで
+    必要な値を1パスで取り出す。単勝・複勝は同じtanpukuページから同時に取り出す。
+    RealtimeOddsのextract_*メソッドはこのモジュールの関数を使用する。
+    いずれの関数もHTMLを受け取って結果を返すだけの純粋関数のため、
+    ProcessPoolExecutorの別プロセスで実行できる（extract_pool.py）。
+    組み合わせ馬券のページは1頭目の馬番ごとのブロック（馬連・馬単のli、3連複の
+    div.fuku3_unit、3連単のdiv.tan3_unit）に分けて読み取る（iter_blocks・iter_block_odds）。
+
+制限事項:
+    - セレクタはRealtimeOddsの従来のBeautifulSoup実装と同じ要素を指すように書かれている
+"""
+
+import re
+from typing import Any, Iterable, Iterator, Optional
+
+import lxml.html
+from lxml import etree
+
+from odds_table import BET_TYPE_SHAPES, OddsTable
+
+
+def _has_class(name: str) -> str:
+    """
+    XPathでクラス名を判定する条件式を返す（CSSの .name に相当）。
+    """
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# 単勝・複勝
+_TANPUKU_TABLE = etree.XPath(f"(//table[{_has_class('tanpuku')}])[1]")
+_TANPUKU_ROWS = etree.XPath(".//tbody//tr")
+_UMABAN = etree.XPath(f"(.//td[{_has_class('num')}])[1]")
+_ODDS_TAN = etree.XPath(f"(.//td[{_has_class('odds_tan')}])[1]")
+_ROW_TDS = etree.XPath(".//td")
+_FUKU_CLASSES = [
+    "odds_fuku",  # 最も一般的なクラス名
+    "odds_fukusho",
+    "odds_fuku1",
+    "odds_fuku2",
+    "odds_fuku3",
+]
+_ODDS_FUKU = [etree.XPath(f"(.//td[{_has_class(name)}])[1]") for name in _FUKU_CLASSES]
+_SPAN_MIN = etree.XPath(f"(.//span[{_has_class('min')}])[1]")
+
+# 馬連・馬単・3連複・3連単で共通の行（th: 相手馬番、td: オッズ）
+_CAPTION = etree.XPath("(.//caption)[1]")
+_TBODY_ROWS = etree.XPath(".//tbody//tr")
+_FIRST_TH = etree.XPath("(.//th)[1]")
+_FIRST_TD = etree.XPath("(.//td)[1]")
+_LIST_ITEMS = {
+    name: etree.XPath(f"//ul[{_has_class(name)}]//li")
+    for name in ("umaren_list", "umatan_list")
+}
+
+# 3連複
+_FUKU3_UNITS = etree.XPath(f"//div[{_has_class('fuku3_unit')}]")
+_FUKU3_FIRST = etree.XPath(
+    f"(.//h4//span[{_has_class('inner')}]//span[{_has_class('num')}])[1]"
+)
+_FUKU3_ITEMS = etree.XPath(f".//ul[{_has_class('fuku3_list')}]//li")
+_TABLE_CAPTION = etree.XPath("(.//table//caption)[1]")
+_TABLE_ROWS = etree.XPath(".//table//tbody//tr")
+_CAPTION_PATTERN = re.compile(r"(\d+)-(\d+)")
+
+# 3連単
+_TAN3_UNITS = etree.XPath(f"//div[{_has_class('tan3_unit')}]")
+_TAN3_FIRST = etree.XPath(f"(.//span[{_has_class('num')}])[1]")
+_TAN3_ITEMS = etree.XPath(f".//ul[{_has_class('tan3_list')}]//li")
+# CSSの div.p_line:nth-of-type(2) div.num に相当
+_TAN3_SECOND = etree.XPath(
+    f"(.//div[{_has_class('p_line')}][count(preceding-sibling::div) = 1]"
+    f"//div[{_has_class('num')}])[1]"
+)
+_TAN3_ROWS = etree.XPath(f".//table[{_has_class('tan3')}]//tbody//tr")
+
+
+def parse_document(html: str) -> etree._Element:
+    """
+    HTML文字列をlxmlの要素ツリーに変換する。
+    """
+    return lxml.html.document_fromstring(html)
+
+
+def _text(element: etree._Element) -> str:
+    return element.text_content().strip()
+
+
+def _first(xpath: etree.XPath, element: etree._Element) -> Optional[etree._Element]:
+    found = xpath(element)
+    return found[0] if found else None
+
+
+def _parse_odds(text: str) -> Optional[float]:
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _find_fuku_td(row: etree._Element, umaban: str) -> Optional[etree._Element]:
+    """
+    行から複勝オッズのtdを探す。クラス名で見つからない場合は単勝オッズの次のtdを使う。
+    """
+    for xpath in _ODDS_FUKU:
+        td = _first(xpath, row)
+        if td is not None:
+            return td
+    tds = _ROW_TDS(row)
+    for td in tds:
+        if "fuku" in td.get("class", "").lower():
+            return td
+    for idx, td in enumerate(tds):
+        if "odds_tan" in td.get("class", "").lower():
+            if idx + 1 < len(tds) and "odds_tan" not in tds[idx + 1].get("class", "").lower():
+                return tds[idx + 1]
+            break
+    td_info = [{"class": td.get("class", "").split(), "text": _text(td)[:20]} for td in tds]
+    print(f"警告: extract_fukusho - 馬番{umaban}の複勝オッズtdが見つかりません。td情報: {td_info}")
+    return None
+
+
+def parse_tanpuku(
+    html: str,
+) -> Optional[tuple[dict[int, float], dict[int, float]]]:
+    """
+    単勝・複勝ページを1回だけ解析し、単勝と複勝（下限）のオッズを同時に取り出す。
+
+    Parameters
+    --------
+    html : str
+        単勝・複勝オッズページのHTML
+
+    Returns
+    --------
+    Optional[tuple[dict[int, float], dict[int, float]]]
+        ({馬番: 単勝オッズ}, {馬番: 複勝オッズ下限})。table.tanpukuがない場合はNone。
+    """
+    table = _first(_TANPUKU_TABLE, parse_document(html))
+    if table is None:
+        return None
+    tansho = {}
+    fukusho = {}
+    for row in _TANPUKU_ROWS(table):
+        umaban_td = _first(_UMABAN, row)
+        if umaban_td is None:
+            print(f"No <td.num>")
+            continue
+        umaban = _text(umaban_td)
+        try:
+            horse = int(umaban)
+        except ValueError:
+            continue
+        tan_td = _first(_ODDS_TAN, row)
+        if tan_td is None:
+            print(f"No <td.odds_tan>")
+        else:
+            odds = _parse_odds(_text(tan_td))
+            if odds is not None:
+                tansho[horse] = odds
+        fuku_td = _find_fuku_td(row, umaban)
+        if fuku_td is None:
+            continue
+        min_span = _first(_SPAN_MIN, fuku_td)
+        if min_span is None:
+            print(f"警告: extract_fukusho - 馬番{umaban}の<span.min>が見つかりませんでした。")
+            continue
+        odds = _parse_odds(_text(min_span))
+        if odds is not None:
+            fukusho[horse] = odds
+    return tansho, fukusho
+
+
+def _horse(element: etree._Element) -> Optional[int]:
+    try:
+        return int(_text(element))
+    except ValueError:
+        return None
+
+
+def _iter_rows(
+    rows: list[etree._Element], prefix: tuple[int, ...]
+) -> Iterator[tuple[tuple[int, ...], float]]:
+    """
+    th（最後の馬番）とtd（オッズ）の行から、(馬番のタプル, オッズ)を順に返す。
+    """
+    for row in rows:
+        th = _first(_FIRST_TH, row)
+        if th is None:
+            print(f"No <th>")
+            continue
+        td = _first(_FIRST_TD, row)
+        if td is None:
+            print(f"No <td>")
+            continue
+        last_horse = _horse(th)
+        odds = _parse_odds(_text(td))
+        if last_horse is not None and odds is not None:
+            yield prefix + (last_horse,), odds
+
+
+def _iter_pair_item(item: etree._Element) -> Iterator[tuple[tuple[int, ...], float]]:
+    caption = _first(_CAPTION, item)
+    if caption is None:
+        print(f"No <caption>")
+        return
+    first_horse = _horse(caption)
+    if first_horse is None:
+        return
+    yield from _iter_rows(_TBODY_ROWS(item), (first_horse,))
+
+
+def _iter_fuku3_unit(unit: etree._Element) -> Iterator[tuple[tuple[int, ...], float]]:
+    first_elem = _first(_FUKU3_FIRST, unit)
+    if first_elem is None:
+        print(f"No <span.num>")
+        return
+    first_horse = _horse(first_elem)
+    if first_horse is None:
+        return
+    for item in _FUKU3_ITEMS(unit):
+        caption = _first(_TABLE_CAPTION, item)
+        if caption is None:
+            print(f"No <caption>")
+            continue
+        match = _CAPTION_PATTERN.search(caption.text_content())
+        if not match:
+            print(f"No match")
+            continue
+        second_horse = int(match.group(2))
+        yield from _iter_rows(_TABLE_ROWS(item), (first_horse, second_horse))
+
+
+def _iter_tan3_unit(unit: etree._Element) -> Iterator[tuple[tuple[int, ...], float]]:
+    first_elem = _first(_TAN3_FIRST, unit)
+    if first_elem is None:
+        print(f"No <span.num>")
+        return
+    first_horse = _horse(first_elem)
+    if first_horse is None:
+        return
+    for item in _TAN3_ITEMS(unit):
+        second_elem = _first(_TAN3_SECOND, item)
+        if second_elem is None:
+            print(f"No <div.num>")
+            continue
+        second_horse = _horse(second_elem)
+        if second_horse is None:
+            continue
+        yield from _iter_rows(_TAN3_ROWS(item), (first_horse, second_horse))
+
+
+# 組み合わせ馬券ごとの(ブロックを探すXPath, ブロック内の行の読み取り)
+_BLOCKS = {
+    "umaren": (_LIST_ITEMS["umaren_list"], _iter_pair_item),
+    "umatan": (_LIST_ITEMS["umatan_list"], _iter_pair_item),
+    "sanrenpuku": (_FUKU3_UNITS, _iter_fuku3_unit),
+    "sanrentan": (_TAN3_UNITS, _iter_tan3_unit),
+}
+
+
+def iter_blocks(bet_type: str, html: str) -> list[etree._Element]:
+    """
+    組み合わせ馬券のページを解析し、1頭目の馬番ごとのブロックの要素をページ上の順に返す。
+    各ブロックはiter_block_oddsで他のブロックと独立に読み取れる。
+    """
+    if bet_type not in _BLOCKS:
+        raise ValueError(f"組み合わせ馬券ではない馬券種です: {bet_type}")
+    return _BLOCKS[bet_type][0](parse_document(html))
+
+
+def iter_block_odds(
+    bet_type: str, block: etree._Element
+) -> Iterator[tuple[tuple[int, ...], float]]:
+    """
+    iter_blocksが返したブロックから(馬番のタプル, オッズ)を順に返す。
+    """
+    return _BLOCKS[bet_type][1](block)
+
+
+def iter_odds(bet_type: str, html: str) -> Iterator[tuple[tuple[int, ...], float]]:
+    """
+    組み合わせ馬券（馬連・馬単・3連複・3連単）のページを解析し、
+    (馬番のタプル, オッズ)をページ上の順に返す。
+
+    Parameters
+    --------
+    bet_type : str
+        "umaren", "umatan", "sanrenpuku", "sanrentan"のいずれか
+    html : str
+        オッズページのHTML
+    """
+    blocks = iter_blocks(bet_type, html)
+    return (row for block in blocks for row in iter_block_odds(bet_type, block))
+
+
+def format_kumi(horses: tuple[int, ...]) -> str:
+    """
+    馬番のタプルを"01,05"形式の組み合わせ文字列にする。
+    """
+    return ",".join(f"{horse:02d}" for horse in horses)
+
+
+def _to_dict(rows: Iterator[tuple[tuple[int, ...], float]]) -> dict[str, float]:
+    return {format_kumi(horses): odds for horses, odds in rows}
+
+
+def parse_umaren(html: str) -> dict[str, float]:
+    """
+    馬連ページを解析し、{"01,05"形式の組み合わせ: オッズ}を返す。
+    """
+    return _to_dict(iter_odds("umaren", html))
+
+
+def parse_umatan(html: str) -> dict[str, float]:
+    """
+    馬単ページを解析し、{"01,05"形式の組み合わせ: オッズ}を返す。
+    """
+    return _to_dict(iter_odds("umatan", html))
+
+
+def parse_sanrenpuku(html: str) -> dict[str, float]:
+    """
+    3連複ページを解析し、{"01,05,12"形式の組み合わせ: オッズ}を返す。
+    """
+    return _to_dict(iter_odds("sanrenpuku", html))
+
+
+def parse_sanrentan(html: str) -> dict[str, float]:
+    """
+    3連単ページを解析し、{"01,05,12"形式の組み合わせ: オッズ}を返す。
+    """
+    return _to_dict(iter_odds("sanrentan", html))
+
+
+def filter_rows(
+    rows: Iterator[tuple[tuple[int, ...], float]], horses: Optional[Iterable[int]]
+) -> Iterator[tuple[tuple[int, ...], float]]:
+    """
+    指定した馬番のいずれかを含む組み合わせだけを返す。horsesがNoneの場合は全て返す。
+    """
+    if horses is None:
+        return rows
+    horses = frozenset(horses)
+    return (row for row in rows if not horses.isdisjoint(row[0]))
+
+
+def filter_horses(odds: dict[int, float], horses: Optional[Iterable[int]]) -> dict[int, float]:
+    """
+    {馬番: オッズ}から指定した馬番だけを残す。horsesがNoneの場合はそのまま返す。
+    """
+    if horses is None:
+        return odds
+    horses = frozenset(horses)
+    return {horse: value for horse, value in odds.items() if horse in horses}
+
+
+def extract_page(
+    bet_type: str, html: str, horses: Optional[Iterable[int]] = None
+) -> dict[str, Any]:
+    """
+    1つの馬券種のオッズページからオッズを抽出する。
+
+    Parameters
+    --------
+    bet_type : str
+        "tanpuku", "umaren", "umatan", "sanrenpuku", "sanrentan"のいずれか
+    html : str
+        オッズページのHTML
+    horses : Iterable[int], optional
+        指定した場合、これらの馬番のいずれかを含む組み合わせ（単勝・複勝はその馬番）だけを返す。
+
+    Returns
+    --------
+    dict[str, Any]
+        {RealtimeOddsの属性名: オッズ}。単勝・複勝ページは{"tansho": ..., "fukusho": ...}、
+        組み合わせ馬券は{馬券種: OddsTable}。table.tanpukuがない場合や
+        対応していない馬券種の場合は空の辞書。
+    """
+    if bet_type == "tanpuku":
+        parsed = parse_tanpuku(html)
+        if parsed is None:
+            return {}
+        return {"tansho": filter_horses(parsed[0], horses), "fukusho": filter_horses(parsed[1], horses)}
+    if bet_type in BET_TYPE_SHAPES:
+        rows = filter_rows(iter_odds(bet_type, html), horses)
+        return {bet_type: OddsTable.from_rows(bet_type, rows)}
+    return {}
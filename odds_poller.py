@@ -0,0 +1,341 @@
+"""
+オッズの継続取得（ポーリング）
+
+概要:
+    登録したレースのオッズを発走時刻に向けて繰り返し取得し、
+    前回の取得結果から変化した組み合わせだけを通知する。
+    取得間隔は発走までの残り時間に応じて変え（遠いほど長く、直前ほど短く）、
+    同時刻に取得が集中しないように揺らぎ（ジッター）を加える。
+    jra.go.jpへのリクエストは全レースで共有するレート制限を通して行う。
+
+使用例:
+    async def on_change(event):
+        print(event["race_id"], event["changes"])
+
+    poller = OddsPoller(on_change=on_change)
+    poller.track("202505010411", post_time=datetime(2025, 5, 4, 15, 40))
+    await poller.run()
+"""
+
+import asyncio
+import inspect
+import random
+import time
+from collections.abc import Mapping
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+import numpy as np
+
+from extract_odds import RealtimeOdds
+from extract_pool import ExtractPool
+from fetchers import HttpFetcher
+from odds_incremental import IncrementalParser
+from odds_pacing import AdaptivePacer, RateLimiter
+from odds_table import OddsTable
+
+if TYPE_CHECKING:
+    from odds_store import OddsStore
+
+# (発走までの残り秒数の下限, 取得間隔の秒数)。上から順に判定する。
+DEFAULT_SCHEDULE = [
+    (3600, 300.0),
+    (1800, 120.0),
+    (600, 60.0),
+    (180, 20.0),
+    (0, 10.0),
+]
+
+# 抽出結果を保持するRealtimeOddsの属性名
+ODDS_ATTRIBUTES = ["tansho", "fukusho", "umaren", "umatan", "sanrenpuku", "sanrentan"]
+
+
+def poll_interval(seconds_to_post: float, schedule: list[tuple[float, float]] = DEFAULT_SCHEDULE) -> float:
+    """
+    発走までの残り秒数から取得間隔（秒）を返す。
+    """
+    for threshold, interval in schedule:
+        if seconds_to_post >= threshold:
+            return interval
+    return schedule[-1][1]
+
+
+def snapshot_odds(odds: RealtimeOdds) -> dict[str, Mapping]:
+    """
+    RealtimeOddsの抽出結果を{属性名: オッズ}の辞書にまとめる。
+    """
+    return {
+        name: getattr(odds, name)
+        for name in ODDS_ATTRIBUTES
+        if getattr(odds, name, None) is not None
+    }
+
+
+def _diff_tables(previous: OddsTable, current: OddsTable) -> dict[str, Optional[float]]:
+    """
+    OddsTable同士の差分を配列演算で求める。
+    """
+    before, after = previous.values, current.values
+    unchanged = (before == after) | (np.isnan(before) & np.isnan(after))
+    changes = {}
+    for index in np.argwhere(~unchanged).tolist():
+        horses = tuple(i + 1 for i in index)
+        changes[",".join(f"{horse:02d}" for horse in horses)] = current.odds(*horses)
+    return changes
+
+
+def diff_odds(previous: Mapping, current: Mapping) -> dict[Any, Optional[float]]:
+    """
+    1つの馬券種のオッズの差分を返す。
+
+    Returns
+    --------
+    dict
+        {キー: 新しいオッズ}。前回あって今回なくなったキーの値はNone。
+    """
+    if (
+        isinstance(previous, OddsTable)
+        and isinstance(current, OddsTable)
+        and previous.bet_type == current.bet_type
+    ):
+        return _diff_tables(previous, current)
+    changes = {key: odds for key, odds in current.items() if previous.get(key) != odds}
+    for key in previous.keys() - current.keys():
+        changes[key] = None
+    return changes
+
+
+def diff_snapshots(previous: dict[str, Mapping], current: dict[str, Mapping]) -> dict[str, dict]:
+    """
+    snapshot_oddsの結果同士の差分を返す。変化のない馬券種は含まない。
+    """
+    changes = {}
+    for name, odds in current.items():
+        bet_changes = diff_odds(previous.get(name, {}), odds)
+        if bet_changes:
+            changes[name] = bet_changes
+    return changes
+
+
+class OddsPoller:
+    """
+    登録したレースのオッズを繰り返し取得し、変化した組み合わせだけを通知するクラス。
+    """
+
+    def __init__(
+        self,
+        on_change: Callable[[dict], Any],
+        fetch: Optional[Callable[[str], Awaitable[dict[str, Mapping]]]] = None,
+        skip_bet_types: list[str] = ["wakuren", "wide"],
+        schedule: list[tuple[float, float]] = DEFAULT_SCHEDULE,
+        jitter: float = 0.1,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_concurrency: int = 4,
+        stop_after_post: float = 120.0,
+        idle_interval: float = 30.0,
+        store: Optional["OddsStore"] = None,
+        extract_pool: Optional[ExtractPool] = None,
+    ):
+        """
+        Parameters
+        --------
+        on_change : Callable[[dict], Any]
+            変化があった場合に呼び出す関数（asyncでもよい）。引数は
+            {"race_id", "timestamp", "changes": {属性名: {キー: オッズ}}, "initial"}
+        fetch : Callable[[str], Awaitable[dict]], optional
+            race_idを受け取りsnapshot_oddsの形式で返す取得関数。
+            指定しない場合はHttpFetcher（失敗時はPlaywright）でRealtimeOddsを使って取得する。
+        skip_bet_types : list[str], optional
+            既定の取得関数でスキップする馬券種のリスト。デフォルトは["wakuren", "wide"]
+        schedule : list[tuple[float, float]], optional
+            (発走までの残り秒数の下限, 取得間隔の秒数)のリスト
+        jitter : float, optional
+            取得間隔に加える揺らぎの割合。0.1なら±10%。デフォルトは0.1
+        rate_limiter : RateLimiter, optional
+            jra.go.jpへのリクエストのレート制限（単位は1秒あたりのリクエスト数）。
+            既定の取得関数では、HTTPのPOST・GETとブラウザの遷移・クリックの1回ごとに1トークンを使う
+            （1回の取得で馬券種のページ数＋遷移先を調べる分のリクエストになる）。
+            fetchを指定した場合は使われないため、取得関数側のHttpFetcher・AdaptivePacerに
+            同じRateLimiterを渡す。デフォルトは1秒あたり2リクエスト（連続4リクエストまで）
+        max_concurrency : int, optional
+            同時に取得するレース数の上限。デフォルトは4
+        stop_after_post : float, optional
+            発走時刻を過ぎてから取得を続ける秒数。デフォルトは120.0
+        idle_interval : float, optional
+            発走時刻を指定せずにtrackしたレースの取得間隔（秒）。デフォルトは30.0
+        store : OddsStore, optional
+            指定した場合、変化の有無にかかわらず取得した全てのスナップショットを追記する。
+            書き込みはOddsStoreのflush_rows・flush_intervalに従い、レースの取得を終えた時点で
+            そのレースの残りの行を書き込む。
+        extract_pool : ExtractPool, optional
+            既定の取得関数でオッズの抽出を別プロセスで行う場合に指定する。
+            指定しない場合は、前回の取得から変わったブロックだけを解析し直す（IncrementalParser）。
+        """
+        self.on_change = on_change
+        self.fetch = fetch or self._fetch_with_realtime_odds
+        self.skip_bet_types = skip_bet_types
+        self.schedule = schedule
+        self.jitter = jitter
+        self.rate_limiter = rate_limiter or RateLimiter(rate=2.0, burst=4)
+        self.max_concurrency = max_concurrency
+        self.stop_after_post = stop_after_post
+        self.idle_interval = idle_interval
+        self.store = store
+        self.extract_pool = extract_pool
+        self._post_times: dict[str, Optional[datetime]] = {}
+        self._snapshots: dict[str, dict[str, Mapping]] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._fetcher: Optional[HttpFetcher] = None
+        self._pacer = AdaptivePacer(rate_limiter=self.rate_limiter)
+        self._incremental = IncrementalParser()
+        self._running = False
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def track(self, race_id: str, post_time: Optional[datetime] = None) -> None:
+        """
+        レースを取得対象に追加する（run実行中でもよい）。
+        post_timeを指定しない場合は、untrackするまでidle_interval秒ごとに取得する。
+        """
+        self._post_times[race_id] = post_time
+        if self._running and race_id not in self._tasks:
+            self._start(race_id)
+
+    def untrack(self, race_id: str) -> None:
+        """
+        レースを取得対象から外す。
+        """
+        self._post_times.pop(race_id, None)
+        self._snapshots.pop(race_id, None)
+        task = self._tasks.pop(race_id, None)
+        if task is not None:
+            task.cancel()
+
+    def latest(self, race_id: str) -> Optional[dict[str, Mapping]]:
+        """
+        レースの最新の取得結果を返す。まだ取得していない場合はNone。
+        """
+        return self._snapshots.get(race_id)
+
+    async def run(self, forever: bool = False) -> None:
+        """
+        登録された全レースの発走後まで取得を続ける。
+
+        Parameters
+        --------
+        forever : bool, optional
+            Trueの場合、取得中のレースがなくなっても終了せず、新たにtrackされるのを待つ
+            （サーバーで購読者が来るたびにレースを追加する場合など）。デフォルトはFalse
+        """
+        self._running = True
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        try:
+            for race_id in list(self._post_times):
+                self._start(race_id)
+            while True:
+                if self._tasks:
+                    await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+                elif forever:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                else:
+                    break
+        finally:
+            self._running = False
+            for task in self._tasks.values():
+                task.cancel()
+            self._tasks.clear()
+            if self.store is not None:
+                self.store.flush()
+            if self._fetcher is not None:
+                await self._fetcher.close()
+                self._fetcher = None
+
+    def _start(self, race_id: str) -> None:
+        task = asyncio.create_task(self._poll_race(race_id))
+
+        def remove(done: asyncio.Task) -> None:
+            if self._tasks.get(race_id) is done:
+                del self._tasks[race_id]
+
+        task.add_done_callback(remove)
+        self._tasks[race_id] = task
+        self._wakeup.set()
+
+    def _next_interval(self, race_id: str) -> Optional[float]:
+        """
+        次の取得までの間隔（秒）を返す。取得を終えるレースの場合はNone。
+        """
+        if race_id not in self._post_times:
+            return None
+        post_time = self._post_times[race_id]
+        if post_time is None:
+            return self.idle_interval
+        seconds_to_post = (post_time - datetime.now(post_time.tzinfo)).total_seconds()
+        if seconds_to_post < -self.stop_after_post:
+            return None
+        return poll_interval(seconds_to_post, self.schedule)
+
+    async def _poll_race(self, race_id: str) -> None:
+        try:
+            await self._poll_race_until_done(race_id)
+        finally:
+            if self.store is not None:
+                # 取得を終えた（untrackされた）レースの行をメモリに残さない
+                self.store.flush_race(race_id)
+
+    async def _poll_race_until_done(self, race_id: str) -> None:
+        failures = 0
+        while True:
+            interval = self._next_interval(race_id)
+            if interval is None:
+                return
+            try:
+                async with self._semaphore:
+                    snapshot = await self.fetch(race_id)
+                failures = 0
+                await self._emit_changes(race_id, snapshot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                # 失敗が続く場合は間隔を広げる（最大で通常の8倍）
+                interval *= 2 ** min(failures, 3)
+                print(f"警告: OddsPoller - {race_id}の取得に失敗しました（{failures}回連続）: {e}")
+            await asyncio.sleep(interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def _emit_changes(self, race_id: str, snapshot: dict[str, Mapping]) -> None:
+        if self.store is not None:
+            self.store.append(race_id, snapshot)
+        previous = self._snapshots.get(race_id)
+        self._snapshots[race_id] = snapshot
+        changes = diff_snapshots(previous or {}, snapshot)
+        if not changes:
+            return
+        result = self.on_change({
+            "race_id": race_id,
+            "timestamp": time.time(),
+            "changes": changes,
+            "initial": previous is None,
+        })
+        if inspect.isawaitable(result):
+            await result
+
+    async def _fetch_with_realtime_odds(self, race_id: str) -> dict[str, Mapping]:
+        if self._fetcher is None:
+            self._fetcher = HttpFetcher(rate_limiter=self.rate_limiter)
+        odds = RealtimeOdds(
+            race_id,
+            fetcher=self._fetcher,
+            pacer=self._pacer,
+            profile="lean",
+            extraction="dom",
+            incremental=self._incremental,
+        )
+        await odds.scrape_html(skip_bet_types=self.skip_bet_types)
+        if self.extract_pool is not None:
+            await odds.extract_all_async(self.extract_pool)
+        else:
+            odds.extract_all()
+        return snapshot_odds(odds)
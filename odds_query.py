@@ -0,0 +1,207 @@
+"""
+組み合わせ馬券のオッズ検索
+
+概要:
+    OddsTableに対して、よく使う問い合わせを全件ソートせずに答える。
+        - オッズの低い順の上位k件
+        - 指定した馬番を含む組み合わせ（オッズの低い順）
+        - 指定した組み合わせのオッズ
+    馬番ごとの組み合わせの位置は初回の問い合わせ時に作成して使い回すため、
+    同じレースに何度も問い合わせる場合（APIや複数レースの一括分析）に向く。
+
+使用例:
+    query = OddsQuery.for_odds("umaren", odds_extractor.umaren)
+    query.top(2)            # [((1, 5), 3.2), ((5, 9), 4.8)]
+    query.containing(5)     # 5番を含む組み合わせをオッズ順に
+    query.pair(1, 9)        # 1-9のオッズ
+
+    APIのクエリ（bet_types・horses）に応じて必要なオッズだけを選ぶ関数も提供する。
+"""
+
+from collections.abc import Iterable, Mapping
+from typing import Optional
+
+import numpy as np
+
+from extract_odds import ODDS_PAGES
+from odds_parser import filter_horses
+from odds_table import MAX_HORSES, OddsTable
+
+# APIで既定で返すオッズ（RealtimeOddsの属性名）
+DEFAULT_ODDS_NAMES = ["tansho", "fukusho", "umaren"]
+
+
+def parse_odds_request(
+    bet_types: Optional[str], horses: Optional[str]
+) -> tuple[list[str], Optional[frozenset[int]]]:
+    """
+    APIのクエリパラメータを解釈する。
+
+    Parameters
+    --------
+    bet_types : str, optional
+        "tansho,umaren"のようなカンマ区切りの属性名。指定しない場合はDEFAULT_ODDS_NAMES
+    horses : str, optional
+        "5,9"のようなカンマ区切りの馬番。指定しない場合は全ての馬番
+
+    Returns
+    --------
+    tuple[list[str], Optional[frozenset[int]]]
+        (属性名のリスト, 馬番の集合またはNone)。不正な値の場合はValueErrorを送出する。
+    """
+    names = DEFAULT_ODDS_NAMES
+    if bet_types:
+        names = list(dict.fromkeys(name.strip() for name in bet_types.split(",") if name.strip()))
+        unknown = [name for name in names if name not in ODDS_PAGES]
+        if unknown or not names:
+            raise ValueError(f"bet_typesには{', '.join(ODDS_PAGES)}を指定してください: {bet_types}")
+    selected = None
+    if horses:
+        try:
+            selected = frozenset(int(horse) for horse in horses.split(",") if horse.strip())
+        except ValueError:
+            raise ValueError(f"horsesにはカンマ区切りの馬番を指定してください: {horses}") from None
+        if not selected or any(not 1 <= horse <= MAX_HORSES for horse in selected):
+            raise ValueError(f"horsesには1から{MAX_HORSES}の馬番を指定してください: {horses}")
+    return names, selected
+
+
+def pages_for(names: Iterable[str]) -> list[str]:
+    """
+    属性名のリストから取得が必要なオッズページの馬券種（キャッシュのキーに使う）を返す。
+    """
+    return sorted({ODDS_PAGES[name] for name in names})
+
+
+def subset_odds(
+    odds: Mapping[str, Mapping], names: Iterable[str], horses: Optional[Iterable[int]] = None
+) -> dict[str, Mapping]:
+    """
+    取得結果から指定したオッズだけを選ぶ（OddsTableはOddsTableのまま返す）。
+    horsesを指定した場合はその馬番のいずれかを含む組み合わせ（単勝・複勝はその馬番）だけを残す。
+    """
+    selected = {}
+    for name in names:
+        values = odds.get(name, {})
+        if horses is not None:
+            if isinstance(values, OddsTable):
+                values = values.containing_any(horses)
+            elif not isinstance(next(iter(values), 0), str):
+                values = filter_horses(values, horses)
+            else:
+                values = OddsTable.from_dict(name, values).containing_any(horses)
+        selected[name] = values
+    return selected
+
+
+def select_odds(
+    odds: Mapping[str, Mapping], names: Iterable[str], horses: Optional[Iterable[int]] = None
+) -> dict[str, dict]:
+    """
+    subset_oddsの結果をJSONに変換できる辞書にする。
+    """
+    return {
+        name: values.to_dict() if isinstance(values, OddsTable) else dict(values)
+        for name, values in subset_odds(odds, names, horses).items()
+    }
+
+
+def _select_smallest(odds: np.ndarray, candidates: np.ndarray, k: Optional[int]) -> np.ndarray:
+    """
+    candidatesの位置のうちオッズの低い順にk件の位置を返す（kがNoneの場合は全件）。
+
+    np.partitionでk番目の値を求めてから候補を絞るため、全件ソートより少ない計算で済む。
+    同じオッズの場合は元の並び順（馬番の辞書順）を保つ。
+    """
+    values = odds[candidates]
+    if k is not None and k < len(candidates):
+        if k <= 0:
+            return candidates[:0]
+        kth = np.partition(values, k - 1)[k - 1]
+        within = values <= kth
+        candidates, values = candidates[within], values[within]
+    order = np.argsort(values, kind="stable")
+    return candidates[order][:k]
+
+
+class OddsQuery:
+    """
+    OddsTableに対する問い合わせをまとめたクラス。
+    """
+
+    def __init__(self, table: OddsTable):
+        self.table = table
+        self._horses: Optional[np.ndarray] = None
+        self._odds: Optional[np.ndarray] = None
+        self._by_horse: Optional[list[np.ndarray]] = None
+
+    @classmethod
+    def for_odds(cls, bet_type: str, odds: Mapping[str, float]) -> "OddsQuery":
+        """
+        OddsTableまたは{"01,05"形式の組み合わせ: オッズ}の辞書から作成する。
+        """
+        if not isinstance(odds, OddsTable):
+            odds = OddsTable.from_dict(bet_type, odds)
+        return cls(odds)
+
+    def _load(self) -> None:
+        if self._horses is None:
+            self._horses, self._odds = self.table.combinations()
+
+    def _positions_with(self, horse: int) -> np.ndarray:
+        """
+        馬番を含む組み合わせの位置を返す。全馬番分を初回にまとめて作成する。
+        """
+        self._load()
+        if self._by_horse is None:
+            self._by_horse = [
+                np.flatnonzero((self._horses == h).any(axis=1))
+                for h in range(1, MAX_HORSES + 1)
+            ]
+        if not 1 <= horse <= MAX_HORSES:
+            return np.empty(0, dtype=np.intp)
+        return self._by_horse[horse - 1]
+
+    def _results(self, positions: np.ndarray) -> list[tuple[tuple[int, ...], float]]:
+        return [
+            (tuple(horses), round(odds, 1))
+            for horses, odds in zip(
+                self._horses[positions].tolist(), self._odds[positions].tolist()
+            )
+        ]
+
+    def top(self, k: int) -> list[tuple[tuple[int, ...], float]]:
+        """
+        オッズの低い順に上位k件の(馬番のタプル, オッズ)を返す。
+        """
+        self._load()
+        return self._results(
+            _select_smallest(self._odds, np.arange(len(self._odds)), k)
+        )
+
+    def containing(
+        self, horse: int, k: Optional[int] = None, position: Optional[int] = None
+    ) -> list[tuple[tuple[int, ...], float]]:
+        """
+        馬番を含む組み合わせをオッズの低い順に返す。
+
+        Parameters
+        --------
+        horse : int
+            軸とする馬番
+        k : int, optional
+            返す件数。指定しない場合は全件
+        position : int, optional
+            馬単・3連単で着順を固定する場合の位置（0始まり、0なら1着）。
+            指定しない場合はどの位置でもよい。
+        """
+        candidates = self._positions_with(horse)
+        if position is not None:
+            candidates = candidates[self._horses[candidates, position] == horse]
+        return self._results(_select_smallest(self._odds, candidates, k))
+
+    def pair(self, *horses: int) -> Optional[float]:
+        """
+        組み合わせのオッズを返す（馬連・3連複は順不同）。オッズがない場合はNone。
+        """
+        return self.table.odds(*horses)
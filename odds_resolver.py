@@ -0,0 +1,144 @@
+"""
+オッズページの遷移先キャッシュ
+
+概要:
+    JRA公式サイトのオッズページは、リンクのonclickに書かれた
+    doAction('/JRADB/accessO.html', 'pw151ou...') によるフォームPOSTで表示される。
+    一度クリックでたどり着いたレースについて、馬券種ごとの遷移先（URLとcname）を
+    記録しておき、次回以降はトップページからのクリック遷移を省略して直接開く。
+
+制限事項:
+    - cnameの形式はJRA公式サイトの実装に依存するため、直接遷移に失敗した場合は
+      呼び出し側でキャッシュを破棄してクリック遷移に戻すこと
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urljoin
+
+from playwright.async_api import Page
+
+JRA_BASE_URL = "https://www.jra.go.jp/"
+DO_ACTION_PATTERN = re.compile(r"doAction\(\s*'([^']*)'\s*,\s*'([^']*)'\s*\)")
+
+# doActionと同じ形式のフォームを組み立てて送信するスクリプト
+_SUBMIT_FORM_JS = """
+([action, cname]) => {
+    const form = document.createElement("form");
+    form.method = "POST";
+    form.action = action;
+    const input = document.createElement("input");
+    input.type = "hidden";
+    input.name = "cname";
+    input.value = cname;
+    form.appendChild(input);
+    document.body.appendChild(form);
+    form.submit();
+}
+"""
+
+
+def parse_link_target(onclick: Optional[str], href: Optional[str]) -> Optional[dict]:
+    """
+    リンクのonclick属性またはhref属性から遷移先を取り出す。
+
+    Parameters
+    --------
+    onclick : str, optional
+        リンクのonclick属性
+    href : str, optional
+        リンクのhref属性
+
+    Returns
+    --------
+    Optional[dict]
+        {"url": 絶対URL, "cname": cnameまたはNone}。遷移先が分からない場合はNone。
+        cnameがNoneの場合はGETで開くページを表す。
+    """
+    for attr in (onclick, href):
+        if not attr:
+            continue
+        match = DO_ACTION_PATTERN.search(attr)
+        if match:
+            return {"url": urljoin(JRA_BASE_URL, match.group(1)), "cname": match.group(2)}
+    if href and not href.startswith(("#", "javascript:")):
+        return {"url": urljoin(JRA_BASE_URL, href), "cname": None}
+    return None
+
+
+async def open_target(page: Page, target: dict, timeout: Optional[float] = None) -> None:
+    """
+    parse_link_targetで得た遷移先をページで開き、DOMContentLoadedまで待つ。
+
+    Parameters
+    --------
+    page : Page
+        遷移させるページ
+    target : dict
+        parse_link_targetで得た遷移先
+    timeout : float, optional
+        タイムアウト（ミリ秒）。指定しない場合はPlaywrightの既定値
+    """
+    if target["cname"] is None:
+        await page.goto(target["url"], wait_until="domcontentloaded", timeout=timeout)
+    else:
+        async with page.expect_navigation(wait_until="domcontentloaded", timeout=timeout):
+            await page.evaluate(_SUBMIT_FORM_JS, [target["url"], target["cname"]])
+
+
+class OddsPageResolver:
+    """
+    race_idと馬券種ごとに、オッズページの遷移先を記録するキャッシュ。
+
+    cache_pathを指定した場合はJSONファイルに保存し、プロセスをまたいで再利用する。
+    """
+
+    def __init__(self, cache_path: Optional[Path] = None):
+        self.cache_path = Path(cache_path) if cache_path is not None else None
+        self._targets: dict[str, dict[str, dict]] = {}
+        if self.cache_path is not None and self.cache_path.exists():
+            try:
+                self._targets = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                print(f"警告: OddsPageResolver - キャッシュを読み込めませんでした: {e}")
+
+    def get_targets(self, race_id: str) -> dict[str, dict]:
+        """
+        記録済みの{馬券種: 遷移先}を返す。未記録の場合は空の辞書。
+        """
+        return dict(self._targets.get(race_id, {}))
+
+    def remember(self, race_id: str, targets: dict[str, dict]) -> None:
+        """
+        レースの{馬券種: 遷移先}を記録する。
+        """
+        if not targets:
+            return
+        self._targets[race_id] = dict(targets)
+        self._save()
+
+    def forget(self, race_id: str) -> None:
+        """
+        レースの記録を破棄する（直接遷移に失敗した場合に使用）。
+        """
+        if self._targets.pop(race_id, None) is not None:
+            self._save()
+
+    def _save(self) -> None:
+        if self.cache_path is None:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix(self.cache_path.suffix + ".tmp")
+            tmp_path.write_text(
+                json.dumps(self._targets, ensure_ascii=False), encoding="utf-8"
+            )
+            tmp_path.replace(self.cache_path)
+        except OSError as e:
+            print(f"警告: OddsPageResolver - キャッシュを保存できませんでした: {e}")
+
+
+# RealtimeOddsでresolverを指定しなかった場合に共有されるキャッシュ
+default_resolver = OddsPageResolver()
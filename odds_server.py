@@ -0,0 +1,481 @@
+"""
+オッズ取得APIサーバー（ASGI）
+
+概要:
+    api/odds.py（Vercel Serverless Function）と同じ /api/odds?race_id= を提供するASGIアプリ。
+    リクエストごとにイベントループやブラウザを作らず、プロセス内で次のものを共有する。
+        - イベントループ（uvicornのもの）
+        - BrowserPool（起動済みChromium）とHttpFetcher（HTTPの接続プール）
+        - OddsCache（TTLキャッシュ、同じレースへの同時リクエストは1回の取得にまとめる）
+        - ExtractPool（オッズの解析を別プロセスで行う）
+    /api/odds/stream（SSE）と /api/odds/ws（WebSocket）では、購読したレースのオッズを
+    最初に全体、以降は変化分だけ送り続ける。取得はレースごとに1つのOddsPollerが行い、
+    同じレースの全購読者に配る（odds_stream.py）。
+    同時に取得するレース数に上限を設け、混雑時は待たせ続けずにエラーを返す。
+        - 429: 取得待ちのリクエストが上限に達している
+        - 503: 取得待ちのまま一定時間が経過した
+        - 504: 取得が時間内に終わらなかった（取得自体は続け、結果はキャッシュに保存する）
+
+起動方法:
+    uvicorn odds_server:app --host 0.0.0.0 --port 8000
+
+環境変数:
+    ODDS_SERVER_MAX_CONCURRENCY: 同時に取得するレース数の上限（デフォルト: 4）
+    ODDS_SERVER_MAX_PENDING: 取得待ちのリクエスト数の上限（デフォルト: 32）
+    ODDS_SERVER_QUEUE_TIMEOUT: 取得待ちの最大秒数（デフォルト: 10）
+    ODDS_SERVER_TIMEOUT: 1リクエストの最大秒数（デフォルト: 50）
+    ODDS_SERVER_STREAM_INTERVAL: 配信中のレースの取得間隔（秒、デフォルト: 15）
+    ODDS_SERVER_MAX_SUBSCRIBERS: 配信の同時購読者数の上限（デフォルト: 1000）
+    ODDS_SERVER_RATE_LIMIT: jra.go.jpへの1秒あたりのリクエスト数の上限（デフォルト: 5）
+    ODDS_TRACE_LOG: 取得の段階ごとのJSONログの出力先（odds_metrics.py）
+
+計測:
+    /metrics で取得の段階ごとの所要時間・やり直し・取得したバイト数・抽出件数・
+    キャッシュの参照結果をPrometheusのテキスト形式で返す（odds_metrics.py）。
+
+レスポンスの形式:
+    /api/odds はAcceptヘッダーに application/x-odds-packed を含む場合、JSONの代わりに
+    odds_codec.pyのpacked形式（バイナリ）で返す。Accept-Encodingに応じてbrotli
+    （brotliパッケージがある場合）またはgzipで圧縮する。エラーは常にJSONで返す。
+"""
+
+import asyncio
+import gzip
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+try:
+    import brotli
+except ImportError:  # brotliがない環境ではgzipのみ
+    brotli = None
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from browser_pool import BrowserPool
+from extract_odds import RealtimeOdds, skip_bet_types_for
+from extract_pool import ExtractPool
+from fetchers import HttpFetcher
+from odds_cache import OddsCache, default_odds_cache
+from odds_codec import MEDIA_TYPE as PACKED_MEDIA_TYPE
+from odds_codec import encode_odds
+from odds_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from odds_metrics import render_metrics
+from odds_pacing import AdaptivePacer, RateLimiter
+from odds_poller import OddsPoller, snapshot_odds
+from odds_query import pages_for, parse_odds_request, select_odds, subset_odds
+from odds_stream import OddsBroadcaster
+
+# オッズ表示に使用する馬券種（api/odds.pyと同じ）
+ODDS_BET_TYPES = ["tanpuku", "umaren"]
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+# これより小さいレスポンスは圧縮しない（バイト）
+MIN_COMPRESS_SIZE = 512
+
+
+class ServiceUnavailable(Exception):
+    """
+    混雑のためリクエストを受け付けられない場合の例外。
+    """
+
+    def __init__(self, status_code: int, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    同時実行数の上限と、待ち行列の長さ・待ち時間の上限を持つリミッター。
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.pending = 0
+        self.active = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        実行枠を1つ借りる。待ち行列が一杯の場合や待ち時間を超えた場合はServiceUnavailableを送出する。
+        """
+        if not self._semaphore.locked():
+            # 空きがある場合は待たずに借りられる
+            await self._semaphore.acquire()
+        elif self.pending >= self.max_pending:
+            raise ServiceUnavailable(429, "リクエストが混雑しています。時間をおいて再度お試しください。")
+        else:
+            self.pending += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise ServiceUnavailable(
+                    503, "オッズの取得待ちが上限時間を超えました。", retry_after=max(1, int(self.queue_timeout))
+                ) from None
+            finally:
+                self.pending -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+class OddsService:
+    """
+    サーバー内で共有する取得資源（ブラウザプール・HTTP接続・キャッシュ・解析プロセス）をまとめたクラス。
+    """
+
+    def __init__(
+        self,
+        cache: Optional[OddsCache] = None,
+        max_concurrency: int = 4,
+        max_pending: int = 32,
+        queue_timeout: float = 10.0,
+        timeout: float = 50.0,
+        delay_time: Optional[int] = None,
+        stream_interval: float = 15.0,
+        max_subscribers: int = 1000,
+        rate_limit: float = 5.0,
+    ):
+        """
+        Parameters
+        --------
+        cache : OddsCache, optional
+            取得結果のキャッシュ。指定しない場合はdefault_odds_cache
+        max_concurrency : int, optional
+            同時に取得するレース数の上限。デフォルトは4
+        max_pending : int, optional
+            取得待ちのリクエスト数の上限。超えた場合は429を返す。デフォルトは32
+        queue_timeout : float, optional
+            取得待ちの最大秒数。超えた場合は503を返す。デフォルトは10.0
+        timeout : float, optional
+            1リクエストの最大秒数。超えた場合は504を返す。デフォルトは50.0
+        delay_time : int, optional
+            ブラウザでの取得時にクリックごとに加える遅延（ミリ秒）。
+            デフォルトはNone（遷移の完了を待ち、間隔はAdaptivePacerが決める）
+        stream_interval : float, optional
+            配信中のレースの取得間隔（秒）。デフォルトは15.0
+        max_subscribers : int, optional
+            配信の同時購読者数の上限。超えた場合は429を返す。デフォルトは1000
+        rate_limit : float, optional
+            jra.go.jpへの1秒あたりのリクエスト数の上限。APIと配信の全ての取得
+            （HTTPのPOST・GET、ブラウザの遷移・クリック）で共有する。デフォルトは5.0
+        """
+        self.cache = cache if cache is not None else default_odds_cache
+        self.limiter = ConcurrencyLimiter(max_concurrency, max_pending, queue_timeout)
+        self.timeout = timeout
+        self.delay_time = delay_time
+        self.browser_pool: Optional[BrowserPool] = None
+        self.fetcher: Optional[HttpFetcher] = None
+        self.extract_pool: Optional[ExtractPool] = None
+        self.max_subscribers = max_subscribers
+        self.rate_limiter = RateLimiter(rate=rate_limit, burst=max(1, int(rate_limit)))
+        self.pacer = AdaptivePacer(rate_limiter=self.rate_limiter)
+        self.broadcaster = OddsBroadcaster()
+        # 配信の取得はAPIの実行枠を使わず（同時取得数はOddsPollerのmax_concurrencyで制限）、
+        # jra.go.jpへのリクエストごとのレート制限はHttpFetcher・AdaptivePacerの共有RateLimiterで行う
+        self.poller = OddsPoller(
+            on_change=self.broadcaster.publish,
+            fetch=lambda race_id: self.refresh(race_id, ODDS_BET_TYPES),
+            idle_interval=stream_interval,
+        )
+        self.broadcaster.poller = self.poller
+        self._poller_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "OddsService":
+        return cls(
+            max_concurrency=int(os.environ.get("ODDS_SERVER_MAX_CONCURRENCY", "4")),
+            max_pending=int(os.environ.get("ODDS_SERVER_MAX_PENDING", "32")),
+            queue_timeout=float(os.environ.get("ODDS_SERVER_QUEUE_TIMEOUT", "10")),
+            timeout=float(os.environ.get("ODDS_SERVER_TIMEOUT", "50")),
+            stream_interval=float(os.environ.get("ODDS_SERVER_STREAM_INTERVAL", "15")),
+            max_subscribers=int(os.environ.get("ODDS_SERVER_MAX_SUBSCRIBERS", "1000")),
+            rate_limit=float(os.environ.get("ODDS_SERVER_RATE_LIMIT", "5")),
+        )
+
+    async def start(self) -> None:
+        self.browser_pool = BrowserPool(max_size=max(1, self.limiter.max_concurrency // 2), profile="lean")
+        await self.browser_pool.start()
+        self.fetcher = HttpFetcher(rate_limiter=self.rate_limiter)
+        self.extract_pool = ExtractPool()
+        self.start_streaming()
+
+    def start_streaming(self) -> None:
+        """
+        配信用のOddsPollerを起動する（購読されたレースだけを取得する）。
+        """
+        self._poller_task = asyncio.create_task(self.poller.run(forever=True))
+
+    async def close(self) -> None:
+        if self._poller_task is not None:
+            self._poller_task.cancel()
+            await asyncio.gather(self._poller_task, return_exceptions=True)
+        if self.fetcher is not None:
+            await self.fetcher.close()
+        if self.browser_pool is not None:
+            await self.browser_pool.close()
+        if self.extract_pool is not None:
+            self.extract_pool.close()
+
+    async def scrape(self, race_id: str, bet_types: list[str]) -> dict:
+        """
+        実行枠を借りてオッズを取得・抽出する（キャッシュを使わない）。
+
+        Returns
+        --------
+        dict
+            {RealtimeOddsの属性名: オッズ}（api/odds.pyのscrape_oddsと同じ形式）
+        """
+        async with self.limiter.slot():
+            return await self._fetch(race_id, bet_types)
+
+    async def refresh(self, race_id: str, bet_types: list[str]) -> dict:
+        """
+        配信用にオッズを取得し直し、結果をキャッシュに保存する。
+        APIの実行枠は使わないため、混雑時も配信の取得はServiceUnavailableにならない。
+        """
+        odds = await self._fetch(race_id, bet_types)
+        self.cache.put(race_id, bet_types, odds)
+        return odds
+
+    async def _fetch(self, race_id: str, bet_types: list[str]) -> dict:
+        odds = RealtimeOdds(
+            race_id,
+            browser_pool=self.browser_pool,
+            fetcher=self.fetcher,
+            pacer=self.pacer,
+            extraction="dom",
+        )
+        await odds.scrape_html(
+            skip_bet_types=skip_bet_types_for(bet_types),
+            delay_time=self.delay_time,
+        )
+        await odds.extract_all_async(self.extract_pool)
+        return snapshot_odds(odds)
+
+    async def get_odds(self, race_id: str, bet_types: list[str] = ODDS_BET_TYPES) -> dict:
+        """
+        キャッシュを通してオッズを取得する。
+
+        timeout秒を超えた場合はasyncio.TimeoutErrorを送出するが、取得自体は続けて
+        結果をキャッシュに保存する（直後の再リクエストはキャッシュから返る）。
+        """
+        cached = self.cache.get(race_id, bet_types)
+        if cached is not None:
+            return cached
+        task = asyncio.ensure_future(
+            self.cache.get_or_fetch(race_id, bet_types, lambda: self.scrape(race_id, bet_types))
+        )
+        # タイムアウト後に失敗した場合の例外は誰も受け取らないため、ここで回収する
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+
+
+def error_response(status_code: int, message: str, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse(
+        {"success": False, "error": message},
+        status_code=status_code,
+        headers={**CORS_HEADERS, **(headers or {})},
+    )
+
+
+async def odds_endpoint(request: Request) -> Response:
+    """
+    GET /api/odds?race_id= : api/odds.pyと同じ形式でオッズを返す。
+
+    bet_types（例: tansho,umaren）を指定した場合はそのオッズのページだけを取得して返し、
+    horses（例: 5,9）を指定した場合はその馬番を含む組み合わせだけを返す。
+    """
+    if request.method == "OPTIONS":
+        return Response(status_code=200, headers=CORS_HEADERS)
+    race_id = request.query_params.get("race_id")
+    if not race_id:
+        return error_response(400, "race_idパラメータが必要です")
+    try:
+        names, horses = parse_odds_request(
+            request.query_params.get("bet_types"), request.query_params.get("horses")
+        )
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    service: OddsService = request.app.state.service
+    try:
+        odds = await service.get_odds(race_id, pages_for(names))
+    except ServiceUnavailable as e:
+        return error_response(e.status_code, str(e), {"Retry-After": str(e.retry_after)})
+    except asyncio.TimeoutError:
+        return error_response(504, "オッズの取得がタイムアウトしました。")
+    except Exception as e:
+        return error_response(500, str(e))
+    if PACKED_MEDIA_TYPE in request.headers.get("accept", ""):
+        body = encode_odds(subset_odds(odds, names, horses))
+        media_type = PACKED_MEDIA_TYPE
+    else:
+        body = json.dumps({"success": True, "data": select_odds(odds, names, horses)}).encode("utf-8")
+        media_type = "application/json"
+    return compressed_response(request, body, media_type)
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    encodings = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") not in ("q=0", "q=0.0"):
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+def compressed_response(request: Request, body: bytes, media_type: str) -> Response:
+    """
+    Accept-Encodingに応じてbrotliまたはgzipで圧縮したレスポンスを作成する。
+    """
+    headers = {**CORS_HEADERS, "Vary": "Accept, Accept-Encoding"}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            body = brotli.compress(body, quality=5)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def _check_subscription(service: OddsService) -> None:
+    if service.broadcaster.subscriber_count() >= service.max_subscribers:
+        raise ServiceUnavailable(429, "配信の購読者数が上限に達しています。")
+
+
+async def _with_heartbeat(
+    events: AsyncIterator[dict], interval: float
+) -> AsyncIterator[Optional[dict]]:
+    """
+    イベントを順に返し、interval秒イベントがない場合はNone（ハートビート）を返す。
+    """
+    next_event = asyncio.ensure_future(events.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_event}, timeout=interval)
+            if not done:
+                yield None
+                continue
+            yield next_event.result()
+            next_event = asyncio.ensure_future(events.__anext__())
+    finally:
+        next_event.cancel()
+
+
+async def stream_endpoint(request: Request) -> Response:
+    """
+    GET /api/odds/stream?race_id= : Server-Sent Eventsでオッズを配信する。
+    最初にevent: snapshot（全体）、以降はevent: delta（変化分、なくなった組み合わせはnull）を送る。
+    """
+    race_id = request.query_params.get("race_id")
+    if not race_id:
+        return error_response(400, "race_idパラメータが必要です")
+    service: OddsService = request.app.state.service
+    try:
+        _check_subscription(service)
+    except ServiceUnavailable as e:
+        return error_response(e.status_code, str(e), {"Retry-After": str(e.retry_after)})
+
+    async def body() -> AsyncIterator[str]:
+        async with service.broadcaster.subscribe(race_id) as events:
+            async for event in _with_heartbeat(events, 15.0):
+                if event is None:
+                    # 接続を維持するためのコメント行
+                    yield ": ping\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={**CORS_HEADERS, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def websocket_endpoint(websocket: WebSocket) -> None:
+    """
+    /api/odds/ws?race_id= : WebSocketでオッズを配信する（内容は/api/odds/streamと同じJSON）。
+    """
+    race_id = websocket.query_params.get("race_id")
+    service: OddsService = websocket.app.state.service
+    if not race_id or service.broadcaster.subscriber_count() >= service.max_subscribers:
+        await websocket.close(code=1008 if not race_id else 1013)
+        return
+    await websocket.accept()
+
+    async def send(events: AsyncIterator[dict]) -> None:
+        async for event in events:
+            await websocket.send_json(event)
+
+    async def receive() -> None:
+        # オッズが変わらない間も切断に気づけるよう、クライアントからのメッセージを待ち続ける
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    async with service.broadcaster.subscribe(race_id) as events:
+        tasks = {asyncio.ensure_future(send(events)), asyncio.ensure_future(receive())}
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                raise error
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """
+    GET /metrics : Prometheusのテキスト形式のメトリクスを返す。
+    """
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+def create_app(service: Optional[OddsService] = None) -> Starlette:
+    """
+    ASGIアプリを作成する。serviceを指定しない場合は環境変数の設定で作成する。
+    """
+    service = service if service is not None else OddsService.from_env()
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        await service.start()
+        try:
+            yield
+        finally:
+            await service.close()
+
+    app = Starlette(
+        routes=[
+            Route("/api/odds", odds_endpoint, methods=["GET", "OPTIONS"]),
+            Route("/api/odds/stream", stream_endpoint),
+            WebSocketRoute("/api/odds/ws", websocket_endpoint),
+            Route("/metrics", metrics_endpoint),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.service = service
+    return app
+
+
+app = create_app()
@@ -0,0 +1,345 @@
+"""
+オッズの時系列ストア
+
+概要:
+    取得したオッズのスナップショットを取得時刻とともに追記し、Parquetファイルとして保存する。
+    1行は(取得時刻, 馬券種, 馬番1〜3, オッズ)で、レースごとに次のように分けて保存する。
+
+        TABLE_DIR/date=20250504/place=05/race_id=202505010411/part-....parquet
+
+    日付は取得時刻の日本時間の日付、placeはrace_idの競馬場コード。
+    読み込み時はディレクトリ名からレースのファイルだけを選び、さらにParquetの
+    行グループの統計（最小・最大値）で馬券種・馬番を絞り込むため、
+    データ全体を読まずに1レースの履歴や1つの組み合わせの推移を取り出せる。
+
+主な機能:
+    - append / append_odds: スナップショットの追記（一定行数・一定時間ごとにまとめて書き込む）
+    - read_race: 1レースのオッズ履歴（pandas.DataFrame）
+    - read_trajectory: 1つの組み合わせのオッズの推移（pandas.DataFrame）
+    - compact: 1レースの小さなファイルを1つにまとめる
+
+使用例:
+    with OddsStore() as store:
+        store.append_odds(odds_extractor)
+    history = OddsStore().read_race("202505010411", bet_types=["tansho"])
+    trajectory = OddsStore().read_trajectory("202505010411", "umaren", 1, 5)
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from extract_odds import TABLE_DIR, RealtimeOdds
+from odds_table import OddsTable
+
+JST = timezone(timedelta(hours=9))
+
+# 1つの組み合わせに含まれる最大の頭数（3連複・3連単）
+MAX_SELECTION = 3
+
+# 保存する馬券種（RealtimeOddsの属性名）
+STORED_BET_TYPES = ["tansho", "fukusho", "umaren", "umatan", "sanrenpuku", "sanrentan"]
+
+SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ms", tz="UTC")),
+    ("bet_type", pa.string()),
+    ("horse1", pa.uint8()),
+    ("horse2", pa.uint8()),
+    ("horse3", pa.uint8()),
+    ("odds", pa.float32()),
+])
+
+HORSE_COLUMNS = [f"horse{i}" for i in range(1, MAX_SELECTION + 1)]
+
+
+def _odds_arrays(bet_type: str, odds: Mapping) -> tuple[np.ndarray, np.ndarray]:
+    """
+    1つの馬券種のオッズを(馬番の配列（件数×3、使わない位置は0）, オッズの配列)に変換する。
+    """
+    if not isinstance(odds, OddsTable) and odds and isinstance(next(iter(odds)), str):
+        # {"01,05"形式の組み合わせ: オッズ}の辞書
+        odds = OddsTable.from_dict(bet_type, odds)
+    if isinstance(odds, OddsTable):
+        horses, values = odds.combinations()
+    else:
+        # {馬番: オッズ}の辞書（単勝・複勝）
+        horses = np.fromiter(odds.keys(), dtype=np.int64, count=len(odds)).reshape(-1, 1)
+        values = np.fromiter(odds.values(), dtype=np.float32, count=len(odds))
+    padded = np.zeros((len(values), MAX_SELECTION), dtype=np.uint8)
+    padded[:, : horses.shape[1]] = horses
+    return padded, values.astype(np.float32, copy=False)
+
+
+def snapshot_table(snapshot: Mapping[str, Mapping], timestamp: float) -> pa.Table:
+    """
+    {馬券種: オッズ}のスナップショットを1行1組み合わせのArrowテーブルに変換する。
+
+    Parameters
+    --------
+    snapshot : Mapping[str, Mapping]
+        {馬券種: オッズ}。オッズはOddsTable、{馬番: オッズ}、{"01,05": オッズ}のいずれか
+    timestamp : float
+        取得時刻（UNIX時間、秒）
+    """
+    bet_types, horses, values = [], [], []
+    for bet_type, odds in snapshot.items():
+        if not odds:
+            continue
+        bet_horses, bet_values = _odds_arrays(bet_type, odds)
+        bet_types.append(np.full(len(bet_values), bet_type, dtype=object))
+        horses.append(bet_horses)
+        values.append(bet_values)
+    if not values:
+        return SCHEMA.empty_table()
+    horses = np.concatenate(horses)
+    n_rows = len(horses)
+    columns = [
+        pa.array(np.full(n_rows, int(timestamp * 1000), dtype=np.int64)).cast(SCHEMA.field("timestamp").type),
+        pa.array(np.concatenate(bet_types), type=pa.string()),
+        *(pa.array(horses[:, i]) for i in range(MAX_SELECTION)),
+        pa.array(np.concatenate(values)),
+    ]
+    return pa.Table.from_arrays(columns, schema=SCHEMA)
+
+
+class OddsStore:
+    """
+    オッズのスナップショットをレースごとのParquetファイルに追記・読み込みするクラス。
+
+    追記した行はレースごとにメモリに溜め、flush_rows行を超えた時点、最初に溜めてから
+    flush_interval秒が経過した時点（次の追記時に判定）、flush / flush_race / close を
+    呼び出した時点のいずれかでファイルに書き込む。既存のファイルは書き換えない。
+    """
+
+    def __init__(
+        self,
+        root: Path = TABLE_DIR,
+        flush_rows: int = 200_000,
+        flush_interval: Optional[float] = 300.0,
+        row_group_size: int = 65_536,
+    ):
+        """
+        Parameters
+        --------
+        root : Path, optional
+            保存先のディレクトリ。デフォルトはTABLE_DIR
+        flush_rows : int, optional
+            1レースあたりメモリに溜める行数の上限。デフォルトは200,000
+        flush_interval : float, optional
+            メモリに溜めておく最大の秒数。3連単を含む取得でもflush_rowsに達するまでには
+            時間がかかるため、プロセスが落ちた場合に失う行をこの時間分までにする。
+            Noneの場合は時間では書き込まない。デフォルトは300.0
+        row_group_size : int, optional
+            Parquetの行グループの行数。デフォルトは65,536
+        """
+        self.root = Path(root)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.row_group_size = row_group_size
+        self._buffers: dict[tuple[str, str], list[pa.Table]] = {}
+        self._buffered_rows: dict[tuple[str, str], int] = {}
+        self._buffered_since: dict[tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "OddsStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def race_dir(self, race_id: str, date: str) -> Path:
+        """
+        レース・日付（YYYYMMDD）のファイルを保存するディレクトリを返す。
+        """
+        return self.root / f"date={date}" / f"place={race_id[4:6]}" / f"race_id={race_id}"
+
+    def append(
+        self,
+        race_id: str,
+        snapshot: Mapping[str, Mapping],
+        timestamp: Optional[float] = None,
+    ) -> int:
+        """
+        1レースのスナップショットを追記する。
+
+        Parameters
+        --------
+        race_id : str
+            JRA形式のrace_id
+        snapshot : Mapping[str, Mapping]
+            {馬券種: オッズ}（odds_poller.snapshot_oddsの結果など）
+        timestamp : float, optional
+            取得時刻（UNIX時間、秒）。指定しない場合は現在時刻
+
+        Returns
+        --------
+        int
+            追記した行数
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        table = snapshot_table(snapshot, timestamp)
+        if table.num_rows == 0:
+            return 0
+        date = datetime.fromtimestamp(timestamp, JST).strftime("%Y%m%d")
+        key = (race_id, date)
+        with self._lock:
+            self._buffers.setdefault(key, []).append(table)
+            self._buffered_rows[key] = self._buffered_rows.get(key, 0) + table.num_rows
+            self._buffered_since.setdefault(key, time.monotonic())
+            if self._buffered_rows[key] >= self.flush_rows:
+                self._flush_key(key)
+            if self.flush_interval is not None:
+                # 取得を終えたレースの行も残さないよう、追記のたびに全てのレースを確認する
+                deadline = time.monotonic() - self.flush_interval
+                for other in [k for k, since in self._buffered_since.items() if since <= deadline]:
+                    self._flush_key(other)
+        return table.num_rows
+
+    def append_odds(self, odds: RealtimeOdds, timestamp: Optional[float] = None) -> int:
+        """
+        RealtimeOddsの抽出結果を追記する。
+        """
+        snapshot = {
+            bet_type: getattr(odds, bet_type)
+            for bet_type in STORED_BET_TYPES
+            if getattr(odds, bet_type, None) is not None
+        }
+        return self.append(odds.race_id, snapshot, timestamp)
+
+    def flush(self) -> None:
+        """
+        メモリに溜めている全ての行をファイルに書き込む。
+        """
+        with self._lock:
+            for key in list(self._buffers):
+                self._flush_key(key)
+
+    def flush_race(self, race_id: str) -> None:
+        """
+        1レースのメモリに溜めている行をファイルに書き込む（そのレースの取得を終えた場合など）。
+        """
+        with self._lock:
+            for key in [key for key in self._buffers if key[0] == race_id]:
+                self._flush_key(key)
+
+    def close(self) -> None:
+        self.flush()
+
+    def _flush_key(self, key: tuple[str, str]) -> None:
+        tables = self._buffers.pop(key, None)
+        self._buffered_rows.pop(key, None)
+        self._buffered_since.pop(key, None)
+        if not tables:
+            return
+        race_id, date = key
+        self._write(self.race_dir(race_id, date), pa.concat_tables(tables))
+
+    def _write(self, directory: Path, table: pa.Table) -> Path:
+        """
+        テーブルを馬券種・馬番・時刻の順に並べて1つのファイルに書き込む。
+
+        並べ替えておくことで、行グループごとの馬券種・馬番の範囲が狭くなり、
+        read_trajectoryで読み込む行グループを少なくできる。
+        """
+        table = table.sort_by([
+            ("bet_type", "ascending"),
+            *((column, "ascending") for column in HORSE_COLUMNS),
+            ("timestamp", "ascending"),
+        ])
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"part-{int(time.time() * 1000)}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        path = directory / f"{name}.parquet"
+        tmp_path = directory / f".{name}.tmp"
+        pq.write_table(
+            table,
+            tmp_path,
+            row_group_size=self.row_group_size,
+            compression="zstd",
+            use_dictionary=["bet_type"],
+        )
+        tmp_path.replace(path)
+        return path
+
+    def _race_files(self, race_id: str) -> list[Path]:
+        return sorted(self.root.glob(f"date=*/place={race_id[4:6]}/race_id={race_id}/*.parquet"))
+
+    def _read(
+        self, race_id: str, filter: Optional[pc.Expression], columns: list[str]
+    ) -> pd.DataFrame:
+        files = self._race_files(race_id)
+        if not files:
+            return pd.DataFrame(columns=columns)
+        dataset = ds.dataset([str(path) for path in files], format="parquet")
+        table = dataset.to_table(columns=columns, filter=filter)
+        return table.sort_by("timestamp").to_pandas()
+
+    def read_race(self, race_id: str, bet_types: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """
+        1レースのオッズ履歴を返す（書き込み済みの行のみ）。
+
+        Parameters
+        --------
+        race_id : str
+            JRA形式のrace_id
+        bet_types : Iterable[str], optional
+            読み込む馬券種。指定しない場合は全て
+
+        Returns
+        --------
+        pd.DataFrame
+            timestamp, bet_type, horse1, horse2, horse3, odds の列を持つ表（取得時刻順）。
+            組み合わせに使わない馬番の列は0。
+        """
+        filter = None
+        if bet_types is not None:
+            filter = pc.field("bet_type").isin(list(bet_types))
+        return self._read(race_id, filter, SCHEMA.names)
+
+    def read_trajectory(self, race_id: str, bet_type: str, *horses: int) -> pd.DataFrame:
+        """
+        1つの組み合わせのオッズの推移を返す（書き込み済みの行のみ）。
+        馬連・3連複は順不同で指定できる。
+
+        Returns
+        --------
+        pd.DataFrame
+            timestamp, odds の列を持つ表（取得時刻順）
+        """
+        if bet_type in ("umaren", "sanrenpuku"):
+            horses = tuple(sorted(horses))
+        padded = list(horses) + [0] * (MAX_SELECTION - len(horses))
+        filter = pc.field("bet_type") == bet_type
+        for column, horse in zip(HORSE_COLUMNS, padded):
+            filter &= pc.field(column) == horse
+        return self._read(race_id, filter, ["timestamp", "odds"])
+
+    def compact(self, race_id: str) -> None:
+        """
+        1レースの日付ごとのファイルを1つにまとめる。
+        まとめたファイルを書き込んでから元のファイルを削除するため、途中で失敗しても行は失われない
+        （読み込み中の場合は一時的に重複して見えることがある）。
+        """
+        self.flush()
+        by_directory: dict[Path, list[Path]] = {}
+        for path in self._race_files(race_id):
+            by_directory.setdefault(path.parent, []).append(path)
+        for directory, files in by_directory.items():
+            if len(files) < 2:
+                continue
+            table = pa.concat_tables(pq.read_table(path, schema=SCHEMA) for path in files)
+            self._write(directory, table)
+            for path in files:
+                path.unlink(missing_ok=True)
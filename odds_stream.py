@@ -0,0 +1,150 @@
+"""
+オッズの配信（購読者への一斉送信）
+
+概要:
+    レースごとの購読者に、最初に現在のオッズ全体（snapshot）を送り、
+    以降はOddsPollerが検出した変化分（delta）だけを送る。
+    同じレースの購読者が何人いても取得は1つのOddsPollerが1回ずつ行い、結果を全員に配る。
+    最初の購読者が来た時点でレースをOddsPollerに登録し、最後の購読者が去った時点で外す。
+
+使用例:
+    broadcaster = OddsBroadcaster()
+    poller = OddsPoller(on_change=broadcaster.publish, idle_interval=15)
+    broadcaster.poller = poller
+    asyncio.create_task(poller.run(forever=True))
+
+    async with broadcaster.subscribe(race_id) as events:
+        async for event in events:
+            print(event["type"], event["odds"])
+
+制限事項:
+    - まだ取得結果がないレースの購読者には、最初の取得が終わった時点で全体を送る
+    - 受信が追いつかない購読者は溜まった変化分を破棄し、次の変化時に全体を送り直す
+"""
+
+import asyncio
+import time
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from odds_poller import OddsPoller
+from odds_table import OddsTable
+
+
+def to_jsonable(odds: Mapping[str, Mapping]) -> dict[str, dict]:
+    """
+    {属性名: オッズ}をJSONに変換できる辞書にする（OddsTableは{"01,05": オッズ}の辞書になる）。
+    """
+    return {
+        name: values.to_dict() if isinstance(values, OddsTable) else dict(values)
+        for name, values in odds.items()
+    }
+
+
+class _Subscription:
+    """
+    1人の購読者の受信待ちの行列。
+    """
+
+    def __init__(self, max_queue: int, needs_snapshot: bool = False):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.needs_snapshot = needs_snapshot
+
+    def put(self, event: dict) -> None:
+        if self.needs_snapshot:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 追いつかない購読者は溜まった変化分を捨て、次の変化時に全体を送り直す
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.needs_snapshot = True
+
+
+class OddsBroadcaster:
+    """
+    OddsPollerの変化通知をレースごとの購読者に配るクラス。
+    """
+
+    def __init__(self, poller: Optional[OddsPoller] = None, max_queue: int = 100):
+        """
+        Parameters
+        --------
+        poller : OddsPoller, optional
+            取得を行うOddsPoller（on_changeにpublishを指定したもの）。後から設定してもよい。
+        max_queue : int, optional
+            購読者ごとに溜める変化分の最大数。デフォルトは100
+        """
+        self.poller = poller
+        self.max_queue = max_queue
+        self._subscriptions: dict[str, set[_Subscription]] = {}
+
+    def subscriber_count(self, race_id: Optional[str] = None) -> int:
+        if race_id is not None:
+            return len(self._subscriptions.get(race_id, ()))
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, event: dict) -> None:
+        """
+        OddsPollerのon_changeとして呼び出され、変化分をそのレースの購読者に配る。
+        """
+        race_id = event["race_id"]
+        subscriptions = self._subscriptions.get(race_id)
+        if not subscriptions:
+            return
+        delta = {
+            "type": "delta",
+            "race_id": race_id,
+            "timestamp": event["timestamp"],
+            "odds": event["changes"],
+        }
+        snapshot = None
+        for subscription in subscriptions:
+            if subscription.needs_snapshot:
+                snapshot = snapshot or self._snapshot_event(race_id, event["timestamp"])
+                if snapshot is not None:
+                    subscription.needs_snapshot = False
+                    subscription.put(snapshot)
+            else:
+                subscription.put(delta)
+
+    def _snapshot_event(self, race_id: str, timestamp: Optional[float] = None) -> Optional[dict]:
+        latest = self.poller.latest(race_id)
+        if latest is None:
+            return None
+        return {
+            "type": "snapshot",
+            "race_id": race_id,
+            "timestamp": timestamp if timestamp is not None else time.time(),
+            "odds": to_jsonable(latest),
+        }
+
+    @asynccontextmanager
+    async def subscribe(self, race_id: str) -> AsyncIterator[AsyncIterator[dict]]:
+        """
+        レースを購読する。最初のイベントは現在のオッズ全体（type="snapshot"）、
+        以降は変化分（type="delta"、なくなった組み合わせの値はNone）。
+        まだ取得結果がない場合は、最初の取得が終わるのを待ってから全体を送る。
+        """
+        snapshot = self._snapshot_event(race_id)
+        # 取得結果がなければ、次にpublishされた時点の全体を最初のイベントとして受け取る
+        subscription = _Subscription(self.max_queue, needs_snapshot=snapshot is None)
+        if snapshot is not None:
+            subscription.put(snapshot)
+        subscriptions = self._subscriptions.setdefault(race_id, set())
+        if not subscriptions:
+            self.poller.track(race_id)
+        subscriptions.add(subscription)
+        try:
+            yield self._events(subscription)
+        finally:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[race_id]
+                self.poller.untrack(race_id)
+
+    async def _events(self, subscription: _Subscription) -> AsyncIterator[dict]:
+        while True:
+            yield await subscription.queue.get()
@@ -0,0 +1,203 @@
+"""
+組み合わせ馬券のオッズ表
+
+概要:
+    馬連・馬単・3連複・3連単のオッズを、馬番で添字を引く密なfloat32配列で保持する。
+    馬連・馬単は18×18、3連複・3連単は18×18×18で、オッズがない組み合わせはNaNとなる。
+    OddsTableは{"01,05"形式の組み合わせ: オッズ}の辞書と同じように扱えるため、
+    従来の辞書を前提とした呼び出し側（app.pyなど）はそのまま使用できる。
+
+制限事項:
+    - 馬連・3連複は順序を問わないため、馬番を昇順に並べ替えた位置にのみ値を持つ
+    - 値はfloat32で保持し、取り出す際に小数第1位に丸める（JRAのオッズは0.1倍単位）
+"""
+
+from collections.abc import ItemsView, Iterable, Iterator, Mapping
+from typing import Optional
+
+import numpy as np
+
+# JRAの1レースの最大出走頭数
+MAX_HORSES = 18
+
+# 馬券種ごとの(選ぶ頭数, 着順を区別するかどうか)
+BET_TYPE_SHAPES = {
+    "umaren": (2, False),
+    "umatan": (2, True),
+    "sanrenpuku": (3, False),
+    "sanrentan": (3, True),
+}
+
+
+class OddsTable(Mapping):
+    """
+    組み合わせ馬券のオッズを馬番で添字を引く配列として保持するクラス。
+
+    使用例:
+        table = OddsTable.from_rows("umaren", [((1, 5), 12.3)])
+        table.odds(5, 1)   # 12.3（馬連は順不同）
+        table["01,05"]     # 12.3（従来の辞書と同じキーでも引ける）
+    """
+
+    def __init__(self, bet_type: str, values: Optional[np.ndarray] = None):
+        """
+        Parameters
+        --------
+        bet_type : str
+            "umaren", "umatan", "sanrenpuku", "sanrentan"のいずれか
+        values : np.ndarray, optional
+            (MAX_HORSES,) * 頭数 の形のfloat32配列。指定しない場合は全てNaNで作成する。
+        """
+        if bet_type not in BET_TYPE_SHAPES:
+            raise ValueError(f"組み合わせ馬券ではない馬券種です: {bet_type}")
+        self.bet_type = bet_type
+        self.size, self.ordered = BET_TYPE_SHAPES[bet_type]
+        shape = (MAX_HORSES,) * self.size
+        if values is None:
+            values = np.full(shape, np.nan, dtype=np.float32)
+        elif values.shape != shape:
+            raise ValueError(f"配列の形が{shape}ではありません: {values.shape}")
+        self.values = values
+
+    @classmethod
+    def from_rows(
+        cls, bet_type: str, rows: Iterable[tuple[tuple[int, ...], float]]
+    ) -> "OddsTable":
+        """
+        (馬番のタプル, オッズ)の並びからオッズ表を作成する（odds_parser.iter_oddsの出力など）。
+        """
+        table = cls(bet_type)
+        for horses, odds in rows:
+            index = table._index(horses)
+            if index is None:
+                print(f"警告: OddsTable - 範囲外の馬番のため無視しました: {horses}")
+                continue
+            table.values[index] = odds
+        return table
+
+    @classmethod
+    def from_arrays(cls, bet_type: str, horses: np.ndarray, odds: np.ndarray) -> "OddsTable":
+        """
+        馬番の配列（組み合わせ数×頭数、1始まり）とオッズの配列からオッズ表を作成する
+        （odds_dom.EXTRACT_ODDS_JSの出力など）。from_rowsと同じく、同じ組み合わせは後の値を使う。
+        """
+        table = cls(bet_type)
+        if horses.ndim != 2 or horses.shape[1] != table.size:
+            raise ValueError(f"馬番の配列の形が(組み合わせ数, {table.size})ではありません: {horses.shape}")
+        if not table.ordered:
+            horses = np.sort(horses, axis=1)
+        valid = np.all((horses >= 1) & (horses <= MAX_HORSES), axis=1)
+        if not valid.all():
+            print(f"警告: OddsTable - 範囲外の馬番のため無視しました: {horses[~valid].tolist()}")
+        table.values[tuple((horses[valid] - 1).T)] = odds[valid]
+        return table
+
+    @classmethod
+    def from_dict(cls, bet_type: str, odds_data: Mapping[str, float]) -> "OddsTable":
+        """
+        {"01,05"形式の組み合わせ: オッズ}の辞書からオッズ表を作成する。
+        """
+        return cls.from_rows(
+            bet_type,
+            (
+                (tuple(int(h) for h in kumi.split(",")), odds)
+                for kumi, odds in odds_data.items()
+            ),
+        )
+
+    def _index(self, horses: Iterable[int]) -> Optional[tuple[int, ...]]:
+        horses = tuple(horses)
+        if len(horses) != self.size:
+            return None
+        if not self.ordered:
+            horses = tuple(sorted(horses))
+        if any(not 1 <= horse <= MAX_HORSES for horse in horses):
+            return None
+        return tuple(horse - 1 for horse in horses)
+
+    def odds(self, *horses: int) -> Optional[float]:
+        """
+        馬番を指定してオッズを返す。オッズがない組み合わせはNone。
+        """
+        index = self._index(horses)
+        if index is None:
+            return None
+        value = self.values[index]
+        return None if np.isnan(value) else round(float(value), 1)
+
+    def combinations(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        オッズがある組み合わせを返す。
+
+        Returns
+        --------
+        tuple[np.ndarray, np.ndarray]
+            (馬番の配列（組み合わせ数×頭数、1始まり）, オッズの配列)。
+            組み合わせは馬番の辞書順に並ぶ。
+        """
+        index = np.argwhere(~np.isnan(self.values))
+        return index + 1, self.values[tuple(index.T)]
+
+    def containing_any(self, horses: Iterable[int]) -> "OddsTable":
+        """
+        指定した馬番のいずれかを含む組み合わせだけを残したオッズ表を返す。
+        """
+        selected = np.zeros(MAX_HORSES, dtype=bool)
+        for horse in horses:
+            if 1 <= horse <= MAX_HORSES:
+                selected[horse - 1] = True
+        mask = np.zeros(self.values.shape, dtype=bool)
+        for axis in range(self.size):
+            shape = [1] * self.size
+            shape[axis] = MAX_HORSES
+            mask |= selected.reshape(shape)
+        return OddsTable(self.bet_type, np.where(mask, self.values, np.float32(np.nan)))
+
+    def to_dict(self) -> dict[str, float]:
+        """
+        {"01,05"形式の組み合わせ: オッズ}の辞書に変換する。
+        dict(table)は組み合わせごとに__getitem__を呼ぶため、こちらを使用する。
+        """
+        return dict(self._iter_items())
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+    def __getitem__(self, kumi: str) -> float:
+        try:
+            horses = tuple(int(h) for h in kumi.split(","))
+        except (AttributeError, ValueError):
+            raise KeyError(kumi) from None
+        odds = self.odds(*horses)
+        if odds is None:
+            raise KeyError(kumi)
+        return odds
+
+    def __iter__(self) -> Iterator[str]:
+        horses, _ = self.combinations()
+        for combination in horses.tolist():
+            yield ",".join(f"{horse:02d}" for horse in combination)
+
+    def items(self) -> ItemsView:
+        return _OddsItemsView(self)
+
+    def _iter_items(self) -> Iterator[tuple[str, float]]:
+        horses, odds = self.combinations()
+        for combination, value in zip(horses.tolist(), odds.tolist()):
+            yield ",".join(f"{horse:02d}" for horse in combination), round(value, 1)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(~np.isnan(self.values)))
+
+    def __repr__(self) -> str:
+        return f"OddsTable(bet_type={self.bet_type!r}, entries={len(self)})"
+
+
+class _OddsItemsView(ItemsView):
+    """
+    OddsTable.items()の戻り値。組み合わせごとに__getitem__を呼ばず、配列からまとめて取り出す。
+    """
+
+    def __iter__(self) -> Iterator[tuple[str, float]]:
+        return self._mapping._iter_items()
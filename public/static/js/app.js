@@ -4,6 +4,7 @@
  * 機能:
  * - race_idの入力と検証
  * - APIからオッズ情報を取得
+ * - オッズの変化を受信して表示を更新（ライブ更新）
  * - グリッド形式でオッズを表示
  * - クリップボードにコピー
  */
@@ -216,9 +217,76 @@ function displayOddsTable(displayData, maxCols) {
     container.appendChild(table);
 }
 
-// オッズ情報を取得
+// packed形式（バイナリ）のオッズのContent-Type（odds_codec.pyを参照）
+const PACKED_ODDS_TYPE = 'application/x-odds-packed';
+const PACKED_ODDS_NAMES = {
+    1: 'tansho',
+    2: 'fukusho',
+    3: 'umaren',
+    4: 'umatan',
+    5: 'sanrenpuku',
+    6: 'sanrentan',
+};
+const MAX_HORSES = 18;
+
+// packed形式のオッズをJSONと同じ形（{tansho: {"1": 2.5}, umaren: {"01,05": 12.3}}）に戻す
+function decodePackedOdds(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(
+        view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3)
+    );
+    if (magic !== 'ODDS' || view.getUint8(4) !== 1) {
+        throw new Error('packed形式のオッズではありません');
+    }
+    const sectionCount = view.getUint8(5);
+    let offset = 8;
+    const odds = {};
+    
+    for (let s = 0; s < sectionCount; s++) {
+        const code = view.getUint8(offset);
+        const size = view.getUint8(offset + 1);
+        const oddsWidth = view.getUint8(offset + 2);
+        const count = view.getUint32(offset + 4, true);
+        offset += 8;
+        const indexOffset = offset;
+        const oddsOffset = offset + 2 * count;
+        offset = oddsOffset + oddsWidth * count;
+        
+        const values = {};
+        for (let i = 0; i < count; i++) {
+            let index = view.getUint16(indexOffset + 2 * i, true);
+            const scaled = oddsWidth === 2
+                ? view.getUint16(oddsOffset + 2 * i, true)
+                : view.getUint32(oddsOffset + 4 * i, true);
+            
+            // 組み合わせの番号から馬番を復元する（馬番-1の18進数）
+            const horses = new Array(size);
+            for (let column = size - 1; column >= 0; column--) {
+                horses[column] = (index % MAX_HORSES) + 1;
+                index = Math.floor(index / MAX_HORSES);
+            }
+            const key = size === 1
+                ? horses[0].toString()
+                : horses.map(h => h.toString().padStart(2, '0')).join(',');
+            values[key] = scaled / 10;
+        }
+        odds[PACKED_ODDS_NAMES[code]] = values;
+    }
+    
+    return odds;
+}
+
+// オッズ情報を取得（packed形式に対応したサーバーではバイナリで受け取る）
 async function fetchOdds(raceId) {
-    const response = await fetch(`/api/odds?race_id=${raceId}`);
+    const response = await fetch(`/api/odds?race_id=${raceId}`, {
+        headers: { 'Accept': `${PACKED_ODDS_TYPE}, application/json;q=0.9` },
+    });
+    const contentType = response.headers.get('Content-Type') || '';
+    
+    if (response.ok && contentType.startsWith(PACKED_ODDS_TYPE)) {
+        return decodePackedOdds(await response.arrayBuffer());
+    }
+    
     const result = await response.json();
     
     if (!result.success) {
@@ -228,6 +296,55 @@ async function fetchOdds(raceId) {
     return result.data;
 }
 
+// オッズの変化分を現在のオッズに反映する（値がnullの組み合わせは削除する）
+function applyOddsDelta(current, delta) {
+    const updated = { ...current };
+    for (const [betType, changes] of Object.entries(delta)) {
+        const values = { ...(updated[betType] || {}) };
+        for (const [key, odds] of Object.entries(changes)) {
+            if (odds === null) {
+                delete values[key];
+            } else {
+                values[key] = odds;
+            }
+        }
+        updated[betType] = values;
+    }
+    return updated;
+}
+
+// オッズの配信を購読する（最初に全体、以降は変化分が届くたびにonUpdateを呼び出す）
+function subscribeOdds(raceId, onUpdate, onError) {
+    const source = new EventSource(`/api/odds/stream?race_id=${raceId}`);
+    let odds = {};
+    source.addEventListener('snapshot', (event) => {
+        odds = JSON.parse(event.data).odds;
+        onUpdate(odds);
+    });
+    source.addEventListener('delta', (event) => {
+        odds = applyOddsDelta(odds, JSON.parse(event.data).odds);
+        onUpdate(odds);
+    });
+    source.onerror = () => {
+        // EventSourceは自動で再接続し、再接続時に全体が送り直される
+        if (onError) {
+            onError();
+        }
+    };
+    return source;
+}
+
+// オッズの配信（/api/odds/stream）を使用できるか確認する
+// race_idなしで問い合わせ、エンドポイントがあれば400、なければ404が返る
+async function streamAvailable() {
+    try {
+        const response = await fetch('/api/odds/stream');
+        return response.status !== 404;
+    } catch (error) {
+        return false;
+    }
+}
+
 // メイン処理
 document.addEventListener('DOMContentLoaded', () => {
     const fetchBtn = document.getElementById('fetch-btn');
@@ -239,7 +356,50 @@ document.addEventListener('DOMContentLoaded', () => {
     const copyBtn = document.getElementById('copy-btn');
     const infoSection = document.getElementById('info-section');
     
+    const liveToggle = document.getElementById('live-toggle');
+    const liveToggleGroup = document.getElementById('live-toggle-group');
+    
     let currentDisplayData = null;
+    let oddsSource = null;
+    
+    // /api/odds/streamはodds_server.pyだけが提供する（Vercelのapi/にはない）ため、
+    // 配信を受けられる場合だけライブ更新の切り替えを表示する
+    if (liveToggleGroup && window.EventSource) {
+        streamAvailable().then((available) => {
+            liveToggleGroup.hidden = !available;
+        });
+    }
+    
+    // オッズ情報を表示
+    function renderOdds(oddsData) {
+        // 表示用データに変換
+        const { displayData, maxCols, topTwo, axisHorse } = prepareDisplayData(
+            oddsData.tansho,
+            oddsData.fukusho,
+            oddsData.umaren
+        );
+        
+        // テーブルを表示
+        displayOddsTable(displayData, maxCols);
+        
+        // 情報セクションを更新
+        if (topTwo.length >= 2 && axisHorse !== null) {
+            const combo1 = topTwo[0];
+            const combo2 = topTwo[1];
+            const formatted1 = formatUmarenKumi(combo1.horses[0], combo1.horses[1]);
+            const formatted2 = formatUmarenKumi(combo2.horses[0], combo2.horses[1]);
+            
+            infoSection.innerHTML = `
+                <div class="info-section">
+                    <p>馬連上位2つ: ${formatted1}（${combo1.odds.toFixed(2)}）、${formatted2}（${combo2.odds.toFixed(2)}） | 軸: ${axisHorse.toString().padStart(2, '0')}番</p>
+                </div>
+            `;
+        }
+        
+        // 結果を表示
+        currentDisplayData = displayData;
+        resultsSection.style.display = 'block';
+    }
     
     // オッズ取得ボタンのクリック
     fetchBtn.addEventListener('click', async () => {
@@ -262,39 +422,32 @@ document.addEventListener('DOMContentLoaded', () => {
         loadingSection.style.display = 'block';
         errorSection.style.display = 'none';
         resultsSection.style.display = 'none';
+        
+        // 前のレースの購読を終了
+        if (oddsSource) {
+            oddsSource.close();
+            oddsSource = null;
+        }
+        
+        // ライブ更新の場合は配信を購読し、届くたびに表示を更新する
+        if (liveToggle && liveToggle.checked && window.EventSource) {
+            oddsSource = subscribeOdds(raceId, (oddsData) => {
+                loadingSection.style.display = 'none';
+                errorSection.style.display = 'none';
+                renderOdds(oddsData);
+            }, () => {
+                errorMessage.textContent = 'オッズの配信が切断されました。再接続しています...';
+                errorSection.style.display = 'block';
+            });
+            return;
+        }
+        
         fetchBtn.disabled = true;
         
         try {
             // オッズ情報を取得
             const oddsData = await fetchOdds(raceId);
-            
-            // 表示用データに変換
-            const { displayData, maxCols, topTwo, axisHorse } = prepareDisplayData(
-                oddsData.tansho,
-                oddsData.fukusho,
-                oddsData.umaren
-            );
-            
-            // テーブルを表示
-            displayOddsTable(displayData, maxCols);
-            
-            // 情報セクションを更新
-            if (topTwo.length >= 2 && axisHorse !== null) {
-                const combo1 = topTwo[0];
-                const combo2 = topTwo[1];
-                const formatted1 = formatUmarenKumi(combo1.horses[0], combo1.horses[1]);
-                const formatted2 = formatUmarenKumi(combo2.horses[0], combo2.horses[1]);
-                
-                infoSection.innerHTML = `
-                    <div class="info-section">
-                        <p>馬連上位2つ: ${formatted1}（${combo1.odds.toFixed(2)}）、${formatted2}（${combo2.odds.toFixed(2)}） | 軸: ${axisHorse.toString().padStart(2, '0')}番</p>
-                    </div>
-                `;
-            }
-            
-            // 結果を表示
-            currentDisplayData = displayData;
-            resultsSection.style.display = 'block';
+            renderOdds(oddsData);
             
         } catch (error) {
             errorMessage.textContent = `エラーが発生しました: ${error.message}`;
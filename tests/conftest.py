@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fixtures import DEFAULT_RACE_ID, stub_jra_site, synthetic_pages  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def pages() -> dict[str, str]:
+    """
+    全馬券種の合成したオッズページ（benchmarks/fixtures.py）。
+    """
+    return synthetic_pages(DEFAULT_RACE_ID)
+
+
+@pytest.fixture(scope="session")
+def stub_site(pages: dict[str, str]) -> str:
+    """
+    JRA公式サイトの代わりのローカルサーバーのbase_url。
+    """
+    with stub_jra_site(DEFAULT_RACE_ID, pages) as base_url:
+        yield base_url
@@ -0,0 +1,91 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from batch_scraper import BatchScraper
+from extract_odds import RealtimeOdds, race_link_name
+from fixtures import DEFAULT_RACE_ID
+from odds_resolver import OddsPageResolver
+
+RACE_LINK = [race_link_name(DEFAULT_RACE_ID), "return doAction('/JRADB/accessO.html', 'pw15race');", None]
+TANPUKU_TAB = ["単勝・複勝", "return doAction('/JRADB/accessO.html', 'pw15tanpuku');", None]
+
+
+class _FakePage:
+    """
+    レース一覧のリンクと、オッズページの馬券種タブだけを返すページ。
+    """
+
+    def __init__(self, tabs: list[list]):
+        self.tabs = tabs
+        self.context = self
+
+    async def new_page(self) -> "_FakePage":
+        return _FakePage(self.tabs)
+
+    async def close(self) -> None:
+        pass
+
+    async def eval_on_selector_all(self, selector: str, script: str) -> list[list]:
+        return self.tabs if selector == "ul.nav.pills li a" else [RACE_LINK]
+
+
+class _FakePool:
+    def __init__(self, tabs: list[list]):
+        self.tabs = tabs
+
+    @asynccontextmanager
+    async def page(self):
+        yield _FakePage(self.tabs)
+
+
+async def _noop(*args, **kwargs) -> None:
+    pass
+
+
+async def _open_kaisai_page(self, page, delay_time=None) -> bool:
+    return True
+
+
+def _run(tabs: list[list]) -> list[dict]:
+    scraper = BatchScraper(browser_pool=_FakePool(tabs), resolver=OddsPageResolver())
+
+    async def collect() -> list[dict]:
+        return [result async for result in scraper.run([DEFAULT_RACE_ID])]
+
+    return asyncio.run(collect())
+
+
+@pytest.fixture(autouse=True)
+def fake_navigation(monkeypatch):
+    monkeypatch.setattr(RealtimeOdds, "open_kaisai_page", _open_kaisai_page)
+    monkeypatch.setattr(RealtimeOdds, "_open_target", _noop)
+
+
+def test_race_without_bet_tabs_is_an_error():
+    (result,) = _run(tabs=[])
+
+    assert result["odds"] is None
+    assert "馬券種タブ" in result["error"]
+
+
+def test_race_without_pages_is_an_error(monkeypatch):
+    monkeypatch.setattr(RealtimeOdds, "_scrape_targets", _noop)
+
+    (result,) = _run(tabs=[TANPUKU_TAB])
+
+    assert result["odds"] is None
+    assert result["error"] is not None
+
+
+def test_race_with_pages_is_extracted(monkeypatch, pages):
+    async def scrape_targets(self, page, targets, skip_bet_types, max_concurrency=1):
+        self._store_htmls({bet_type: pages[bet_type] for bet_type in targets})
+
+    monkeypatch.setattr(RealtimeOdds, "_scrape_targets", scrape_targets)
+
+    (result,) = _run(tabs=[TANPUKU_TAB])
+
+    assert result["error"] is None
+    assert result["odds"].tansho
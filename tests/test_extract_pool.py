@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from extract_pool import ExtractPool
+from odds_parser import extract_page
+
+BET_TYPES = ["tanpuku", "umaren", "umatan", "sanrenpuku", "sanrentan"]
+
+
+def _expected(pages, horses=None):
+    expected = {}
+    for bet_type in BET_TYPES:
+        expected.update(extract_page(bet_type, pages[bet_type], horses))
+    return expected
+
+
+def _plain(extracted):
+    return {name: dict(values) for name, values in extracted.items()}
+
+
+def test_extract_htmls_matches_extract_page(pages):
+    async def run():
+        async with ExtractPool(max_workers=2) as pool:
+            return await pool.extract_htmls({bet_type: pages[bet_type] for bet_type in BET_TYPES})
+
+    assert _plain(asyncio.run(run())) == _plain(_expected(pages))
+
+
+def test_extract_filters_horses_in_the_worker(pages):
+    async def run():
+        async with ExtractPool(max_workers=1) as pool:
+            return await pool.extract_htmls(
+                {bet_type: pages[bet_type] for bet_type in BET_TYPES}, horses=[3, 7]
+            )
+
+    assert _plain(asyncio.run(run())) == _plain(_expected(pages, frozenset({3, 7})))
+
+
+def test_close_shuts_down_the_executor(pages):
+    pool = ExtractPool(max_workers=1)
+    asyncio.run(pool.extract("umaren", pages["umaren"]))
+    executor = pool._executor
+    pool.close()
+    assert pool._executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(len, "")
@@ -0,0 +1,152 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from browser_install import find_chromium
+from extract_odds import RealtimeOdds
+from fetchers import HttpFetcher
+from fixtures import DEFAULT_RACE_ID
+from odds_metrics import FETCH_RETRIES
+from odds_parser import iter_odds, parse_tanpuku
+from odds_resolver import JRA_BASE_URL, OddsPageResolver
+
+SKIP_BET_TYPES = ["wakuren", "wide"]
+FETCHED_BET_TYPES = ["tanpuku", "umaren", "umatan", "sanrenpuku", "sanrentan"]
+# 接続できないアドレス（HttpFetcherの取得を失敗させる）
+UNREACHABLE_URL = "http://127.0.0.1:9/"
+
+
+def _odds(bet_type: str, html: str):
+    if bet_type == "tanpuku":
+        return parse_tanpuku(html)
+    return list(iter_odds(bet_type, html))
+
+
+def _assert_same_odds(htmls: dict[str, str], pages: dict[str, str]) -> None:
+    assert sorted(htmls) == sorted(FETCHED_BET_TYPES)
+    for bet_type, html in htmls.items():
+        assert _odds(bet_type, html) == _odds(bet_type, pages[bet_type])
+
+
+async def _fetch(fetcher: HttpFetcher) -> dict[str, str]:
+    async with fetcher:
+        return await fetcher.fetch(DEFAULT_RACE_ID, SKIP_BET_TYPES)
+
+
+def _counting_client(requests: list[httpx.Request]) -> httpx.AsyncClient:
+    async def record(request: httpx.Request) -> None:
+        requests.append(request)
+
+    return httpx.AsyncClient(follow_redirects=True, event_hooks={"request": [record]})
+
+
+def test_click_chain_learns_targets(stub_site, pages):
+    resolver = OddsPageResolver()
+    htmls = asyncio.run(_fetch(HttpFetcher(resolver=resolver, base_url=stub_site)))
+
+    _assert_same_odds(htmls, pages)
+    assert set(FETCHED_BET_TYPES) <= set(resolver.get_targets(DEFAULT_RACE_ID))
+
+
+def test_cached_targets_skip_click_chain(stub_site, pages):
+    resolver = OddsPageResolver()
+    asyncio.run(_fetch(HttpFetcher(resolver=resolver, base_url=stub_site)))
+
+    requests: list[httpx.Request] = []
+
+    async def fetch_cached() -> dict[str, str]:
+        async with _counting_client(requests) as client:
+            return await _fetch(HttpFetcher(client=client, resolver=resolver, base_url=stub_site))
+
+    htmls = asyncio.run(fetch_cached())
+
+    _assert_same_odds(htmls, pages)
+    # 馬券種のページを1回ずつPOSTするだけで、トップページからのリンクはたどらない
+    assert [request.method for request in requests] == ["POST"] * len(FETCHED_BET_TYPES)
+
+
+def test_stale_targets_fall_back_to_click_chain(stub_site, pages):
+    resolver = OddsPageResolver()
+    resolver.remember(
+        DEFAULT_RACE_ID,
+        {"tanpuku": {"url": JRA_BASE_URL + "JRADB/accessO.html", "cname": "pw15stale"}},
+    )
+    retries = FETCH_RETRIES.value(reason="stale_targets")
+
+    htmls = asyncio.run(_fetch(HttpFetcher(resolver=resolver, base_url=stub_site)))
+
+    _assert_same_odds(htmls, pages)
+    assert FETCH_RETRIES.value(reason="stale_targets") == retries + 1
+    assert resolver.get_targets(DEFAULT_RACE_ID)["tanpuku"]["cname"] != "pw15stale"
+
+
+class _RecordingPool:
+    """
+    ページの代わりにNoneを貸し出すブラウザプール（ブラウザでの取得に切り替わったことの確認用）。
+    """
+
+    def __init__(self):
+        self.borrowed = 0
+
+    @asynccontextmanager
+    async def page(self):
+        self.borrowed += 1
+        yield None
+
+
+def test_scrape_html_falls_back_to_browser(monkeypatch, pages):
+    pool = _RecordingPool()
+    calls = []
+
+    async def scrape_page(self, page, skip_bet_types, *args):
+        calls.append(skip_bet_types)
+        self._store_htmls({bet_type: pages[bet_type] for bet_type in FETCHED_BET_TYPES})
+
+    monkeypatch.setattr(RealtimeOdds, "_scrape_page", scrape_page)
+    retries = FETCH_RETRIES.value(reason="fetcher_fallback")
+
+    async def scrape() -> RealtimeOdds:
+        async with HttpFetcher(base_url=UNREACHABLE_URL, resolver=OddsPageResolver()) as fetcher:
+            odds = RealtimeOdds(
+                DEFAULT_RACE_ID, fetcher=fetcher, browser_pool=pool, resolver=OddsPageResolver()
+            )
+            await odds.scrape_html(skip_bet_types=SKIP_BET_TYPES)
+            return odds
+
+    odds = asyncio.run(scrape())
+
+    assert pool.borrowed == 1
+    assert calls == [SKIP_BET_TYPES]
+    assert FETCH_RETRIES.value(reason="fetcher_fallback") == retries + 1
+    _assert_same_odds(odds.htmls, pages)
+
+
+@pytest.mark.skipif(find_chromium() is None, reason="PlaywrightのChromiumがインストールされていない")
+def test_scrape_html_falls_back_to_playwright(stub_site, pages):
+    from browser_pool import BrowserPool
+
+    async def route_to_stub(context) -> None:
+        async def handle(route) -> None:
+            url = route.request.url
+            if not url.startswith(JRA_BASE_URL):
+                await route.abort()
+                return
+            response = await route.fetch(url=stub_site + url[len(JRA_BASE_URL):])
+            await route.fulfill(response=response)
+
+        await context.route("**/*", handle)
+
+    async def scrape() -> RealtimeOdds:
+        async with BrowserPool(max_size=1, context_setup=route_to_stub) as pool:
+            async with HttpFetcher(base_url=UNREACHABLE_URL, resolver=OddsPageResolver()) as fetcher:
+                odds = RealtimeOdds(
+                    DEFAULT_RACE_ID, fetcher=fetcher, browser_pool=pool, resolver=OddsPageResolver()
+                )
+                await odds.scrape_html(skip_bet_types=SKIP_BET_TYPES)
+                return odds
+
+    odds = asyncio.run(scrape())
+
+    _assert_same_odds(odds.htmls, pages)
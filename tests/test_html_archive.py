@@ -0,0 +1,51 @@
+import asyncio
+
+from extract_odds import RealtimeOdds
+from fixtures import DEFAULT_RACE_ID
+from html_archive import HtmlArchive
+from odds_poller import snapshot_odds
+from odds_query import select_odds
+
+TIMESTAMP = 1_746_320_400.0
+
+
+def _objects(archive: HtmlArchive) -> list:
+    return list((archive.root / "objects").glob("*/*.html.zst"))
+
+
+def test_unchanged_pages_are_stored_once(tmp_path, pages):
+    archive = HtmlArchive(tmp_path)
+    assert archive.save(DEFAULT_RACE_ID, pages, TIMESTAMP) == len(pages)
+    assert archive.save(DEFAULT_RACE_ID, pages, TIMESTAMP + 60) == 0
+
+    changed = {**pages, "tanpuku": pages["tanpuku"].replace("</table>", "</table><!-- 更新 -->", 1)}
+    # 別のインスタンス（再起動後）でも索引から前回のハッシュを読み込む
+    reopened = HtmlArchive(tmp_path)
+    assert reopened.save(DEFAULT_RACE_ID, changed, TIMESTAMP + 120) == 1
+    assert len(_objects(reopened)) == len(pages) + 1
+    assert [entry["bet_type"] for entry in reopened.history(DEFAULT_RACE_ID)[len(pages):]] == ["tanpuku"]
+
+    assert reopened.load(DEFAULT_RACE_ID, at=TIMESTAMP + 60) == pages
+    assert reopened.load(DEFAULT_RACE_ID) == changed
+    assert reopened.load(DEFAULT_RACE_ID, skip_bet_types=["tanpuku"]).keys() == pages.keys() - {"tanpuku"}
+    snapshots = list(reopened.iter_snapshots())
+    assert [(race_id, timestamp) for race_id, timestamp, _ in snapshots] == [
+        (DEFAULT_RACE_ID, TIMESTAMP),
+        (DEFAULT_RACE_ID, TIMESTAMP + 120),
+    ]
+    assert snapshots[-1][2] == changed
+
+
+def test_replay_extracts_the_same_odds_without_network(tmp_path, pages):
+    archive = HtmlArchive(tmp_path)
+    archive.save(DEFAULT_RACE_ID, pages, TIMESTAMP)
+
+    live = RealtimeOdds(DEFAULT_RACE_ID)
+    live.htmls.update(pages)
+    live.extract_all()
+    replay = RealtimeOdds(DEFAULT_RACE_ID, archive=archive, replay=True)
+    asyncio.run(replay.scrape_html(skip_bet_types=[]))
+    replay.extract_all()
+
+    expected = snapshot_odds(live)
+    assert select_odds(snapshot_odds(replay), list(expected)) == select_odds(expected, list(expected))
@@ -0,0 +1,112 @@
+import asyncio
+import os
+
+import pytest
+
+import odds_cache
+from fixtures import DEFAULT_RACE_ID
+from odds_cache import DiskBackend, MemoryBackend, OddsCache
+
+BET_TYPES = ["tanpuku", "umaren"]
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+def _counting_fetch(calls: list, value=None, delay: float = 0.0):
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return value if value is not None else {"tansho": {1: float(len(calls))}}
+
+    return fetch
+
+
+def test_results_expire_after_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(odds_cache.time, "time", clock.time)
+    cache = OddsCache(ttl=30)
+    calls = []
+    fetch = _counting_fetch(calls)
+
+    first = asyncio.run(cache.get_or_fetch(DEFAULT_RACE_ID, BET_TYPES, fetch))
+    clock.now += 29
+    # 馬券種の順序はキーに影響しない
+    assert asyncio.run(cache.get_or_fetch(DEFAULT_RACE_ID, BET_TYPES[::-1], fetch)) == first
+    assert cache.get(DEFAULT_RACE_ID, BET_TYPES) == first
+    clock.now += 2
+    assert cache.get(DEFAULT_RACE_ID, BET_TYPES) is None
+    assert asyncio.run(cache.get_or_fetch(DEFAULT_RACE_ID, BET_TYPES, fetch)) != first
+    assert len(calls) == 2
+
+
+def test_failed_fetch_is_not_cached():
+    cache = OddsCache()
+
+    async def fail():
+        raise RuntimeError("取得失敗")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_fetch(DEFAULT_RACE_ID, BET_TYPES, fail))
+    assert cache.get(DEFAULT_RACE_ID, BET_TYPES) is None
+
+
+def test_concurrent_requests_share_one_fetch():
+    cache = OddsCache()
+    calls = []
+    fetch = _counting_fetch(calls, delay=0.05)
+
+    async def requests() -> list:
+        return await asyncio.gather(
+            *(cache.get_or_fetch(DEFAULT_RACE_ID, BET_TYPES, fetch) for _ in range(5))
+        )
+
+    results = asyncio.run(requests())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_disk_caches_in_other_processes_wait_for_the_fetching_one(tmp_path):
+    # 同じディレクトリを共有する2つのOddsCacheで、別のプロセスのワーカーを模す
+    leader = OddsCache(DiskBackend(tmp_path))
+    follower = OddsCache(DiskBackend(tmp_path), poll_interval=0.01)
+    leader_calls, follower_calls = [], []
+
+    async def requests() -> list:
+        first = asyncio.ensure_future(
+            leader.get_or_fetch(DEFAULT_RACE_ID, BET_TYPES, _counting_fetch(leader_calls, delay=0.1))
+        )
+        await asyncio.sleep(0.02)
+        second = follower.get_or_fetch(DEFAULT_RACE_ID, BET_TYPES, _counting_fetch(follower_calls))
+        return await asyncio.gather(first, second)
+
+    first, second = asyncio.run(requests())
+    assert first == second
+    assert (len(leader_calls), len(follower_calls)) == (1, 0)
+    assert not list(tmp_path.glob("*.lock"))
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+    assert backend.get("b") is None
+    assert backend.get("a")[1] == 1 and backend.get("c")[1] == 3
+
+
+def test_disk_backend_evicts_least_recently_used(tmp_path):
+    backend = DiskBackend(tmp_path, max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    os.utime(backend._path("a"), (1, 1))
+    os.utime(backend._path("b"), (2, 2))
+    backend.set("c", 3)
+    assert backend.get("a") is None
+    assert backend.get("b")[1] == 2 and backend.get("c")[1] == 3
@@ -0,0 +1,35 @@
+import pytest
+
+from extract_odds import RealtimeOdds
+from fixtures import DEFAULT_RACE_ID
+from odds_codec import decode_odds, encode_odds
+from odds_poller import snapshot_odds
+from odds_query import select_odds
+from odds_table import OddsTable
+
+
+def test_round_trip_matches_json_for_every_bet_type(pages):
+    odds = RealtimeOdds(DEFAULT_RACE_ID)
+    odds.htmls.update(pages)
+    odds.extract_all()
+    snapshot = snapshot_odds(odds)
+    assert decode_odds(encode_odds(snapshot)) == select_odds(snapshot, list(snapshot))
+
+
+def test_round_trip_keeps_odds_that_need_wide_integers():
+    # 6553.5倍を超えるオッズは10倍するとuint16に収まらない
+    odds = {
+        "tansho": {1: 1.0, 18: 999.9},
+        "sanrentan": OddsTable.from_dict("sanrentan", {"18,01,02": 12345.6, "01,02,03": 8.1}),
+        "umaren": {},
+    }
+    assert decode_odds(encode_odds(odds)) == {
+        "tansho": {1: 1.0, 18: 999.9},
+        "sanrentan": {"01,02,03": 8.1, "18,01,02": 12345.6},
+        "umaren": {},
+    }
+
+
+def test_decode_rejects_other_data():
+    with pytest.raises(ValueError):
+        decode_odds(b"JSON" + bytes(4))
@@ -0,0 +1,25 @@
+from odds_display import build_odds_table
+from odds_table import OddsTable
+
+
+def test_build_odds_table_orders_rows_by_odds_around_the_axis_horse():
+    odds_data = {
+        "tansho": {1: 2.0, 2: 5.0, 3: 3.5},
+        "fukusho": {1: 1.2, 2: 1.9, 3: 1.5},
+        "umaren": OddsTable.from_dict("umaren", {"01,02": 4.0, "01,03": 6.0, "02,03": 9.0}),
+    }
+    display_df, top_two_umaren, axis_horse = build_odds_table(odds_data)
+    assert axis_horse == 1
+    assert [combo["組み合わせ"] for combo in top_two_umaren] == ["1-2", "1-3"]
+    assert list(display_df.columns) == ["01", "02", "03"]
+    assert list(display_df.loc["単勝_馬番"]) == ["1", "3", "2"]
+    assert list(display_df.loc["複勝_オッズ"]) == ["1.2", "1.5", "1.9"]
+    assert list(display_df.loc["馬連_馬番"]) == ["1", "2", "3"]
+    # 馬連の先頭は組み合わせが2つの場合、2番目のオッズ
+    assert list(display_df.loc["馬連_オッズ"]) == ["6.0", "4.0", "6.0"]
+
+
+def test_build_odds_table_is_empty_without_odds():
+    display_df, top_two_umaren, axis_horse = build_odds_table({"tansho": {}, "fukusho": {}, "umaren": {}})
+    assert display_df.empty
+    assert top_two_umaren == [] and axis_horse is None
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from browser_install import find_chromium
+from fixtures import packed_odds
+from odds_dom import EXTRACT_ODDS_JS, extract_packed, verify_packed
+from odds_parser import extract_page
+
+BET_TYPES = ["tanpuku", "umaren", "umatan", "sanrenpuku", "sanrentan"]
+
+
+@pytest.mark.parametrize("bet_type", BET_TYPES)
+def test_packed_arrays_match_the_html_parse(pages, bet_type):
+    packed = packed_odds(pages)[bet_type]
+    assert verify_packed(bet_type, packed, pages[bet_type]) == []
+
+
+def test_verify_packed_reports_mismatches(pages):
+    packed = packed_odds(pages)
+    packed["umaren"]["odds"][0] += 1.0
+    packed["tanpuku"]["fuku"][0] = None
+    assert verify_packed("umaren", packed["umaren"], pages["umaren"]) == ["umaren"]
+    assert verify_packed("tanpuku", packed["tanpuku"], pages["tanpuku"]) == ["fukusho"]
+
+
+def test_extract_packed_filters_horses_like_extract_page(pages):
+    packed = packed_odds(pages)
+    for bet_type in ("tanpuku", "umaren"):
+        from_dom = extract_packed(bet_type, packed[bet_type], horses={3, 7})
+        from_html = extract_page(bet_type, pages[bet_type], horses={3, 7})
+        assert {name: dict(values) for name, values in from_dom.items()} == {
+            name: dict(values) for name, values in from_html.items()
+        }
+
+
+@pytest.mark.skipif(find_chromium() is None, reason="PlaywrightのChromiumがインストールされていない")
+def test_extract_odds_js_matches_the_html_parse(pages):
+    from playwright.async_api import async_playwright
+
+    async def extract() -> dict:
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(headless=True)
+            try:
+                page = await browser.new_page()
+                packed = {}
+                for bet_type in BET_TYPES:
+                    await page.set_content(pages[bet_type])
+                    packed[bet_type] = await page.evaluate(EXTRACT_ODDS_JS, bet_type)
+                return packed
+            finally:
+                await browser.close()
+
+    for bet_type, packed in asyncio.run(extract()).items():
+        assert verify_packed(bet_type, packed, pages[bet_type]) == [], bet_type
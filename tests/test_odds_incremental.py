@@ -0,0 +1,57 @@
+import lxml.html
+import numpy as np
+import pytest
+
+from fixtures import DEFAULT_RACE_ID
+from odds_incremental import IncrementalParser
+from odds_metrics import PARSED_BLOCKS
+from odds_parser import iter_blocks, iter_odds, parse_tanpuku
+from odds_table import BET_TYPE_SHAPES, OddsTable
+
+
+def _full_parse(bet_type: str, html: str) -> OddsTable:
+    return OddsTable.from_rows(bet_type, iter_odds(bet_type, html))
+
+
+def _change_first_odds(bet_type: str, html: str) -> tuple[str, str]:
+    """
+    ページをlxmlで書き出し直したものと、最初のブロックの最初のオッズだけを変えたものを返す。
+    """
+    blocks = iter_blocks(bet_type, html)
+    tree = blocks[0].getroottree()
+    before = lxml.html.tostring(tree, encoding="unicode")
+    td = blocks[0].find(".//td")
+    td.text = "8,888.8" if td.text_content().strip() != "8,888.8" else "7,777.7"
+    return before, lxml.html.tostring(tree, encoding="unicode")
+
+
+def _assert_same(actual: OddsTable, expected: OddsTable) -> None:
+    np.testing.assert_array_equal(actual.values, expected.values)
+
+
+@pytest.mark.parametrize("bet_type", sorted(BET_TYPE_SHAPES))
+def test_table_matches_a_full_parse_after_one_block_changes(pages, bet_type):
+    parser = IncrementalParser()
+    before, after = _change_first_odds(bet_type, pages[bet_type])
+    assert not np.array_equal(
+        _full_parse(bet_type, before).values, _full_parse(bet_type, after).values, equal_nan=True
+    )
+    _assert_same(parser.table(DEFAULT_RACE_ID, bet_type, before), _full_parse(bet_type, before))
+
+    parsed = PARSED_BLOCKS.value(bet_type=bet_type, result="parsed")
+    table = parser.table(DEFAULT_RACE_ID, bet_type, after)
+    _assert_same(table, _full_parse(bet_type, after))
+    assert PARSED_BLOCKS.value(bet_type=bet_type, result="parsed") - parsed == 1
+
+    # 使い回した結果を変更しても、保持している結果には影響しない
+    table.values[:] = np.nan
+    _assert_same(parser.table(DEFAULT_RACE_ID, bet_type, after), _full_parse(bet_type, after))
+
+
+def test_tanpuku_matches_parse_tanpuku(pages):
+    parser = IncrementalParser()
+    expected = parse_tanpuku(pages["tanpuku"])
+    assert parser.tanpuku(DEFAULT_RACE_ID, pages["tanpuku"]) == expected
+    reused = PARSED_BLOCKS.value(bet_type="tanpuku", result="reused")
+    assert parser.tanpuku(DEFAULT_RACE_ID, pages["tanpuku"]) == expected
+    assert PARSED_BLOCKS.value(bet_type="tanpuku", result="reused") == reused + 1
@@ -0,0 +1,31 @@
+from odds_parser import extract_page, parse_tanpuku
+
+TANPUKU_HTML = """
+<table class="basic narrow-xy tanpuku"><tbody>
+<tr><td class="waku">1</td><td class="num">1</td><td class="odds_tan">1,234.5</td>
+<td class="odds_fuku"><span class="min">101.2</span>-<span class="max">150.0</span></td></tr>
+<tr><td class="waku">1</td><td class="num">2</td><td class="odds_tan">3.4</td>
+<td class="place"><span class="min">1.1</span>-<span class="max">1.5</span></td></tr>
+<tr><td class="waku">2</td><td class="num">3</td><td class="odds_tan">取消</td><td>---</td></tr>
+<tr><td class="waku">2</td><td class="num">-</td><td class="odds_tan">9.9</td></tr>
+</tbody></table>
+"""
+
+
+def test_parse_tanpuku_reads_win_and_place_from_one_parse():
+    tansho, fukusho = parse_tanpuku(TANPUKU_HTML)
+    assert tansho == {1: 1234.5, 2: 3.4}
+    # クラス名で見つからない複勝のtdは単勝の次のtdを使う
+    assert fukusho == {1: 101.2, 2: 1.1}
+
+
+def test_parse_tanpuku_without_table_returns_none():
+    assert parse_tanpuku("<html><body><p>発売前</p></body></html>") is None
+
+
+def test_extract_page_matches_parse_tanpuku(pages):
+    tansho, fukusho = parse_tanpuku(pages["tanpuku"])
+    extracted = extract_page("tanpuku", pages["tanpuku"])
+    assert dict(extracted["tansho"]) == tansho
+    assert dict(extracted["fukusho"]) == fukusho
+    assert len(tansho) == len(fukusho) == 18
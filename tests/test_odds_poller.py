@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from fixtures import DEFAULT_RACE_ID
+from odds_poller import OddsPoller, diff_odds, diff_snapshots, poll_interval
+from odds_store import OddsStore
+from odds_table import OddsTable
+
+
+@pytest.mark.parametrize(
+    "seconds_to_post, expected",
+    [(7200, 300.0), (3600, 300.0), (3599, 120.0), (900, 60.0), (300, 20.0), (179, 10.0), (-60, 10.0)],
+)
+def test_poll_interval_shortens_towards_post_time(seconds_to_post, expected):
+    assert poll_interval(seconds_to_post) == expected
+
+
+def test_diff_odds_reports_changed_added_and_removed_keys():
+    previous = {1: 2.5, 2: 3.0, 3: 9.9}
+    current = {1: 2.5, 2: 3.2, 4: 15.0}
+    assert diff_odds(previous, current) == {2: 3.2, 4: 15.0, 3: None}
+    assert diff_odds(current, dict(current)) == {}
+
+
+def test_diff_odds_on_tables_matches_the_dict_diff():
+    rng = np.random.default_rng(1)
+    keys = [f"{a:02d},{b:02d}" for a in range(1, 19) for b in range(a + 1, 19)]
+    previous = {key: round(float(value), 1) for key, value in zip(keys, rng.uniform(2, 500, len(keys)))}
+    current = dict(previous)
+    for key in rng.choice(keys, 10, replace=False):
+        current[key] = round(current[key] + 0.1, 1)
+    del current[keys[0]]
+    current.pop(keys[-1])
+
+    changes = diff_odds(OddsTable.from_dict("umaren", previous), OddsTable.from_dict("umaren", current))
+    assert changes == diff_odds(previous, current)
+    assert len(changes) == 12
+
+
+def test_diff_snapshots_skips_unchanged_bet_types():
+    previous = {"tansho": {1: 2.5}, "fukusho": {1: 1.2}}
+    current = {"tansho": {1: 2.4}, "fukusho": {1: 1.2}}
+    assert diff_snapshots(previous, current) == {"tansho": {1: 2.4}}
+    # 最初の取得は全体が変化分になる
+    assert diff_snapshots({}, current) == current
+
+
+def test_poller_emits_only_changes_until_after_post_time():
+    snapshots = [{"tansho": {1: 2.5, 2: 3.0}}] * 2 + [{"tansho": {1: 2.4, 2: 3.0}}]
+    fetches = []
+    events = []
+
+    async def fetch(race_id: str) -> dict:
+        fetches.append(race_id)
+        return snapshots[min(len(fetches), len(snapshots)) - 1]
+
+    poller = OddsPoller(
+        on_change=events.append, fetch=fetch, schedule=[(0, 0.01)], jitter=0, stop_after_post=0
+    )
+    poller.track(DEFAULT_RACE_ID, post_time=datetime.now(timezone.utc) + timedelta(seconds=0.1))
+    asyncio.run(asyncio.wait_for(poller.run(), 5))
+
+    assert len(fetches) >= 3
+    assert [event["changes"] for event in events] == [{"tansho": {1: 2.5, 2: 3.0}}, {"tansho": {1: 2.4}}]
+    assert [event["initial"] for event in events] == [True, False]
+    assert poller.latest(DEFAULT_RACE_ID) == snapshots[-1]
+
+
+def test_poller_writes_an_untracked_race_to_the_store(tmp_path):
+    store = OddsStore(tmp_path, flush_interval=None)
+
+    async def fetch(race_id: str) -> dict:
+        return {"tansho": {1: 2.5, 2: 3.0}}
+
+    poller = OddsPoller(on_change=lambda event: None, fetch=fetch, idle_interval=0.01, store=store)
+
+    async def poll_then_untrack() -> None:
+        poller.track(DEFAULT_RACE_ID)
+        task = asyncio.ensure_future(poller.run(forever=True))
+        await asyncio.sleep(0.05)
+        poller.untrack(DEFAULT_RACE_ID)
+        await asyncio.sleep(0.01)
+        # runが続いていても、取得を終えたレースの行は書き込まれている
+        assert not task.done()
+        assert not store.read_race(DEFAULT_RACE_ID).empty
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(poll_then_untrack())
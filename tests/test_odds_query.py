@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from odds_query import OddsQuery, select_odds
+from odds_table import OddsTable
+
+UMAREN = {"01,02": 5.4, "01,05": 12.3, "03,18": 250.1, "05,09": 8.8}
+
+
+def test_select_odds_returns_plain_dicts_for_subsets():
+    odds = {
+        "tansho": {1: 2.5, 5: 4.1, 9: 10.2},
+        "umaren": OddsTable.from_dict("umaren", UMAREN),
+    }
+    selected = select_odds(odds, ["tansho", "umaren"], horses={5})
+    assert selected == {"tansho": {5: 4.1}, "umaren": {"01,05": 12.3, "05,09": 8.8}}
+    assert all(type(values) is dict for values in selected.values())
+    assert select_odds(odds, ["umaren"]) == {"umaren": UMAREN}
+
+
+def _random_table(bet_type: str, seed: int = 1) -> OddsTable:
+    rng = np.random.default_rng(seed)
+    rows = [
+        ((a, b), round(float(rng.uniform(2, 300)), 1))
+        for a in range(1, 19)
+        for b in range(1, 19)
+        if a != b and (bet_type == "umatan" or a < b)
+    ]
+    # 同じオッズの組み合わせも含める
+    rows[5] = (rows[5][0], rows[0][1])
+    return OddsTable.from_rows(bet_type, rows)
+
+
+def _sorted_pairs(table: OddsTable) -> list[tuple[tuple[int, ...], float]]:
+    horses, odds = table.combinations()
+    pairs = [(tuple(h), round(o, 1)) for h, o in zip(horses.tolist(), odds.tolist())]
+    return sorted(pairs, key=lambda pair: pair[1])
+
+
+@pytest.mark.parametrize("k", [0, 1, 2, 10, 153, 500])
+def test_top_matches_a_full_sort(k):
+    table = _random_table("umaren")
+    assert OddsQuery(table).top(k) == _sorted_pairs(table)[:k]
+
+
+@pytest.mark.parametrize("horse", [1, 9, 18])
+def test_containing_matches_a_filtered_sort(horse):
+    table = _random_table("umatan")
+    query = OddsQuery(table)
+    expected = [pair for pair in _sorted_pairs(table) if horse in pair[0]]
+    assert query.containing(horse) == expected
+    assert query.containing(horse, k=3) == expected[:3]
+    # 馬単の1着を固定
+    assert query.containing(horse, position=0) == [pair for pair in expected if pair[0][0] == horse]
+    assert query.containing(19) == []
+
+
+def test_pair_is_unordered_for_umaren():
+    query = OddsQuery.for_odds("umaren", UMAREN)
+    assert query.pair(5, 1) == query.pair(1, 5) == 12.3
+    assert query.pair(2, 5) is None
@@ -0,0 +1,108 @@
+import asyncio
+
+import httpx
+import pytest
+
+from fixtures import DEFAULT_RACE_ID
+from odds_cache import OddsCache
+from odds_server import ODDS_BET_TYPES, ConcurrencyLimiter, OddsService, ServiceUnavailable, create_app
+
+
+def test_refresh_skips_request_slots_and_fills_cache(monkeypatch):
+    service = OddsService(cache=OddsCache(), max_concurrency=1, max_pending=0)
+    snapshot = {"tansho": {1: 2.5}}
+
+    async def fetch(race_id, bet_types):
+        return snapshot
+
+    monkeypatch.setattr(service, "_fetch", fetch)
+
+    async def refresh_while_busy() -> dict:
+        # APIの取得で実行枠が全て埋まっていても配信の取得は待たない
+        async with service.limiter.slot():
+            return await asyncio.wait_for(service.refresh(DEFAULT_RACE_ID, ODDS_BET_TYPES), 1)
+
+    assert asyncio.run(refresh_while_busy()) == snapshot
+    assert service.cache.get(DEFAULT_RACE_ID, ODDS_BET_TYPES) == snapshot
+
+
+def _blocking_service(monkeypatch, **options) -> tuple[OddsService, asyncio.Event]:
+    """
+    取得がreleaseされるまで終わらないOddsService。
+    """
+    service = OddsService(cache=OddsCache(), **options)
+    release = asyncio.Event()
+
+    async def fetch(race_id, bet_types):
+        await release.wait()
+        return {"tansho": {1: 2.5}}
+
+    monkeypatch.setattr(service, "_fetch", fetch)
+    return service, release
+
+
+def test_limiter_rejects_with_429_when_the_queue_is_full():
+    limiter = ConcurrencyLimiter(max_concurrency=1, max_pending=1, queue_timeout=5)
+
+    async def scenario() -> None:
+        async with limiter.slot():
+            waiting = asyncio.ensure_future(limiter.slot().__aenter__())
+            await asyncio.sleep(0)
+            assert limiter.pending == 1
+            with pytest.raises(ServiceUnavailable) as error:
+                async with limiter.slot():
+                    pass
+            assert error.value.status_code == 429
+            waiting.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_limiter_rejects_with_503_after_queue_timeout():
+    limiter = ConcurrencyLimiter(max_concurrency=1, max_pending=4, queue_timeout=0.05)
+
+    async def scenario() -> None:
+        async with limiter.slot():
+            with pytest.raises(ServiceUnavailable) as error:
+                async with limiter.slot():
+                    pass
+        assert error.value.status_code == 503
+        assert limiter.pending == 0 and limiter.active == 0
+        # 待ち時間を超えた後も枠は使える
+        async with limiter.slot():
+            assert limiter.active == 1
+
+    asyncio.run(scenario())
+
+
+def test_get_odds_times_out_with_504_but_keeps_fetching(monkeypatch):
+    service, release = _blocking_service(monkeypatch, timeout=0.05)
+
+    async def scenario() -> None:
+        with pytest.raises(asyncio.TimeoutError):
+            await service.get_odds(DEFAULT_RACE_ID)
+        release.set()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    # 取得は続けられ、結果はキャッシュに保存されている
+    assert service.cache.get(DEFAULT_RACE_ID, ODDS_BET_TYPES) == {"tansho": {1: 2.5}}
+
+
+def test_odds_endpoint_maps_overload_to_status_codes(monkeypatch):
+    service, release = _blocking_service(monkeypatch, max_concurrency=1, max_pending=0, timeout=0.2)
+
+    async def scenario() -> list[int]:
+        app = create_app(service)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # 1つ目が実行枠を使っている間、待ち行列のない2つ目は429
+            first = asyncio.ensure_future(client.get("/api/odds", params={"race_id": DEFAULT_RACE_ID}))
+            await asyncio.sleep(0.05)
+            second = await client.get("/api/odds", params={"race_id": "202505010412"})
+            statuses = [(await first).status_code, second.status_code]
+            release.set()
+            third = await client.get("/api/odds", params={"race_id": DEFAULT_RACE_ID})
+            return [*statuses, third.status_code, second.headers.get("retry-after")]
+
+    assert asyncio.run(scenario()) == [504, 429, 200, "1"]
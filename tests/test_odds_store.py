@@ -0,0 +1,58 @@
+import pytest
+
+import odds_store
+from fixtures import DEFAULT_RACE_ID
+from odds_store import OddsStore
+from odds_table import OddsTable
+
+TIMESTAMP = 1_746_320_400.0  # 2025-05-04 10:00 JST
+
+
+def _snapshot(tansho: float) -> dict:
+    return {
+        "tansho": {1: tansho, 2: 5.0},
+        "umaren": OddsTable.from_dict("umaren", {"01,02": 8.1, "01,03": 12.0}),
+    }
+
+
+def test_rows_wait_for_flush_rows(tmp_path):
+    store = OddsStore(tmp_path, flush_rows=8, flush_interval=None)
+    assert store.append(DEFAULT_RACE_ID, _snapshot(2.5), TIMESTAMP) == 4
+    assert store.read_race(DEFAULT_RACE_ID).empty
+    store.append(DEFAULT_RACE_ID, _snapshot(2.4), TIMESTAMP + 60)
+    assert len(store.read_race(DEFAULT_RACE_ID)) == 8
+
+
+def test_rows_are_flushed_after_flush_interval(tmp_path, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(odds_store.time, "monotonic", lambda: clock[0])
+    store = OddsStore(tmp_path, flush_interval=300)
+    other_race = DEFAULT_RACE_ID[:-2] + "12"
+    store.append(DEFAULT_RACE_ID, _snapshot(2.5), TIMESTAMP)
+    clock[0] += 299
+    store.append(other_race, _snapshot(2.5), TIMESTAMP)
+    assert store.read_race(DEFAULT_RACE_ID).empty
+    clock[0] += 1
+    # 追記されなくなったレースの行も、他のレースの追記時に書き込まれる
+    store.append(other_race, _snapshot(2.4), TIMESTAMP + 300)
+    assert len(store.read_race(DEFAULT_RACE_ID)) == 4
+    assert store.read_race(other_race).empty
+    store.flush_race(other_race)
+    assert len(store.read_race(other_race)) == 8
+
+
+def test_read_race_and_trajectory_after_compact(tmp_path):
+    store = OddsStore(tmp_path, flush_rows=1)
+    for minute, tansho in enumerate([2.5, 2.4, 2.2]):
+        store.append(DEFAULT_RACE_ID, _snapshot(tansho), TIMESTAMP + 60 * minute)
+    files = store._race_files(DEFAULT_RACE_ID)
+    assert len(files) == 3
+
+    store.compact(DEFAULT_RACE_ID)
+    assert len(store._race_files(DEFAULT_RACE_ID)) == 1
+    history = store.read_race(DEFAULT_RACE_ID, bet_types=["umaren"])
+    assert len(history) == 6 and set(history["bet_type"]) == {"umaren"}
+    trajectory = store.read_trajectory(DEFAULT_RACE_ID, "tansho", 1)
+    assert trajectory["odds"].tolist() == pytest.approx([2.5, 2.4, 2.2])
+    # 馬連は順不同で指定できる
+    assert store.read_trajectory(DEFAULT_RACE_ID, "umaren", 3, 1)["odds"].tolist() == [12.0] * 3
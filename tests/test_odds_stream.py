@@ -0,0 +1,94 @@
+import asyncio
+
+from fixtures import DEFAULT_RACE_ID
+from odds_stream import OddsBroadcaster
+
+
+class _FakePoller:
+    """
+    取得は行わず、テストで設定した最新の取得結果を返すOddsPoller。
+    """
+
+    def __init__(self):
+        self.snapshots: dict[str, dict] = {}
+        self.tracked: list[str] = []
+
+    def track(self, race_id: str) -> None:
+        self.tracked.append(race_id)
+
+    def untrack(self, race_id: str) -> None:
+        self.tracked.remove(race_id)
+
+    def latest(self, race_id: str):
+        return self.snapshots.get(race_id)
+
+
+def _publish(broadcaster: OddsBroadcaster, snapshot: dict, changes: dict) -> None:
+    # OddsPollerと同じく、最新の取得結果を更新してから変化分を通知する
+    broadcaster.poller.snapshots[DEFAULT_RACE_ID] = snapshot
+    broadcaster.publish({"race_id": DEFAULT_RACE_ID, "timestamp": 0.0, "changes": changes})
+
+
+def _next(events) -> dict:
+    return asyncio.wait_for(events.__anext__(), 1)
+
+
+def test_subscribe_sends_latest_snapshot_first():
+    poller = _FakePoller()
+    poller.snapshots[DEFAULT_RACE_ID] = {"tansho": {1: 2.5, 2: 3.0}}
+    broadcaster = OddsBroadcaster(poller)
+
+    async def scenario() -> None:
+        async with broadcaster.subscribe(DEFAULT_RACE_ID) as events:
+            assert poller.tracked == [DEFAULT_RACE_ID]
+            event = await _next(events)
+            assert event["type"] == "snapshot"
+            assert event["odds"] == {"tansho": {1: 2.5, 2: 3.0}}
+            _publish(broadcaster, {"tansho": {1: 2.4, 2: 3.0}}, {"tansho": {1: 2.4}})
+            event = await _next(events)
+            assert event["type"] == "delta"
+            assert event["odds"] == {"tansho": {1: 2.4}}
+        assert poller.tracked == []
+
+    asyncio.run(scenario())
+
+
+def test_subscribe_before_first_fetch_waits_for_full_snapshot():
+    poller = _FakePoller()
+    broadcaster = OddsBroadcaster(poller)
+
+    async def scenario() -> None:
+        async with broadcaster.subscribe(DEFAULT_RACE_ID) as first:
+            async with broadcaster.subscribe(DEFAULT_RACE_ID) as second:
+                next_event = asyncio.ensure_future(_next(second))
+                await asyncio.sleep(0)
+                assert not next_event.done()
+                # 変化分が一部でも、最初のイベントは取得結果の全体になる
+                _publish(broadcaster, {"tansho": {1: 2.5, 2: 3.0}}, {"tansho": {1: 2.5}})
+                for event in (await next_event, await _next(first)):
+                    assert event["type"] == "snapshot"
+                    assert event["odds"] == {"tansho": {1: 2.5, 2: 3.0}}
+        assert poller.tracked == []
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_drops_deltas_and_gets_snapshot():
+    poller = _FakePoller()
+    poller.snapshots[DEFAULT_RACE_ID] = {"tansho": {1: 2.5}}
+    broadcaster = OddsBroadcaster(poller, max_queue=2)
+
+    async def scenario() -> None:
+        async with broadcaster.subscribe(DEFAULT_RACE_ID) as events:
+            # 最初の全体と1つ目の変化分で行列が一杯になり、2つ目の変化分で溢れる
+            for odds in (2.4, 2.3):
+                _publish(broadcaster, {"tansho": {1: odds}}, {"tansho": {1: odds}})
+            _publish(broadcaster, {"tansho": {1: 2.2}}, {"tansho": {1: 2.2}})
+            event = await _next(events)
+            assert event["type"] == "snapshot"
+            assert event["odds"] == {"tansho": {1: 2.2}}
+            _publish(broadcaster, {"tansho": {1: 2.1}}, {"tansho": {1: 2.1}})
+            event = await _next(events)
+            assert event["type"] == "delta"
+
+    asyncio.run(scenario())
@@ -0,0 +1,22 @@
+from collections.abc import ItemsView
+
+from odds_stream import to_jsonable
+from odds_table import OddsTable
+
+UMAREN = {"01,02": 5.4, "01,05": 12.3, "03,18": 250.1}
+
+
+def test_items_is_a_view_matching_the_dict():
+    table = OddsTable.from_dict("umaren", UMAREN)
+    items = table.items()
+    assert isinstance(items, ItemsView)
+    assert len(items) == len(UMAREN)
+    assert ("01,05", 12.3) in items
+    assert ("01,05", 1.0) not in items
+    assert list(items) == list(UMAREN.items())
+
+
+def test_to_dict_and_to_jsonable_match_dict_conversion():
+    table = OddsTable.from_dict("umaren", UMAREN)
+    assert table.to_dict() == dict(table) == UMAREN
+    assert to_jsonable({"umaren": table, "tansho": {1: 2.5}}) == {"umaren": UMAREN, "tansho": {1: 2.5}}